@@ -1,41 +1,133 @@
-import json
+#!/usr/bin/env python3
+"""
+Training Data Augmentation
+- Every settled WIN in the trade journal gets a mirrored LOSS (direction
+  flipped), written to a separate derived partition (AUGMENTED_DIR, itself a
+  TradeJournal). The trade journal is never touched.
+- Keyed by source record number: sources.u32 holds the source id of every
+  derived record, so a record is mirrored at most once and re-runs are no-ops.
+  Ids are written ahead of their records and trimmed back on the next run if a
+  crash left them without records.
+- Incremental: a cursor remembers how far the journal was scanned; each run
+  streams only records appended since then, in chunks.
+"""
+
 import os
+import json
+import shutil
+import fcntl
+from array import array
+from contextlib import contextmanager
+
+from trade_journal import TradeJournal, JOURNAL_DIR
+
+AUGMENTED_DIR = os.path.join(JOURNAL_DIR, "augmented")
+SOURCES_NAME = "sources.u32"
+STATE_NAME = "augment_state.json"
+CHUNK = 10000
+
+
+def mirrorable(rec: dict) -> bool:
+    return rec.get("type") == "SETTLED" and rec.get("result") == "WIN" and rec.get("direction") in ("UP", "DOWN")
+
+
+def mirror(rec: dict) -> dict:
+    """The counter-factual LOSS of a winning trade"""
+    loss_rec = rec.copy()
+    # Flip direction
+    loss_rec["direction"] = "DOWN" if rec["direction"] == "UP" else "UP"
+    loss_rec["result"] = "LOSS"
+    loss_rec["pnl"] = -1.0 # Dummy loss
+    return loss_rec
+
+
+@contextmanager
+def _run_lock(path: str):
+    """One augmentation run at a time (bot retrainer, CLI)"""
+    with open(os.path.join(path, ".augment.lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _load_ids(path: str, count: int) -> array:
+    """Source ids of the derived records; ids written ahead of a crashed append are dropped"""
+    ids = array('I')
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            ids.frombytes(f.read(os.path.getsize(path) // ids.itemsize * ids.itemsize))
+    if len(ids) > count:
+        del ids[count:]
+        with open(path, "r+b") as f:
+            f.truncate(count * ids.itemsize)
+    elif len(ids) < count:
+        raise ValueError(f"{path}: {count} derived records but only {len(ids)} source ids")
+    return ids
+
+
+def _load_state(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(path: str, state: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def augment(journal: TradeJournal = None, path: str = AUGMENTED_DIR) -> int:
+    """Mirror WINs appended since the last run into the derived partition. Returns records added."""
+    journal = journal or TradeJournal()
+    os.makedirs(path, exist_ok=True)
+    with _run_lock(path):
+        state_file = os.path.join(path, STATE_NAME)
+        state = _load_state(state_file)
+        source = os.stat(journal.data_file).st_ino
+        if state and (state.get("source") != source or state.get("cursor", 0) > len(journal)):
+            # Journal was replaced (e.g. re-migrated): record numbers mean something else now
+            print("Trade journal was replaced, rebuilding the augmented partition")
+            for name in os.listdir(path):
+                if not name.startswith(".augment"):
+                    full = os.path.join(path, name)
+                    shutil.rmtree(full) if os.path.isdir(full) else os.remove(full)
+            state = {}
+
+        derived = TradeJournal(path)
+        ids_file = os.path.join(path, SOURCES_NAME)
+        done = set(_load_ids(ids_file, len(derived)))
+        cursor = state.get("cursor", 0)
+        added = 0
+        while True:
+            records, next_cursor = journal.read_from(cursor, CHUNK)
+            if not records: break
+            batch_ids = array('I')
+            batch = []
+            for recno, rec in enumerate(records, start=cursor):
+                if recno in done or not mirrorable(rec): continue
+                batch_ids.append(recno)
+                batch.append(mirror(rec))
+            if batch:
+                # Ids first (durably), then the records: a crash in between is trimmed by _load_ids
+                with open(ids_file, "ab") as f:
+                    f.write(batch_ids.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                derived.extend(batch)
+                done.update(batch_ids)
+                added += len(batch)
+            cursor = next_cursor
+            _save_state(state_file, {"source": source, "cursor": cursor})
+        derived.close()
 
-FILE = "polymarket-bot/paper_trades.jsonl"
-TEMP_FILE = "polymarket-bot/paper_trades_augmented.jsonl"
-
-def augment():
-    if not os.path.exists(FILE): return
-    
-    new_records = []
-    with open(FILE, "r") as f:
-        for line in f:
-            try:
-                rec = json.loads(line)
-                # Only process synthetic historical WINs
-                if rec.get("type") == "SETTLED" and rec.get("result") == "WIN":
-                    # Add the original WIN record
-                    new_records.append(rec)
-                    
-                    # Create the counter-factual LOSS record
-                    loss_rec = rec.copy()
-                    # Flip direction
-                    loss_rec["direction"] = "DOWN" if rec["direction"] == "UP" else "UP"
-                    loss_rec["result"] = "LOSS"
-                    loss_rec["pnl"] = -1.0 # Dummy loss
-                    
-                    new_records.append(loss_rec)
-                else:
-                    # Keep other real trades as is
-                    new_records.append(rec)
-            except: pass
-            
-    # Save back
-    with open(FILE, "w") as f:
-        for r in new_records:
-            f.write(json.dumps(r) + "\n")
-            
-    print(f"Data Augmented: {len(new_records)} records (Balanced Win/Loss)")
+    print(f"Data Augmented: +{added} records ({len(done)} mirrored in total, journal scanned to #{cursor})")
+    return added
 
 if __name__ == "__main__":
     augment()
@@ -6,28 +6,22 @@ Auto-Redeemer Daemon
 """
 
 import time
-import json
 import subprocess
-import os
 from datetime import datetime, timezone
 
-LOG_FILE = "polymarket-bot/paper_trades.jsonl"
+from trade_journal import TradeJournal
+
 REDEEM_SCRIPT = "polymarket-bot/redeem_ctf.py"
 
-def get_recent_wins():
+def get_recent_wins(journal: TradeJournal):
     wins = []
-    if not os.path.exists(LOG_FILE): return []
     
-    # Simple logic: Read last 20 lines
+    # Simple logic: last 20 settlements (index lookup)
     try:
-        with open(LOG_FILE, "r") as f:
-            lines = f.readlines()[-20:]
-            
-        for line in lines:
+        for t in journal.query(types="SETTLED", last=20):
             try:
-                t = json.loads(line)
                 # Look for SETTLED & WIN
-                if t.get("type") == "SETTLED" and t.get("result") == "WIN":
+                if t.get("result") == "WIN":
                     cid = t.get("condition_id")
                     if cid and cid not in wins:
                         wins.append(cid)
@@ -39,9 +33,10 @@ def run_loop():
     print("💰 Auto-Redeemer started...")
     # Keep track of redeemed IDs to avoid spamming
     redeemed = set()
+    journal = TradeJournal()
     
     while True:
-        wins = get_recent_wins()
+        wins = get_recent_wins(journal)
         for cid in wins:
             if cid not in redeemed:
                 print(f"🎉 Found new WIN! Condition: {cid}")
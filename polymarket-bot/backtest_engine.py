@@ -1,40 +1,77 @@
 #!/usr/bin/env python3
 """
-Simple Backtest Replay Engine
-- Replays 'paper_trades.jsonl'
-- Allows testing "What if Stop Loss was X%?"
+Backtest Engine
+- Trade replay: re-scores the trade journal (sample_trades.json in CI) under a
+  different Stop Loss. Losses deeper than the stop are capped at it.
+- Tick replay: loads recorded Binance prices + Polymarket top-of-book per market
+  into (markets x seconds) NumPy arrays and evaluates the ProbabilityStrategy
+  rules (fair value, dynamic fee, edge, safety margin, OBI filter, opening
+  cooldown, stop-loss, re-entry cooldown) for every timestep of every market
+  at once, for each parameter combination of a grid.
+
+Tick data: one .npz per market cycle in TICKS_DIR with
+    meta      [start_ts, end_ts, strike, final_price]
+    btc_ts, btc_px                      Binance trades
+    up_ts, up_bid, up_ask               UP token top of book
+    down_ts, down_bid, down_ask         DOWN token top of book
+    obi_ts, obi                         (optional) Binance depth imbalance
+
+Usage:
+    python3 backtest_engine.py [stop_loss]          # trade replay
+    python3 backtest_engine.py --ticks [DIR]        # tick replay + parameter grid
 """
 
 import json
 import sys
 import os
+import glob
+import time
+import itertools
+
+from trade_journal import TradeJournal, JOURNAL_DIR
 
-LOG_FILE = "polymarket-bot/paper_trades.jsonl"
 SAMPLE_FILE = "polymarket-bot/sample_trades.json" # Fallback for CI
+TICKS_DIR = "polymarket-bot/data/ticks"
+CONFIG_FILE = "polymarket-bot/config.json"
+
+# Mirrors PolymarketBotV3 (evaluate_market / check_stop_loss / execute_trade)
+OPENING_COOLDOWN_SEC = 15
+CLOSE_BUFFER_SEC = 30
+ENTRY_COOLDOWN_SEC = 10
+
+DEFAULT_PARAMS = {
+    "stop_loss_pct": 0.35,
+    "min_edge": 0.08,
+    "safety_margin_pct": 0.0006,
+    "obi_threshold": 1.5,
+    "volatility_per_min": 25.0,
+}
+
+DEFAULT_GRID = {
+    "stop_loss_pct": [0.2, 0.35, 0.5],
+    "min_edge": [0.05, 0.08, 0.12],
+    "safety_margin_pct": [0.0003, 0.0006, 0.001],
+    "obi_threshold": [1.2, 1.5, 2.0],
+    "volatility_per_min": [20.0, 25.0, 30.0],
+}
 
 def load_trades():
-    if os.path.exists(LOG_FILE):
-        file_to_read = LOG_FILE
+    if os.path.exists(os.path.join(JOURNAL_DIR, "trades.dat")):
+        return TradeJournal().records()
     elif os.path.exists(SAMPLE_FILE):
         print("⚠️ 使用测试数据运行回测...")
-        file_to_read = SAMPLE_FILE
-        # Test data format might be slightly different (list of dicts vs jsonl)
-        with open(file_to_read, "r") as f:
+        # Test data is a plain JSON list of trade dicts
+        with open(SAMPLE_FILE, "r") as f:
             return json.load(f)
     else:
         return []
 
-    trades = []
-    with open(file_to_read, "r") as f:
-        for line in f:
-            try: trades.append(json.loads(line))
-            except: pass
-    return trades
-
 def replay_trades(target_sl_pct=0.35):
     """
     Replay trades and check if a tighter/looser Stop Loss
     would have changed the outcome.
+    Without price paths the only safe assumption is that a loss deeper than
+    the stop would have been cut at the stop; use the tick replay for the rest.
     """
     trades = load_trades()
     if not trades:
@@ -42,24 +79,228 @@ def replay_trades(target_sl_pct=0.35):
         return
 
     print(f"🔄 回测模拟: Stop Loss = {target_sl_pct*100}%")
-    
+
     wins = 0
     losses = 0
     sim_pnl = 0.0
-    
+    capped = 0
+
     for t in trades:
         if "pnl" not in t: continue
-        
+
         real_pnl = float(t["pnl"])
-        
+        if real_pnl < -target_sl_pct:
+            real_pnl = -target_sl_pct
+            capped += 1
+
         sim_pnl += real_pnl
         if real_pnl > 0: wins += 1
         else: losses += 1
-            
-    print(f"📊 模拟结果: Win Rate {wins/(wins+losses):.1%} | PnL {sim_pnl:.2f} R")
+
+    if wins + losses == 0:
+        print("无已平仓交易。")
+        return
+
+    print(f"📊 模拟结果: Win Rate {wins/(wins+losses):.1%} | PnL {sim_pnl:.2f} R | 止损截断 {capped} 笔")
+
+# --- Tick replay ---
+
+def _ffill(ts, values, grid):
+    """Value in effect at each grid time (last observation carried forward), NaN before the first"""
+    import numpy as np
+    out = np.full(grid.shape, np.nan)
+    if len(ts) == 0: return out
+    order = np.argsort(ts, kind="stable")
+    ts, values = np.asarray(ts)[order], np.asarray(values, dtype=float)[order]
+    idx = np.searchsorted(ts, grid, side="right") - 1
+    ok = idx >= 0
+    out[ok] = values[idx[ok]]
+    return out
+
+def load_ticks(path=TICKS_DIR, step=1.0):
+    """
+    Resample every market in `path` onto a common per-second grid.
+    Returns a dict of (M, T) arrays plus per-market strike / winner.
+    """
+    import numpy as np
+    files = sorted(glob.glob(os.path.join(path, "*.npz")))
+    if not files: return None
+
+    raw = [np.load(f) for f in files]
+    length = max(float(r["meta"][1] - r["meta"][0]) for r in raw)
+    offsets = np.arange(0.0, length, step)
+    M, T = len(raw), len(offsets)
+
+    data = {k: np.full((M, T), np.nan) for k in ("btc", "up_bid", "up_ask", "down_bid", "down_ask")}
+    data["obi"] = np.ones((M, T))
+    strike, up_won, start, end = (np.zeros(M) for _ in range(4))
+    for m, r in enumerate(raw):
+        start[m], end[m], strike[m], final = (float(x) for x in r["meta"])
+        up_won[m] = final >= strike[m]
+        grid = start[m] + offsets
+        data["btc"][m] = _ffill(r["btc_ts"], r["btc_px"], grid)
+        for side in ("up", "down"):
+            data[f"{side}_bid"][m] = _ffill(r[f"{side}_ts"], r[f"{side}_bid"], grid)
+            data[f"{side}_ask"][m] = _ffill(r[f"{side}_ts"], r[f"{side}_ask"], grid)
+        if "obi" in r.files:
+            obi = _ffill(r["obi_ts"], r["obi"], grid)
+            data["obi"][m] = np.where(np.isnan(obi), 1.0, obi) # Neutral when unknown
+
+    remaining = end[:, None] - (start[:, None] + offsets[None, :])
+    data.update(
+        offsets=offsets,
+        strike=strike,
+        up_won=up_won.astype(bool),
+        minutes_left=remaining / 60.0,
+        # Stop-loss checks run while the market is active, entries only after the opening cooldown
+        active=(remaining > CLOSE_BUFFER_SEC) & ~np.isnan(data["btc"]) & ~np.isnan(data["up_ask"]) & ~np.isnan(data["down_ask"]),
+        opened=offsets[None, :] >= OPENING_COOLDOWN_SEC,
+        step=step,
+        files=files,
+    )
+    # Dynamic fee (Market15m.dynamic_fee): UP spread relative to the ask
+    up_ask = data["up_ask"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fee = np.clip((up_ask - data["up_bid"]) / up_ask, 0.001, 0.05)
+    data["fee"] = np.where(up_ask > 0, fee, 0.03)
+    # |BTC - strike| / strike, compared against safety_margin_pct
+    data["margin"] = np.abs(data["btc"] - strike[:, None]) / strike[:, None]
+    return data
+
+def prob_up(data, volatility_per_min):
+    """ProbabilityStrategy.calculate_prob_up for every cell"""
+    import numpy as np
+    from scipy.special import ndtr
+    t = np.maximum(data["minutes_left"], 0.0)
+    sigma = volatility_per_min * np.sqrt(t)
+    diff = data["btc"] - data["strike"][:, None]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = diff / sigma
+    p = ndtr(z)
+    return np.where(sigma > 0, p, (diff >= 0).astype(float))
+
+def edges(data, volatility_per_min):
+    """Edge of buying UP / DOWN at the ask after the dynamic fee (depends only on volatility)"""
+    probs = prob_up(data, volatility_per_min)
+    return probs - data["up_ask"] - data["fee"], (1.0 - probs) - data["down_ask"] - data["fee"]
+
+def simulate(data, params, edge_arrays=None, max_entries=3):
+    """
+    Trade every market under one parameter set. A market can be re-entered after
+    a stop-out (entry cooldown permitting), like the live bot; `max_entries`
+    bounds the number of such rounds.
+    """
+    import numpy as np
+    M, T = data["btc"].shape
+    edge_up, edge_down = edge_arrays or edges(data, params["volatility_per_min"])
+    th, edge = params["obi_threshold"], params["min_edge"]
+
+    up_ask, down_ask, obi = data["up_ask"], data["down_ask"], data["obi"]
+    with np.errstate(invalid="ignore"):
+        can_enter = data["active"] & data["opened"] & (data["margin"] >= params["safety_margin_pct"])
+        # UP needs edge + OBI > 1/threshold; DOWN is only considered when UP has no edge
+        up_sig = can_enter & (edge_up > edge) & (obi > 1.0 / th)
+        down_sig = can_enter & ~(edge_up > edge) & (edge_down > edge) & (obi < th)
+    signal = up_sig | down_sig
+
+    idx = np.arange(T)
+    cooldown = int(round(ENTRY_COOLDOWN_SEC / data["step"]))
+    avail = np.zeros(M, dtype=np.int64)  # First timestep a new entry is allowed
+    pnls, stopped = [], 0
+    for _ in range(max_entries):
+        cand = signal & (idx[None, :] >= avail[:, None])
+        has = cand.any(axis=1)
+        if not has.any(): break
+        m = np.nonzero(has)[0]
+        entry = cand[m].argmax(axis=1)
+        is_up = up_sig[m, entry]
+        price = np.clip(np.where(is_up, up_ask[m, entry], down_ask[m, entry]), 0.01, 0.99)
+
+        # Stop-loss path: same side's ask after the entry, while the market is active
+        cur = np.where(is_up[:, None], up_ask[m], down_ask[m])
+        with np.errstate(invalid="ignore"):
+            hit_mask = ((cur - price[:, None]) / price[:, None] < -params["stop_loss_pct"]) \
+                & (idx[None, :] > entry[:, None]) & data["active"][m]
+        hit = hit_mask.any(axis=1)
+        exit_at = hit_mask.argmax(axis=1)
+        exit_px = cur[np.arange(len(m)), exit_at]
+
+        payout = (is_up == data["up_won"][m]).astype(float)
+        pnl = np.where(hit, (exit_px - price) / price, (payout - price) / price)
+        pnls.append(pnl)
+        stopped += int(hit.sum())
+
+        avail[:] = T
+        avail[m[hit]] = np.maximum(exit_at[hit] + 1, entry[hit] + cooldown)
+
+    pnl = np.concatenate(pnls) if pnls else np.zeros(0)
+    wins = pnl[pnl > 0]
+    losses = pnl[pnl <= 0]
+    gross_loss = -losses.sum()
+    return {
+        **params,
+        "trades": int(len(pnl)),
+        "win_rate": float(len(wins) / len(pnl)) if len(pnl) else 0.0,
+        "pnl": float(pnl.sum()),
+        "profit_factor": float(wins.sum() / gross_loss) if gross_loss > 0 else float('inf'),
+        "stop_outs": stopped,
+    }
+
+def run_grid(data, grid=None, base=None):
+    """Simulate every combination of `grid` (edges cached per volatility)"""
+    grid = grid or DEFAULT_GRID
+    base = {**DEFAULT_PARAMS, **(base or {})}
+    keys = list(grid)
+    cache = {}
+    results = []
+    for combo in itertools.product(*(grid[k] for k in keys)):
+        params = {**base, **dict(zip(keys, combo))}
+        vol = params["volatility_per_min"]
+        if vol not in cache: cache[vol] = edges(data, vol)
+        results.append(simulate(data, params, cache[vol]))
+    return results
+
+def current_params():
+    params = dict(DEFAULT_PARAMS)
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, "r") as f:
+            conf = json.load(f)
+        params.update({k: conf[k] for k in DEFAULT_PARAMS if k in conf})
+    return params
+
+def replay_ticks(path=TICKS_DIR, top=10):
+    t0 = time.perf_counter()
+    data = load_ticks(path)
+    if data is None:
+        print(f"无 tick 数据: {path}")
+        return
+    M, T = data["btc"].shape
+    t1 = time.perf_counter()
+    print(f"📥 已加载 {M} 个市场 x {T} 个时间步 ({t1 - t0:.2f}s)")
+
+    results = run_grid(data)
+    current = simulate(data, current_params())
+    t2 = time.perf_counter()
+    print(f"⚡ {len(results)} 组参数回测完成 ({t2 - t1:.2f}s)\n")
+
+    cols = ("stop_loss_pct", "min_edge", "safety_margin_pct", "obi_threshold", "volatility_per_min")
+    header = "  ".join(f"{c[:10]:>10}" for c in cols) + f"  {'trades':>6}  {'win%':>6}  {'PF':>6}  {'SL':>4}  {'PnL (R)':>8}"
+    def row(r):
+        pf = f"{r['profit_factor']:.2f}" if r["profit_factor"] != float('inf') else "inf"
+        return "  ".join(f"{r[c]:>10g}" for c in cols) + \
+            f"  {r['trades']:>6}  {r['win_rate']:>6.1%}  {pf:>6}  {r['stop_outs']:>4}  {r['pnl']:>+8.2f}"
+
+    print(header)
+    for r in sorted(results, key=lambda r: r["pnl"], reverse=True)[:top]:
+        print(row(r))
+    print("-" * len(header))
+    print(row(current) + "  <- 当前配置")
 
 if __name__ == "__main__":
-    sl = 0.35
-    if len(sys.argv) > 1:
-        sl = float(sys.argv[1])
-    replay_trades(sl)
+    if len(sys.argv) > 1 and sys.argv[1] == "--ticks":
+        replay_ticks(sys.argv[2] if len(sys.argv) > 2 else TICKS_DIR)
+    else:
+        sl = 0.35
+        if len(sys.argv) > 1:
+            sl = float(sys.argv[1])
+        replay_trades(sl)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Binance Streaming Feed
+- Subscribes to the combined trade + bookTicker websocket streams for one symbol.
+- Keeps the latest price in a single tuple that is swapped on every tick, so the
+  decision loop reads it without locks or network I/O.
+- Falls back to a REST call (off the event loop) only when the stream goes stale.
+- BinanceDepthBook keeps a local order book from the diff-depth stream and
+  maintains notional-weighted Order Book Imbalance for fixed depth bands.
+"""
+
+import json
+import time
+import asyncio
+import logging
+from typing import Optional, Callable, Iterable
+
+import requests
+import websockets
+
+from l2_book import BookSide
+
+logger = logging.getLogger(__name__)
+
+BINANCE_WS = "wss://stream.binance.com:9443/stream"
+BINANCE_WS_RAW = "wss://stream.binance.com:9443/ws"
+BINANCE_REST = "https://api.binance.com/api/v3"
+
+
+class BinancePriceFeed:
+    """Live 'latest price + timestamp' snapshot fed by the Binance websocket"""
+
+    def __init__(self, symbol: str = "BTCUSDT", fallback: Optional[Callable[[], Optional[float]]] = None):
+        self.symbol = symbol.upper()
+        self.fallback = fallback  # Blocking REST getter, only used when stale
+        self.running = False
+        self.connected = False
+
+        # (price, local receive time, exchange trade time ms)
+        # Replaced as a whole on every trade -> readers always see a consistent pair
+        self.snapshot = (None, 0.0, 0)
+        # (best bid, best ask, local receive time)
+        self.quote = (None, None, 0.0)
+        # Callbacks fired on every trade tick (e.g. to mark a market dirty)
+        self.listeners = []
+        # Pending boundary captures: [(boundary ms, tolerance ms, future)]
+        self.captures = []
+        self.recorder = None # recorder.MarketRecorder: keeps raw messages
+
+    @property
+    def url(self) -> str:
+        s = self.symbol.lower()
+        return f"{BINANCE_WS}?streams={s}@trade/{s}@bookTicker"
+
+    @property
+    def age(self) -> float:
+        """Seconds since the last trade tick"""
+        return time.time() - self.snapshot[1]
+
+    def latest(self, max_age: float = 3.0) -> Optional[float]:
+        """Last traded price if the stream is fresh, else None. No I/O."""
+        price, recv_ts, _ = self.snapshot
+        if price is None or time.time() - recv_ts > max_age:
+            return None
+        return price
+
+    async def get_price(self, max_age: float = 3.0) -> Optional[float]:
+        """Stream price, or a REST lookup in a worker thread if the stream is stale"""
+        price = self.latest(max_age)
+        if price is not None:
+            return price
+        if not self.fallback:
+            return None
+        logger.warning(f"⚠️ Binance 行情流已过期 ({self.age:.1f}s)，回退到 REST")
+        return await asyncio.to_thread(self.fallback)
+
+    def capture_open(self, ts_ms: int, tolerance_ms: int = 2000) -> asyncio.Future:
+        """
+        Future resolved with the first trade price at/after `ts_ms` (the open of the
+        candle starting there). Resolves to None if that trade arrives more than
+        `tolerance_ms` late (e.g. the stream was down at the boundary).
+        """
+        fut = asyncio.get_running_loop().create_future()
+        self.captures.append((ts_ms, tolerance_ms, fut))
+        return fut
+
+    async def run(self):
+        """Connect and keep reconnecting until stopped"""
+        self.running = True
+        backoff = 1
+        while self.running:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, ping_timeout=20) as ws:
+                    self.connected = True
+                    backoff = 1
+                    logger.info(f"📡 Binance 行情流已连接: {self.symbol}")
+                    async for msg in ws:
+                        if not self.running: break
+                        self._on_message(msg)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Binance stream error: {e}")
+            finally:
+                self.connected = False
+
+            if self.running:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _on_message(self, msg):
+        if self.recorder: self.recorder.record("binance_stream", msg, self.symbol)
+        try:
+            payload = json.loads(msg)
+            stream = payload.get("stream", "")
+            data = payload.get("data", {})
+            if stream.endswith("@trade"):
+                self.snapshot = (float(data["p"]), time.time(), int(data["T"]))
+                if self.captures: self._resolve_captures()
+                for cb in self.listeners: cb()
+            elif stream.endswith("@bookTicker"):
+                self.quote = (float(data["b"]), float(data["a"]), time.time())
+        except Exception as e:
+            logger.debug(f"Bad Binance message: {e}")
+
+    def _resolve_captures(self):
+        price, _, trade_ms = self.snapshot
+        pending = []
+        for ts_ms, tolerance_ms, fut in self.captures:
+            if fut.done(): continue
+            if trade_ms < ts_ms:
+                pending.append((ts_ms, tolerance_ms, fut))
+            else:
+                fut.set_result(price if trade_ms - ts_ms <= tolerance_ms else None)
+        self.captures = pending
+
+    def stop(self):
+        self.running = False
+
+
+class BinanceDepthBook:
+    """
+    Local Binance order book fed by <symbol>@depth@100ms.
+
+    Follows Binance's sync procedure (buffer diffs, load a REST snapshot,
+    drop diffs older than lastUpdateId, require contiguous update ids) and
+    resyncs on any gap. For every depth band N it keeps the bid/ask notional
+    of the top N levels: after the O(log n) level lookup, each level change
+    adjusts the band sums in O(1) (the level crossing the band edge is read
+    by index).
+    """
+
+    MAX_LEVELS = 1000        # Trim far levels on recompute
+    RECOMPUTE_EVERY = 20000  # Full recompute of band sums (float drift)
+
+    def __init__(self, symbol: str = "BTCUSDT", bands: Iterable[int] = (5, 10, 20)):
+        self.symbol = symbol.upper()
+        self.bands = tuple(sorted(set(int(b) for b in bands)))
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.bid_notional = {n: 0.0 for n in self.bands}
+        self.ask_notional = {n: 0.0 for n in self.bands}
+        self.last_update_id = 0
+        self.synced = False
+        self.updated_at = 0.0
+        self.running = False
+        self._updates = 0
+        self.recorder = None # recorder.MarketRecorder: keeps raw diffs + snapshots
+
+    @property
+    def url(self) -> str:
+        return f"{BINANCE_WS_RAW}/{self.symbol.lower()}@depth@100ms"
+
+    def obi(self, depth: int = 20, max_age: float = 5.0) -> float:
+        """
+        Order Book Imbalance = bid notional / ask notional over the top `depth` levels.
+        > 1.0 : Buyers stronger, < 1.0 : Sellers stronger, 1.0 when the book is not live.
+        """
+        if not self.synced or time.time() - self.updated_at > max_age:
+            return 1.0 # Neutral when unknown
+        if depth in self.bid_notional:
+            bids, asks = self.bid_notional[depth], self.ask_notional[depth]
+        else:
+            bids, asks = self._band_sum(self.bids, depth), self._band_sum(self.asks, depth)
+        if asks <= 0: return 999.0
+        return bids / asks
+
+    async def run(self):
+        self.running = True
+        backoff = 1
+        while self.running:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, ping_timeout=20) as ws:
+                    backoff = 1
+                    await self._sync(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Binance depth stream error: {e}")
+            self.synced = False
+            if self.running:
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    async def _sync(self, ws):
+        """Buffer diffs while the REST snapshot loads, then apply the live stream"""
+        buffer = []
+        snapshot_task = asyncio.create_task(asyncio.to_thread(self._fetch_snapshot))
+        try:
+            while not snapshot_task.done():
+                try:
+                    msg = await asyncio.wait_for(ws.recv(), 0.5)
+                    if self.recorder: self.recorder.record("binance_depth", msg, self.symbol)
+                    buffer.append(json.loads(msg))
+                except asyncio.TimeoutError:
+                    pass
+            snapshot = snapshot_task.result()
+        finally:
+            if not snapshot_task.done(): snapshot_task.cancel()
+
+        if self.recorder: self.recorder.record("binance_depth_snapshot", json.dumps(snapshot), self.symbol)
+        self._load_snapshot(snapshot)
+        for event in buffer:
+            if not self._apply_event(event):
+                raise RuntimeError("depth gap while replaying buffer")
+        logger.info(f"📚 Binance 深度簿已同步: {self.symbol} (lastUpdateId {self.last_update_id})")
+
+        async for msg in ws:
+            if not self.running: break
+            if self.recorder: self.recorder.record("binance_depth", msg, self.symbol)
+            if not self._apply_event(json.loads(msg)):
+                raise RuntimeError("depth sequence gap, resyncing")
+
+    def _fetch_snapshot(self) -> dict:
+        resp = requests.get(f"{BINANCE_REST}/depth", params={"symbol": self.symbol, "limit": 1000}, timeout=5)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _load_snapshot(self, snapshot: dict):
+        self.bids.load((float(p), float(q)) for p, q in snapshot.get("bids", []))
+        self.asks.load((float(p), float(q)) for p, q in snapshot.get("asks", []))
+        self.last_update_id = int(snapshot["lastUpdateId"])
+        self.synced = False # Until the first bridging diff is applied
+        self._recompute()
+
+    def _apply_event(self, event: dict) -> bool:
+        """Apply one diff. Returns False on a sequence gap."""
+        first, last = int(event["U"]), int(event["u"])
+        if last <= self.last_update_id:
+            return True # Already in the snapshot
+        if self.synced:
+            if first != self.last_update_id + 1: return False
+        elif not (first <= self.last_update_id + 1 <= last):
+            return False
+
+        for p, q in event.get("b", []):
+            self._set_level(self.bids, self.bid_notional, float(p), float(q))
+        for p, q in event.get("a", []):
+            self._set_level(self.asks, self.ask_notional, float(p), float(q))
+
+        self.last_update_id = last
+        self.synced = True
+        self.updated_at = time.time()
+        self._updates += 1
+        if self._updates % self.RECOMPUTE_EVERY == 0:
+            self._recompute()
+        return True
+
+    def _set_level(self, side: BookSide, sums: dict, price: float, qty: float):
+        i, old, shift = side.set(price, qty)
+        for n in self.bands:
+            if i >= n: continue # Level is deeper than this band
+            if shift == 0:
+                sums[n] += price * (qty - old)
+            elif shift > 0:
+                sums[n] += price * qty
+                if len(side) > n: # Level pushed out of the band
+                    sums[n] -= side.price_at(n) * side.sizes[n]
+            else:
+                sums[n] -= price * old
+                if len(side) >= n: # Level pulled into the band
+                    sums[n] += side.price_at(n - 1) * side.sizes[n - 1]
+
+    @staticmethod
+    def _band_sum(side: BookSide, n: int) -> float:
+        return sum(side.price_at(i) * side.sizes[i] for i in range(min(n, len(side))))
+
+    def _recompute(self):
+        for side in (self.bids, self.asks):
+            if len(side) > self.MAX_LEVELS:
+                del side.keys[self.MAX_LEVELS:]
+                del side.sizes[self.MAX_LEVELS:]
+        for n in self.bands:
+            self.bid_notional[n] = self._band_sum(self.bids, n)
+            self.ask_notional[n] = self._band_sum(self.asks, n)
+
+    def stop(self):
+        self.running = False
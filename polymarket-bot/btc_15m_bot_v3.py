@@ -12,59 +12,107 @@ import json
 import time
 import math
 import asyncio
+import signal
 import logging
 from datetime import datetime, timezone, timedelta
-from typing import Optional, Dict, List, Tuple
-from dataclasses import dataclass, field
-import statistics
+from typing import Optional, Dict, Tuple
+from dataclasses import dataclass
 
 import requests
-import websockets
 from dotenv import load_dotenv
 from py_clob_client.client import ClobClient
-from py_clob_client.clob_types import OrderArgs, OrderType
-from py_clob_client.order_builder.constants import BUY
+from py_clob_client.clob_types import OrderType
 
-# Load environment
-load_dotenv()
+from binance_feed import BinancePriceFeed, BinanceDepthBook
+from l2_book import L2Book, verify_summary_hash
+from decision_engine import DecisionTrigger
+from clob_ws import ClobMarketStream
+from trade_journal import TradeJournal
+from journal_writer import JournalWriter
+from perf_stats import PerfStats
+from volatility import VolatilityEngine
+from indicators import IndicatorEngine, features_from
+from model_export import ForestPredictor, FEATURES, EXPORT_FILE, trade_features
+from retrain_service import ModelStore, RetrainService
+from candle_store import CandleStore, sync as sync_candles
+from order_cache import OrderCache
+from order_manager import OrderManager
+from sim_exchange import SimExchange
+from recorder import MarketRecorder, RECORD_DIR
+from position_book import PositionBook
+from market_registry import MarketSpec, REGISTRY, MARKET_PARAMS, enabled_markets, market_config
 
 from logging.handlers import RotatingFileHandler
 
-# Setup logging
-logging.basicConfig(
-    level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO')),
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        RotatingFileHandler('bot.log', maxBytes=5*1024*1024, backupCount=3) # 5MB limit, keep 3 backups
-    ]
-)
 logger = logging.getLogger(__name__)
 
+
+def setup_logging():
+    """Console + bot.log. Called by the entry point only: the retrain pool's spawned worker
+    re-imports this module as __mp_main__ and must not open (and rotate) bot.log too."""
+    logging.basicConfig(
+        level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO')),
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(),
+            RotatingFileHandler('bot.log', maxBytes=5*1024*1024, backupCount=3) # 5MB limit, keep 3 backups
+        ]
+    )
+
 # Constants
 CLOB_HOST = "https://clob.polymarket.com"
 GAMMA_API = "https://gamma-api.polymarket.com"
-WS_URL = "wss://ws-subscriptions-clob.polymarket.com/ws/market"
 CHAIN_ID = 137
 
 @dataclass
 class OrderBook:
-    """Real-time order book"""
+    """Real-time order book (top of book + full L2 depth)"""
     asset_id: str
     best_bid: float = 0.0
     best_ask: float = 1.0
+    depth: L2Book = None
+    needs_resync: bool = False # Set when local depth disagrees with the exchange
+    
+    def __post_init__(self):
+        self.depth = L2Book(self.asset_id)
     
     def update(self, data: dict):
         if data.get("event_type") == "price_change":
             for change in data.get("price_changes", []):
-                if change.get("asset_id") == self.asset_id:
-                    self.best_bid = float(change.get("best_bid", 0) or 0)
-                    self.best_ask = float(change.get("best_ask", 1) or 1)
+                if change.get("asset_id") != self.asset_id: continue
+                if "price" in change and "size" in change:
+                    self.depth.apply_delta(change.get("side") == "BUY", float(change["price"]), float(change["size"]))
+                self._refresh_top()
+                # Exchange also reports its top of book: trust it and flag drift
+                if "best_bid" in change or "best_ask" in change:
+                    bid = float(change.get("best_bid", 0) or 0)
+                    ask = float(change.get("best_ask", 1) or 1)
+                    if self.depth.synced and (abs(bid - self.best_bid) > 1e-9 or abs(ask - self.best_ask) > 1e-9):
+                        self.needs_resync = True
+                    self.best_bid, self.best_ask = bid, ask
         elif data.get("event_type") == "book":
-             bids = data.get("bids", [])
-             asks = data.get("asks", [])
-             if bids: self.best_bid = float(bids[0]["price"])
-             if asks: self.best_ask = float(asks[0]["price"])
+            self.depth.apply_snapshot(data.get("bids", []), data.get("asks", []), data.get("hash"), data.get("timestamp"))
+            self.needs_resync = False
+            self._refresh_top()
+    
+    def load_snapshot(self, raw: dict) -> bool:
+        """Load a REST /book snapshot after checking its hash"""
+        if not verify_summary_hash(raw):
+            logger.warning(f"⚠️ 订单簿快照 hash 校验失败: {self.asset_id[:10]}...")
+            return False
+        self.depth.apply_snapshot(raw.get("bids", []), raw.get("asks", []), raw.get("hash"), raw.get("timestamp"))
+        self.needs_resync = False
+        self._refresh_top()
+        return True
+    
+    def _refresh_top(self):
+        bid, ask = self.depth.best_bid, self.depth.best_ask
+        self.best_bid = bid if bid is not None else 0.0
+        self.best_ask = ask if ask is not None else 1.0
+    
+    def vwap(self, size: float, side: str = "BUY") -> Optional[float]:
+        """Executable average price for `size` shares (None if book too thin)"""
+        return self.depth.vwap(size, side)
 
 @dataclass
 class Market15m:
@@ -80,6 +128,9 @@ class Market15m:
     book_up: OrderBook = None
     book_down: OrderBook = None
     strike_price: Optional[float] = None  # The BTC price at start_time
+    spec: MarketSpec = None               # Asset / horizon this market belongs to
+    prev_trend: float = 0.0               # Previous cycle's move (open -> this strike), ML feature
+    indicators: Optional[Dict[str, float]] = None # Indicator values as of the open (indicators.py), ML features
     
     def __post_init__(self):
         self.book_up = OrderBook(self.token_id_up)
@@ -117,16 +168,48 @@ class Market15m:
     def down_price(self) -> float:
         return self.book_down.best_ask if self.book_down.best_ask > 0 else 0.5
 
+    def fill_price(self, direction: str, shares: float) -> float:
+        """VWAP to buy `shares` of UP/DOWN from the book; top of book if no depth yet, 1.0 if too thin"""
+        book = self.book_up if direction == "UP" else self.book_down
+        if not book.depth.synced:
+            return self.up_price if direction == "UP" else self.down_price
+        vwap = book.vwap(shares, "BUY")
+        return vwap if vwap is not None else 1.0
+
+    def limit_price(self, direction: str, shares: float) -> float:
+        """BUY limit that sweeps `shares` (worst level needed); top of book if no depth yet"""
+        book = self.book_up if direction == "UP" else self.book_down
+        if not book.depth.synced:
+            return self.up_price if direction == "UP" else self.down_price
+        price = book.depth.sweep_price(shares, "BUY")
+        return price if price is not None else 1.0
+
+@dataclass
+class PreparedCycle:
+    """A market resolved ahead of time, with its books already subscribed"""
+    market: Market15m
+    strike: Optional[asyncio.Future] = None # Boundary capture from the price stream
+
+@dataclass
+class MarketContext:
+    """Per-market state for one concurrently traded market (feeds and WS are shared)"""
+    spec: MarketSpec
+    cfg: object                  # Merged parameters, see market_registry.market_config
+    cycle_manager: "MarketCycleManager"
+    strategy: "ProbabilityStrategy"
+    entry_cooldown_until: float = 0.0
+    last_strike: Optional[Tuple[int, float]] = None # (cycle start ts, strike) for prev_trend
+
 class BinanceData:
     """Helper to fetch Binance data"""
     @staticmethod
-    def get_candle_open(timestamp_ms: int) -> Optional[float]:
+    def get_candle_open(timestamp_ms: int, symbol: str = "BTCUSDT") -> Optional[float]:
         """Get the Open price of the candle starting at timestamp"""
         try:
             # Kline interval 1m
             url = "https://api.binance.com/api/v3/klines"
             params = {
-                "symbol": "BTCUSDT",
+                "symbol": symbol,
                 "interval": "1m",
                 "startTime": timestamp_ms,
                 "limit": 1
@@ -144,9 +227,9 @@ class BinanceData:
             return None
 
     @staticmethod
-    def get_current_price() -> Optional[float]:
+    def get_current_price(symbol: str = "BTCUSDT") -> Optional[float]:
         try:
-            resp = requests.get("https://api.binance.com/api/v3/ticker/price?symbol=BTCUSDT", timeout=5)
+            resp = requests.get(f"https://api.binance.com/api/v3/ticker/price?symbol={symbol}", timeout=5)
             return float(resp.json()["price"])
         except:
             return None
@@ -174,24 +257,25 @@ class BinanceData:
             return 1.0 # Neutral on error
 
 class MarketCycleManager:
-    """Manages finding active markets"""
-    def __init__(self):
+    """Manages finding active markets for one asset / horizon"""
+    def __init__(self, spec: MarketSpec = None):
+        self.spec = spec or REGISTRY["btc-15m"]
         self.past_markets = []
 
-    def fetch_market(self) -> Optional[Market15m]:
+    def fetch_market(self, boundary_ts: Optional[int] = None) -> Optional[Market15m]:
+        """Resolve the market for a cycle boundary (default: the current cycle). Blocking."""
         try:
-            # Calculate current 15m cycle strictly by time
+            # Calculate current cycle strictly by time
             now = datetime.now(timezone.utc)
             current_ts = int(now.timestamp())
-            current_15m_ts = (current_ts // 900) * 900
+            cycle_ts = boundary_ts if boundary_ts is not None else self.spec.boundary(current_ts)
             
             # Use calculated timestamp for slug AND start_time
-            slug = f"btc-updown-15m-{current_15m_ts}"
+            slug = self.spec.slug(cycle_ts)
             
-            # Start time is strictly the 15m boundary
-            start_time = datetime.fromtimestamp(current_15m_ts, timezone.utc)
-            # End time is +15m
-            end_time = start_time + timedelta(minutes=15)
+            # Start time is strictly the cycle boundary
+            start_time = datetime.fromtimestamp(cycle_ts, timezone.utc)
+            end_time = start_time + timedelta(seconds=self.spec.interval_sec)
             
             resp = requests.get(f"{GAMMA_API}/events?slug={slug}", timeout=10)
             events = resp.json()
@@ -222,7 +306,8 @@ class MarketCycleManager:
                 token_id_down=t_down,
                 start_time=start_time, # Use calculated strict time
                 end_time=end_time,     # Use calculated strict time
-                slug=event.get("slug")
+                slug=event.get("slug"),
+                spec=self.spec
             )
         except Exception as e:
             logger.error(f"Fetch market error: {e}")
@@ -231,9 +316,25 @@ class MarketCycleManager:
 class ProbabilityStrategy:
     """Calculates Fair Value based on Normal Distribution"""
     
-    def __init__(self):
-        self.volatility_per_min = 25.0  # Conservative BTC vol/min in USD (approx)
-        # TODO: Calculate dynamic vol
+    MIN_VOL_RATIO = 0.25 # Floor for the live estimate, as a fraction of the configured vol
+    
+    def __init__(self, volatility_per_min: float = 25.0, vol: Optional[VolatilityEngine] = None, estimator: str = "ewma"):
+        self.volatility_per_min = volatility_per_min  # Fallback vol/min in USD (approx, 25 for BTC)
+        self.vol = vol              # Live realized-vol engine for the symbol (shared)
+        self.estimator = estimator  # ewma | bipower | parkinson | fixed
+        self.last_sigma = volatility_per_min
+    
+    def current_sigma(self, price: float) -> float:
+        """USD std dev per minute: live estimate if warm, else the configured value"""
+        sigma = None
+        if self.vol and self.estimator != "fixed":
+            sigma = self.vol.sigma_usd(price, self.estimator)
+        if sigma is None:
+            sigma = self.volatility_per_min
+        else:
+            sigma = max(sigma, self.volatility_per_min * self.MIN_VOL_RATIO)
+        self.last_sigma = sigma
+        return sigma
     
     def calculate_prob_up(self, current_price: float, strike_price: float, minutes_left: float) -> float:
         """
@@ -245,7 +346,7 @@ class ProbabilityStrategy:
             
         # Standard Deviation for the remaining time
         # sigma_t = sigma_1min * sqrt(t)
-        sigma_t = self.volatility_per_min * math.sqrt(minutes_left)
+        sigma_t = self.current_sigma(current_price) * math.sqrt(minutes_left)
         
         if sigma_t == 0:
             return 1.0 if current_price >= strike_price else 0.0
@@ -259,17 +360,22 @@ class ProbabilityStrategy:
         
         return prob_up
 
-import joblib
-
 # ... imports ...
 
 class PolymarketBotV3:
     def __init__(self):
         self.running = True
         self.paper_trade = True
-        self.positions = []
-        self.cycle_manager = MarketCycleManager()
-        self.strategy = ProbabilityStrategy()
+        # Open positions, indexed by market / token and write-ahead logged (survive restarts)
+        self.positions = PositionBook()
+        # One context per traded market (asset x horizon), built from config.json
+        self.markets: Dict[str, MarketContext] = {}
+        self.markets_started = False # Markets enabled after start-up need a restart
+        # Streaming Binance prices, one per symbol shared by all horizons
+        # (REST only as a fallback when the stream is stale)
+        self.price_feeds: Dict[str, BinancePriceFeed] = {}
+        # One persistent Polymarket WS for all markets and cycles (assets swapped per market)
+        self.market_ws = ClobMarketStream()
         
         # Init Clob Client for Data Fetching
         # Load keys (Support both PK and PRIVATE_KEY)
@@ -277,7 +383,11 @@ class PolymarketBotV3:
         
         try:
             if key:
-                self.clob_client = ClobClient(CLOB_HOST, key=key, chain_id=CHAIN_ID)
+                funder = os.getenv("FUNDER_ADDRESS")
+                self.clob_client = ClobClient(CLOB_HOST, key=key, chain_id=CHAIN_ID,
+                                              signature_type=2 if funder else None, funder=funder) # Proxy wallet
+                if not self.paper_trade: # Posting orders needs L2 (API key) auth
+                    self.clob_client.set_api_creds(self.clob_client.create_or_derive_api_creds())
                 logger.info("✅ CLOB Client 已连接 (实盘/数据权限获取成功)")
             else:
                 self.clob_client = None
@@ -290,19 +400,107 @@ class PolymarketBotV3:
         self.config_file = "polymarket-bot/config.json"
         self.load_config()
         
+        # Local Binance depth books (diff-depth stream) for the OBI filter, one per symbol
+        self.depth_books: Dict[str, BinanceDepthBook] = {}
+        self.vol_engines: Dict[str, VolatilityEngine] = {}
+        # Local 1m candles per symbol (history is read from disk, never refetched)
+        self.candle_stores: Dict[str, CandleStore] = {}
+        # Streaming indicators advanced from those candles (same engine as train_ml.py)
+        self.indicator_engines: Dict[str, IndicatorEngine] = {}
+        for ctx in self.markets.values():
+            symbol = ctx.spec.symbol
+            if symbol not in self.price_feeds:
+                self.price_feeds[symbol] = BinancePriceFeed(symbol, fallback=lambda s=symbol: BinanceData.get_current_price(s))
+                depths = {c.cfg.obi_depth for c in self.markets.values() if c.spec.symbol == symbol}
+                self.depth_books[symbol] = BinanceDepthBook(symbol, bands=[*self.obi_bands, *depths])
+                # Realized volatility from the same trade stream (replaces the fixed $/min)
+                self.vol_engines[symbol] = VolatilityEngine(
+                    symbol, window_min=self.vol_window_min, ewma_lambda=self.vol_ewma_lambda,
+                    min_samples=self.vol_min_samples, seasonality=self.vol_seasonality)
+                self.vol_engines[symbol].attach(self.price_feeds[symbol])
+                self.candle_stores[symbol] = CandleStore(symbol, "1m")
+                self.indicator_engines[symbol] = IndicatorEngine()
+            ctx.strategy.vol = self.vol_engines[symbol]
+        
+        # Live orders are signed ahead of time, off the event loop (order_cache.py)
+        self.order_cache = None
+        if self.clob_client and not self.paper_trade:
+            self.order_cache = OrderCache(self.clob_client, sizes=[c.cfg.order_shares for c in self.markets.values()],
+                                          ticks_below=self.order_ladder_below, ticks_above=self.order_ladder_above)
+        # Order lifecycle + fills from the authenticated user channel (order_manager.py)
+        self.order_manager = OrderManager(self.clob_client, self.order_cache) if self.order_cache else None
+        # Paper trading fills come from a matcher on the live L2 books (sim_exchange.py)
+        self.sim_exchange = None
+        if self.paper_trade:
+            self.sim_exchange = SimExchange(lambda a: self.market_ws.books[a].depth if a in self.market_ws.books else None,
+                                            latency_ms=self.sim_latency_ms, jitter_ms=self.sim_jitter_ms,
+                                            fee_bps=self.sim_fee_bps)
+            self.market_ws.taps.append(self.sim_exchange.on_event)
+        self.broker = self.order_manager or self.sim_exchange # Same submit / wait / cancel interface
+        
+        # Every raw feed message, for backtests / replay (recorder.py)
+        self.recorder = MarketRecorder(self.record_dir) if self.record_market_data else None
+        if self.recorder:
+            self.market_ws.recorder = self.recorder
+            for source in (*self.price_feeds.values(), *self.depth_books.values()):
+                source.recorder = self.recorder
+        
+        # Binary trade journal (replaces paper_trades.jsonl)
+        self.journal = TradeJournal()
+        # Journal records and bot.log lines are written off the event loop (journal_writer.py)
+        self.writer = JournalWriter(self.journal.path, fsync=self.journal_fsync,
+                                    fsync_interval_sec=self.journal_fsync_interval_sec,
+                                    max_pending=self.journal_queue_max)
+        self.writer.capture_logging()
+        # Incremental performance aggregates over the journal (checkpointed)
+        self.perf = PerfStats(self.journal)
+        self.perf_updating = False
         self.performance_history = [] 
+        self._last_log = {}
         
-        # Load ML Model
+        # Load ML Model (flattened forest exported by train_ml.py / model_export.py)
+        # Versions come from the retraining service; the previous one is kept for rollback
+        self.model_store = ModelStore()
+        self.retrainer = RetrainService(self.model_store, cpus=self.retrain_cpus, nice=self.retrain_nice)
         self.ml_model = None
-        if os.path.exists("polymarket-bot/ml_model_v1.pkl"):
-            try:
-                self.ml_model = joblib.load("polymarket-bot/ml_model_v1.pkl")
-                logger.info("🧠 ML Model Loaded: Random Forest v1")
-            except Exception as e:
-                logger.error(f"Failed to load ML model: {e}")
+        self.ml_version = None
+        self.ml_previous = None # (version, predictor)
+        self.load_ml_model()
+
+    def _model_path(self, version: Optional[str]) -> str:
+        return self.model_store.export_path(version) if version else EXPORT_FILE
+
+    def load_ml_model(self):
+        """Start-up load of the CURRENT version (or the legacy single export)"""
+        version = self.model_store.read_pointer()["current"]
+        path = self._model_path(version)
+        if not os.path.exists(path):
+            if os.path.exists("polymarket-bot/ml_model_v1.pkl"):
+                logger.warning("⚠️ 找到 ml_model_v1.pkl 但没有导出文件，请运行 model_export.py")
+            return
+        try:
+            self.ml_model = ForestPredictor.load(path, FEATURES, max_batch=1)
+            self.ml_version = version
+            m = self.ml_model.manifest
+            logger.info(f"🧠 ML Model Loaded: Random Forest {version or 'v1'} ({m['n_trees']} trees, {len(m['features'])} features)")
+        except Exception as e:
+            logger.error(f"Failed to load ML model: {e}")
+
+    async def activate_model(self, version: str):
+        """Load a version off the event loop, then swap it in with one assignment"""
+        if self.ml_previous and self.ml_previous[0] == version:
+            predictor = self.ml_previous[1] # Rollback: already in memory
+        else:
+            # Schema / checksum are verified here: a bad artifact raises and is never swapped in
+            predictor = await asyncio.to_thread(ForestPredictor.load, self._model_path(version), FEATURES, 1)
+        self.ml_previous = (self.ml_version, self.ml_model) if self.ml_model else None
+        self.ml_model = predictor
+        self.ml_version = version
+        logger.info(f"🧠 模型已切换: {version} (上一版本 {self.ml_previous[0] if self.ml_previous else '-'} 保留用于回滚)")
 
     def load_config(self):
         """Load parameters from JSON file"""
+        conf = {}
         try:
             if os.path.exists(self.config_file):
                 with open(self.config_file, "r") as f:
@@ -312,6 +510,34 @@ class PolymarketBotV3:
                     self.min_edge = conf.get("min_edge", 0.08)
                     self.fee_pct = conf.get("fee_pct", 0.03)
                     self.obi_threshold = conf.get("obi_threshold", 1.5) # New Param
+                    self.price_stale_sec = conf.get("price_stale_sec", 3.0)
+                    self.event_driven = conf.get("event_driven", True)
+                    self.min_eval_interval_ms = conf.get("min_eval_interval_ms", 100)
+                    self.order_shares = conf.get("order_shares", 5.0)
+                    self.obi_depth = conf.get("obi_depth", 20)
+                    self.obi_bands = conf.get("obi_bands", [5, 10, 20])
+                    self.prewarm_lead_sec = conf.get("prewarm_lead_sec", 60)
+                    self.retrain_interval_h = conf.get("retrain_interval_h", 3)
+                    self.candle_history_days = conf.get("candle_history_days", 7)
+                    self.candle_sync_sec = conf.get("candle_sync_sec", 60)
+                    self.retrain_cpus = conf.get("retrain_cpus", 1)
+                    self.retrain_nice = conf.get("retrain_nice", 10)
+                    self.vol_estimator = conf.get("vol_estimator", "ewma")
+                    self.vol_window_min = conf.get("vol_window_min", 60)
+                    self.vol_ewma_lambda = conf.get("vol_ewma_lambda", 0.94)
+                    self.vol_min_samples = conf.get("vol_min_samples", 15)
+                    self.vol_seasonality = conf.get("vol_seasonality", True)
+                    self.order_ladder_below = conf.get("order_ladder_below", 2)
+                    self.order_ladder_above = conf.get("order_ladder_above", 4)
+                    self.order_fill_timeout_sec = conf.get("order_fill_timeout_sec", 2.0)
+                    self.sim_latency_ms = conf.get("sim_latency_ms", 150)
+                    self.sim_jitter_ms = conf.get("sim_jitter_ms", 50)
+                    self.sim_fee_bps = conf.get("sim_fee_bps", 0)
+                    self.record_market_data = conf.get("record_market_data", True)
+                    self.record_dir = conf.get("record_dir", RECORD_DIR)
+                    self.journal_fsync = conf.get("journal_fsync", "batch") # record | batch | interval
+                    self.journal_fsync_interval_sec = conf.get("journal_fsync_interval_sec", 1.0)
+                    self.journal_queue_max = conf.get("journal_queue_max", 10000)
                     logger.info(f"⚙️ 配置已加载: SL {self.stop_loss_pct:.0%} | Edge {self.min_edge:.0%} | OBI {self.obi_threshold}x")
             else:
                 logger.warning("⚠️ 配置文件未找到，使用默认参数")
@@ -321,63 +547,81 @@ class PolymarketBotV3:
                 if not hasattr(self, 'min_edge'): self.min_edge = 0.08
                 if not hasattr(self, 'fee_pct'): self.fee_pct = 0.03
                 if not hasattr(self, 'obi_threshold'): self.obi_threshold = 1.5
+                if not hasattr(self, 'price_stale_sec'): self.price_stale_sec = 3.0
+                if not hasattr(self, 'event_driven'): self.event_driven = True
+                if not hasattr(self, 'min_eval_interval_ms'): self.min_eval_interval_ms = 100
+                if not hasattr(self, 'order_shares'): self.order_shares = 5.0
+                if not hasattr(self, 'obi_depth'): self.obi_depth = 20
+                if not hasattr(self, 'obi_bands'): self.obi_bands = [5, 10, 20]
+                if not hasattr(self, 'prewarm_lead_sec'): self.prewarm_lead_sec = 60
+                if not hasattr(self, 'retrain_interval_h'): self.retrain_interval_h = 3
+                if not hasattr(self, 'candle_history_days'): self.candle_history_days = 7
+                if not hasattr(self, 'candle_sync_sec'): self.candle_sync_sec = 60
+                if not hasattr(self, 'retrain_cpus'): self.retrain_cpus = 1
+                if not hasattr(self, 'retrain_nice'): self.retrain_nice = 10
+                if not hasattr(self, 'vol_estimator'): self.vol_estimator = "ewma"
+                if not hasattr(self, 'vol_window_min'): self.vol_window_min = 60
+                if not hasattr(self, 'vol_ewma_lambda'): self.vol_ewma_lambda = 0.94
+                if not hasattr(self, 'vol_min_samples'): self.vol_min_samples = 15
+                if not hasattr(self, 'vol_seasonality'): self.vol_seasonality = True
+                if not hasattr(self, 'order_ladder_below'): self.order_ladder_below = 2
+                if not hasattr(self, 'order_ladder_above'): self.order_ladder_above = 4
+                if not hasattr(self, 'order_fill_timeout_sec'): self.order_fill_timeout_sec = 2.0
+                if not hasattr(self, 'sim_latency_ms'): self.sim_latency_ms = 150
+                if not hasattr(self, 'sim_jitter_ms'): self.sim_jitter_ms = 50
+                if not hasattr(self, 'sim_fee_bps'): self.sim_fee_bps = 0
+                if not hasattr(self, 'record_market_data'): self.record_market_data = True
+                if not hasattr(self, 'record_dir'): self.record_dir = RECORD_DIR
+                if not hasattr(self, 'journal_fsync'): self.journal_fsync = "batch"
+                if not hasattr(self, 'journal_fsync_interval_sec'): self.journal_fsync_interval_sec = 1.0
+                if not hasattr(self, 'journal_queue_max'): self.journal_queue_max = 10000
+            if not hasattr(self, 'volatility_per_min'): self.volatility_per_min = 25.0
+            if not hasattr(self, 'use_ml'): self.use_ml = True
+            self.load_market_config(conf)
         except Exception as e:
             logger.error(f"Config load error: {e}")
 
-    def analyze_performance(self):
+    def load_market_config(self, conf: dict):
+        """(Re)build per-market parameters: global <- market defaults <- markets.<key>"""
+        base = {k: getattr(self, k) for k in MARKET_PARAMS if hasattr(self, k)}
+        for spec in enabled_markets(conf):
+            cfg = market_config(spec, base, conf)
+            ctx = self.markets.get(spec.key)
+            if ctx:
+                ctx.cfg = cfg
+                ctx.strategy.volatility_per_min = cfg.volatility_per_min
+                ctx.strategy.estimator = cfg.vol_estimator
+            elif not self.markets_started:
+                self.markets[spec.key] = MarketContext(spec, cfg, MarketCycleManager(spec),
+                                                      ProbabilityStrategy(cfg.volatility_per_min, estimator=cfg.vol_estimator))
+            else:
+                logger.warning(f"⚠️ 新市场 {spec.key} 需要重启后生效")
+        logger.info(f"🗂️ 交易市场: {', '.join(self.markets)}")
+
+    async def analyze_performance(self):
         """Self-Correction: Adjust parameters based on recent performance"""
+        if self.perf_updating: return # Another market's worker is already folding in the new trades
+        self.perf_updating = True
         try:
-            if not os.path.exists("paper_trades.jsonl"): return
-            
-            # File Size Protection: If > 10MB, rotate it
-            if os.path.getsize("paper_trades.jsonl") > 10 * 1024 * 1024:
-                logger.info("维护: paper_trades.jsonl 过大，进行归档清理...")
-                os.rename("paper_trades.jsonl", f"paper_trades_{int(time.time())}.jsonl")
-            
-            wins = 0
-            losses = 0
-            gross_profit = 0.0
-            gross_loss = 0.0
-            recent_trades = []
-            
-            with open("paper_trades.jsonl", "r") as f:
-                for line in f:
-                    try:
-                        trade = json.loads(line)
-                        if "pnl" in trade: # Closed trade
-                            recent_trades.append(trade)
-                    except: pass
+            # Only trades appended since the last cycle are read (O(1) each); journal read + checkpoint off the loop
+            added = await asyncio.to_thread(self.perf.update)
+            if not added: return # No trade closed since the last cycle: nothing new to report
             
             # Analyze last 20 closed trades for statistical significance
-            recent_trades = recent_trades[-20:]
-            if not recent_trades: return
-            
-            for t in recent_trades:
-                pnl = float(t["pnl"])
-                if pnl > 0: 
-                    wins += 1
-                    gross_profit += pnl
-                else: 
-                    losses += 1
-                    gross_loss += abs(pnl)
-            
-            total = wins + losses
-            if total == 0: return
-            
-            win_rate = wins / total
-            profit_factor = gross_profit / gross_loss if gross_loss > 0 else float('inf')
-            avg_win = gross_profit / wins if wins > 0 else 0
-            avg_loss = gross_loss / losses if losses > 0 else 0
+            stats = self.perf.recent()
             
             # Log Core Metrics for User
-            # logger.info(f"📊 业绩分析 (最近{total}笔):")
-            # logger.info(f"   胜率: {win_rate:.0%} | 盈亏比 (Profit Factor): {profit_factor:.2f}")
+            logger.info(f"📊 业绩分析 (最近{stats['trades']}笔): 胜率 {stats['win_rate']:.0%} | "
+                        f"盈亏比 (Profit Factor) {stats['profit_factor']:.2f} | "
+                        f"平均盈利 ${stats['avg_win']:.2f} / 平均亏损 ${stats['avg_loss']:.2f}")
             
             # Since we now use external config, we DON'T auto-adjust inside python code anymore
             # We just log stats. Auto-adjustment should be done by an external agent via config.json
             
         except Exception as e:
             logger.error(f"Auto-tune error: {e}")
+        finally:
+            self.perf_updating = False
 
     async def config_watcher(self):
         """Watch for config changes and hot-reload"""
@@ -394,215 +638,454 @@ class PolymarketBotV3:
             except: pass
             await asyncio.sleep(60)
 
+    async def sync_candles(self):
+        """Bring every local candle store up to the last closed minute (only missing ranges)"""
+        since_ms = int((time.time() - self.candle_history_days * 86400) * 1000)
+        for symbol, store in self.candle_stores.items():
+            try:
+                await sync_candles(store, since_ms)
+            except Exception as e:
+                logger.warning(f"Candle sync failed ({symbol}): {e}")
+            self.indicator_engines[symbol].catch_up(store)
+
+    async def snapshot_indicators(self, ctx: MarketContext, market: Market15m):
+        """Freeze the indicator features of a cycle once the candle before its open is stored"""
+        symbol = ctx.spec.symbol
+        store, engine = self.candle_stores[symbol], self.indicator_engines[symbol]
+        start_ms = int(market.start_time.timestamp() * 1000)
+        for attempt in range(5): # Binance publishes the closed candle within a second or two
+            if store.end_ms >= start_ms: break
+            if attempt: await asyncio.sleep(2)
+            try:
+                await sync_candles(store, start_ms - 60_000)
+            except Exception as e:
+                logger.warning(f"Candle sync failed ({symbol}): {e}")
+        engine.catch_up(store, until_ms=start_ms)
+        market.indicators = engine.features_at(start_ms)
+        if market.indicators is None and engine.last_ms is not None and engine.last_ms >= start_ms:
+            # Restarted mid-cycle: the engine is already past the open, replay the history up to it
+            market.indicators = await asyncio.to_thread(features_from, store, start_ms)
+        if market.indicators is None:
+            logger.warning(f"[{ctx.spec.key}] ⚠️ 开盘前K线缺失，本周期不使用ML (避免与训练特征不一致)")
+        else:
+            logger.info(f"[{ctx.spec.key}] 📊 指标: " + " | ".join(f"{k} {v:.4g}" for k, v in market.indicators.items()))
+
+    async def candle_sync_loop(self):
+        while self.running:
+            await asyncio.sleep(self.candle_sync_sec)
+            await self.sync_candles()
+
     async def run(self):
         logger.info("启动 V3 智能策略机器人 (Probability/Fair Value)...")
         # logger.info(f"配置: 止损线 -{self.stop_loss_pct*100}% | 模拟费率 {self.fee_pct*100}%") # Moved to load_config
         if self.paper_trade: logger.info("[模式] 模拟交易 (全权限托管)")
         
-        # Start Background Tasks
+        # Local candle history first: warms the volatility estimators before live ticks
+        try:
+            await asyncio.wait_for(self.sync_candles(), timeout=30)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ K线同步超时，稍后在后台继续")
+        for symbol, engine in self.vol_engines.items():
+            n = engine.warm_from(self.candle_stores[symbol])
+            if n: logger.info(f"📈 波动率已用本地K线预热 ({n} 根): {engine.summary()}")
+        self.settle_recovered()
+        
+        # Start Background Tasks (feeds and the Polymarket WS are shared by all markets)
+        for feed in self.price_feeds.values():
+            asyncio.create_task(feed.run())
+        for book in self.depth_books.values():
+            asyncio.create_task(book.run())
+        asyncio.create_task(self.market_ws.run())
+        if self.order_manager: asyncio.create_task(self.order_manager.run())
         asyncio.create_task(self.auto_retrain_loop())
+        asyncio.create_task(self.model_watcher())
+        asyncio.create_task(self.candle_sync_loop())
         asyncio.create_task(self.config_watcher()) # Start Hot-Reloader
         
+        self.markets_started = True
+        await asyncio.gather(*(self.market_worker(ctx) for ctx in self.markets.values()))
+
+    async def market_worker(self, ctx: MarketContext):
+        """Cycle loop for one market: prepare, lock strike, trade, settle, pre-warm next"""
+        tag = f"[{ctx.spec.key}]"
+        feed = self.price_feeds[ctx.spec.symbol]
+        prepared = None
         while self.running:
+            next_task = None
             try:
                 # Run Auto-Tuning every cycle
-                self.analyze_performance()
+                await self.analyze_performance()
                 
-                # Cleanup old positions from previous cycles
-                self.positions = [p for p in self.positions if (datetime.now(timezone.utc) - datetime.fromisoformat(p["timestamp"])).total_seconds() < 3600]
+                # Cleanup old positions from previous cycles (dropped an hour after settlement)
+                self.positions.expire(time.time() - 3600)
 
-                market = self.cycle_manager.fetch_market()
-                if not market:
-                    logger.info("等待活跃市场...")
-                    await asyncio.sleep(10)
-                    continue
+                if prepared is None:
+                    # Cold start (or the pre-warm missed): resolve the current cycle now
+                    prepared = await self.prepare_cycle(ctx)
+                    if not prepared:
+                        self._throttled_info(f"{ctx.spec.key}:idle", f"{tag} 等待活跃市场...", 60)
+                        await asyncio.sleep(10)
+                        continue
+                market = prepared.market
                 
-                # Fetch Strike Price (Open Price)
-                # Ensure the market start time has passed so the candle exists
-                now = datetime.now(timezone.utc)
-                if now < market.start_time:
-                    logger.info(f"等待市场开始: {market.start_time}")
-                    await asyncio.sleep(5)
-                    continue
+                # Pre-warmed markets are ready before the boundary: wait for the open
+                wait = (market.start_time - datetime.now(timezone.utc)).total_seconds()
+                if wait > 0:
+                    logger.info(f"{tag} 等待市场开始: {market.start_time}")
+                    await asyncio.sleep(wait)
                 
-                logger.info(f"选中市场: {market.question}")
-                
-                # Get Strike Price (Binance)
-                # Need timestamp in ms
-                start_ts_ms = int(market.start_time.timestamp() * 1000)
-                
-                # Retry fetching strike until available (Binance might delay 1-2s)
-                strike_price = None
-                for _ in range(5):
-                    strike_price = BinanceData.get_candle_open(start_ts_ms)
-                    if strike_price: break
-                    logger.info("等待 Strike Price (Binance Candle)...")
-                    await asyncio.sleep(2)
+                logger.info(f"{tag} 选中市场: {market.question}")
                 
+                strike_price = await self.resolve_strike(prepared)
                 if not strike_price:
-                    logger.error("无法获取 Strike Price，跳过此周期")
+                    logger.error(f"{tag} 无法获取 Strike Price，跳过此周期")
+                    await self.release_cycle(prepared)
+                    prepared = None
                     await asyncio.sleep(30)
                     continue
                     
                 market.strike_price = strike_price
-                logger.info(f"🎯 Strike Price (锁定): ${strike_price:,.2f}")
+                # Trend of the previous cycle (its open -> this open), as in fetch_history.py
+                start_ts = int(market.start_time.timestamp())
+                if ctx.last_strike and ctx.last_strike[0] == start_ts - ctx.spec.interval_sec:
+                    market.prev_trend = (strike_price - ctx.last_strike[1]) / ctx.last_strike[1]
+                ctx.last_strike = (start_ts, strike_price)
+                ready_ms = (datetime.now(timezone.utc) - market.start_time).total_seconds() * 1000
+                logger.info(f"{tag} 🎯 Strike Price (锁定): ${strike_price:,.4f} | 开盘后 {ready_ms:.0f}ms 就绪")
+                logger.info(f"{tag} 📈 {self.vol_engines[ctx.spec.symbol].summary()} (使用: {ctx.strategy.estimator})")
+                self.record_cycle(ctx, market)
+                # Indicator features of this cycle (ready well before the opening cooldown ends)
+                asyncio.create_task(self.snapshot_indicators(ctx, market))
                 
-                # Fetch Real Dynamic Fee
-                # if self.clob_client:
-                #     try:
-                #         # Note: py_clob_client doesn't have a public get_fee method in some versions
-                #         # We will rely on Spread + fixed conservative buffer
-                #         pass
-                #     except: pass
+                # The close of this market is the open of the next one:
+                # one boundary capture serves both settlement and the next strike
+                close_price = feed.capture_open(int(market.end_time.timestamp() * 1000))
+                next_task = asyncio.create_task(self.prewarm_next(ctx, market, close_price))
                 
                 # Start Trading Loop for this Market
-                await self.trade_loop(market)
+                try:
+                    await self.trade_loop(ctx, market)
+                finally:
+                    # Settle even if the loop failed: a position opened this cycle still needs its SETTLED record
+                    asyncio.create_task(self.settle_at_close(market, close_price))
+
+                prepared = await next_task
                 
             except Exception as e:
-                logger.error(f"Main loop error: {e}")
+                logger.error(f"{tag} Main loop error: {e}")
+                if next_task:
+                    next_task.cancel()
+                    next_task.add_done_callback(self._discard_prepared)
+                if prepared:
+                    await self.release_cycle(prepared)
+                    prepared = None
                 await asyncio.sleep(5)
 
+    def _discard_prepared(self, task: asyncio.Task):
+        """Drop the subscription of a pre-warmed cycle that will not be traded"""
+        if task.cancelled() or task.exception() or not task.result(): return
+        asyncio.create_task(self.release_cycle(task.result()))
+
+    async def release_cycle(self, prepared: PreparedCycle):
+        m = prepared.market
+        await self.market_ws.unsubscribe([m.token_id_up, m.token_id_down])
+
+    async def prepare_cycle(self, ctx: MarketContext, boundary_ts: Optional[int] = None, strike: Optional[asyncio.Future] = None) -> Optional[PreparedCycle]:
+        """Resolve a market (Gamma lookup off the loop) and subscribe its books on the shared WS"""
+        market = await asyncio.to_thread(ctx.cycle_manager.fetch_market, boundary_ts)
+        if not market: return None
+        await self.market_ws.subscribe([market.book_up, market.book_down])
+        return PreparedCycle(market, strike)
+
+    async def prewarm_next(self, ctx: MarketContext, market: Market15m, strike: asyncio.Future) -> Optional[PreparedCycle]:
+        """Resolve + subscribe the next cycle `prewarm_lead_sec` before the boundary"""
+        next_ts = int(market.end_time.timestamp())
+        lead = (market.end_time - datetime.now(timezone.utc)).total_seconds() - ctx.cfg.prewarm_lead_sec
+        if lead > 0:
+            await asyncio.sleep(lead)
+        
+        # Gamma may publish the next event late: keep retrying until shortly after the open
+        while self.running and time.time() < next_ts + 30:
+            try:
+                prepared = await self.prepare_cycle(ctx, next_ts, strike)
+                if prepared:
+                    logger.info(f"🔥 已预热下一周期: {prepared.market.slug}")
+                    return prepared
+            except Exception as e:
+                logger.error(f"Prewarm error: {e}")
+            await asyncio.sleep(5)
+        logger.warning(f"⚠️ [{ctx.spec.key}] 下一周期预热失败，回退到冷启动")
+        return None
+
+    async def resolve_strike(self, prepared: PreparedCycle) -> Optional[float]:
+        """Strike = Binance open at the boundary: live capture, then local candles, then REST kline"""
+        if prepared.strike is not None:
+            try:
+                price = await asyncio.wait_for(asyncio.shield(prepared.strike), timeout=3)
+                if price: return price
+            except asyncio.TimeoutError:
+                pass
+            logger.warning("⚠️ 实时流未捕获开盘价，回退到 Binance K线")
+        
+        # Get Strike Price (Binance)
+        # Need timestamp in ms
+        start_ts_ms = int(prepared.market.start_time.timestamp() * 1000)
+        symbol = prepared.market.spec.symbol
+        
+        # Already-closed candle (e.g. restart mid-cycle): local store, no network
+        store = self.candle_stores.get(symbol)
+        strike_price = store.open_at(start_ts_ms) if store else None
+        if strike_price: return strike_price
+        
+        # Retry fetching strike until available (Binance might delay 1-2s)
+        for _ in range(5):
+            strike_price = await asyncio.to_thread(BinanceData.get_candle_open, start_ts_ms, symbol)
+            if strike_price: return strike_price
+            logger.info("等待 Strike Price (Binance Candle)...")
+            await asyncio.sleep(2)
+        return None
+
+    def record_cycle(self, ctx: MarketContext, market: Market15m):
+        """Cycle metadata next to the raw feeds (tokens, window, strike), for recorder.export_ticks"""
+        if not self.recorder: return
+        self.recorder.record("bot_cycle", json.dumps({
+            "slug": market.slug, "market": ctx.spec.key, "symbol": ctx.spec.symbol,
+            "condition_id": market.condition_id, "token_up": market.token_id_up, "token_down": market.token_id_down,
+            "start": market.start_time.timestamp(), "end": market.end_time.timestamp(), "strike": market.strike_price,
+        }), market.slug)
+
+    async def settle_at_close(self, market: Market15m, close_price: asyncio.Future):
+        """Settle with the Binance price captured at the market's end boundary"""
+        # MARKET SETTLEMENT (Simulated)
+        # The resolution price is the price AT expiration (= open of the next candle)
+        wait = (market.end_time - datetime.now(timezone.utc)).total_seconds()
+        try:
+            final_price = await asyncio.wait_for(asyncio.shield(close_price), timeout=max(0, wait) + 5)
+        except asyncio.TimeoutError:
+            final_price = None
+        if not final_price:
+            final_price = await self.price_feeds[market.spec.symbol].get_price(self.price_stale_sec)
+        
+        if final_price:
+            logger.info(f"市场结算! {market.slug} Final {market.spec.asset.upper()}: ${final_price}")
+            if self.recorder:
+                self.recorder.record("bot_cycle", json.dumps({"slug": market.slug, "final": final_price}), market.slug)
+            await self.settle_positions(market, final_price)
+
+    def settle_recovered(self):
+        """Positions restored from disk whose market closed while the bot was down: settle from local candles"""
+        if not self.paper_trade: return
+        now = time.time()
+        for slug in self.positions.markets():
+            p = self.positions.in_market(slug)[0]
+            if p.end_ts is None or p.end_ts > now: continue # Still trading: its market worker settles it
+            store = self.candle_stores.get(p.symbol)
+            final = store.open_at(int(p.end_ts * 1000)) if store else None # Close = open of the next candle
+            if final and p.strike:
+                logger.info(f"📒 补结算重启期间到期的持仓: {slug}")
+                self.settle_market(slug, p.condition_id, p.strike, final)
+
     async def auto_retrain_loop(self):
-        """Automatically retrain ML model every 3 hours"""
+        """Automatically retrain ML model (every retrain_interval_h, default 3 hours)"""
         while self.running:
-            await asyncio.sleep(3 * 3600) # Wait 3 hours
+            await asyncio.sleep(self.retrain_interval_h * 3600)
             logger.info("🧠 自动进化: 开始重新训练模型...")
             try:
-                # Run augment script
-                proc = await asyncio.create_subprocess_shell("python3 polymarket-bot/augment_data.py")
-                await proc.wait()
-                
-                # Run train script
-                proc = await asyncio.create_subprocess_shell("python3 polymarket-bot/train_ml.py")
-                await proc.wait()
-                
-                # Reload model
-                if os.path.exists("polymarket-bot/ml_model_v1.pkl"):
-                    self.ml_model = joblib.load("polymarket-bot/ml_model_v1.pkl")
-                    logger.info("✅ 模型已更新并重新加载!")
+                # Augment + train in a pinned worker process (event loop keeps running)
+                result = await self.retrainer.retrain()
+                if not result:
+                    continue
+                await self.activate_model(result["version"])
+                # Publish only what was loaded successfully
+                await asyncio.to_thread(self.model_store.promote, result["version"])
+                await asyncio.to_thread(self.model_store.prune)
+                logger.info(f"✅ 模型已更新并重新加载! (valid score {result.get('valid_score', 0):.2%})")
             except Exception as e:
                 logger.error(f"Auto-retrain failed: {e}")
 
-    async def trade_loop(self, market: Market15m):
-        # For brevity in this write, using polling loop which is fine for 5s intervals.
-        # Ideally keep WS from V2.
+    async def model_watcher(self):
+        """Follow models/CURRENT (e.g. `retrain_service.py rollback` from the shell)"""
+        last_mtime = self.model_store.pointer_mtime()
+        while self.running:
+            await asyncio.sleep(30)
+            try:
+                mtime = self.model_store.pointer_mtime()
+                if mtime == last_mtime: continue
+                last_mtime = mtime
+                version = self.model_store.read_pointer()["current"]
+                if version and version != self.ml_version:
+                    await self.activate_model(version)
+            except Exception as e:
+                logger.error(f"Model switch failed: {e}")
+
+    async def trade_loop(self, ctx: MarketContext, market: Market15m):
+        # Event-driven: every book update / BTC tick marks the market dirty and
+        # wakes the evaluator (debounced by min_eval_interval_ms).
+        # Polling mode (event_driven=false) keeps the old fixed 2s cadence.
+        trigger = DecisionTrigger(self.min_eval_interval_ms / 1000.0)
+        on_tick = lambda: trigger.mark_dirty("btc")
+        feed = self.price_feeds[ctx.spec.symbol]
+        feed.listeners.append(on_tick)
         
-        ws_manager = WebSocketManagerV3(market)
-        await ws_manager.connect()
-        asyncio.create_task(ws_manager.listen())
+        assets = [market.token_id_up, market.token_id_down]
+        if assets[0] not in self.market_ws.books:
+            await self.market_ws.subscribe([market.book_up, market.book_down])
+        self.market_ws.set_listener(assets, lambda: trigger.mark_dirty("book"))
+        if self.order_manager: self.order_manager.watch([market.condition_id])
+        if self.sim_exchange and self.clob_client: # Market's taker fee rate, for simulated fills
+            asyncio.create_task(self.sim_exchange.load_fee_rates(self.clob_client, assets))
+        if self.order_cache: # Sign both ladders now, before the first signal
+            self.order_cache.track(market.token_id_up, market.book_up.best_ask)
+            self.order_cache.track(market.token_id_down, market.book_down.best_ask)
         
-        logger.info(f"开始监控... 结算时间: {market.end_time}")
+        mode = "事件驱动" if self.event_driven else "轮询 2s"
+        logger.info(f"[{ctx.spec.key}] 开始监控 ({mode})... 结算时间: {market.end_time}")
+        last_report = time.time()
         
-        while self.running and market.is_active:
-            # 1. Get Data
-            current_btc = BinanceData.get_current_price()
-            if not current_btc:
-                await asyncio.sleep(2)
-                continue
+        try:
+            while self.running and market.is_active:
+                if self.event_driven:
+                    pending = await trigger.wait(timeout=1.0)
+                else:
+                    pending = trigger.take()
                 
-            time_left = market.time_remaining.total_seconds() / 60.0 # minutes
-            
-            # 2. Calculate Fair Value
-            prob_up = self.strategy.calculate_prob_up(current_btc, market.strike_price, time_left)
-            prob_down = 1.0 - prob_up
+                await self.evaluate_market(ctx, market)
+                trigger.decided(pending)
+                
+                if time.time() - last_report >= 60:
+                    logger.info(f"⏱️ [{ctx.spec.key}] 决策延迟 ({mode}): {trigger.summary()}")
+                    last_report = time.time()
+                
+                if not self.event_driven:
+                    await asyncio.sleep(2)
+        finally:
+            feed.listeners.remove(on_tick)
+            await self.market_ws.unsubscribe(assets)
+            if self.order_cache:
+                self.order_cache.drop(assets)
+                logger.info(f"✍️ [{ctx.spec.key}] {self.order_cache.summary()} | {self.order_manager.summary()}")
+            if self.sim_exchange:
+                self.sim_exchange.forget(assets)
+                logger.info(f"🧪 [{ctx.spec.key}] {self.sim_exchange.summary()}")
+            if self.recorder:
+                logger.info(f"🎙️ {self.recorder.summary()}")
+            logger.info(f"🗄️ {self.writer.summary()}")
+        
+        logger.info(f"⏱️ [{ctx.spec.key}] 本周期决策延迟 ({mode}): {trigger.summary()}")
+
+    def _throttled_info(self, key: str, msg: str, every: float = 10.0):
+        """Log at most once per `every` seconds per key (evaluations can run many times a second)"""
+        now = time.time()
+        if now - self._last_log.get(key, 0) >= every:
+            self._last_log[key] = now
+            logger.info(msg)
+
+    async def evaluate_market(self, ctx: MarketContext, market: Market15m):
+        """One pass of fair value, edge, stop-loss and entry checks"""
+        cfg = ctx.cfg
+        tag = f"[{ctx.spec.key}]"
+        # 0. Never act on books that may be frozen (WS down, resync pending)
+        if self.market_ws.is_stale((market.token_id_up, market.token_id_down)):
+            self._throttled_info(f"{ctx.spec.key}:stale", f"⚠️ {tag} 订单簿行情过期/同步中 - 暂停交易", 5)
+            return
+        
+        # 1. Get Data (stream snapshot, no network I/O unless stale)
+        current_btc = await self.price_feeds[ctx.spec.symbol].get_price(self.price_stale_sec)
+        if not current_btc:
+            return
             
-            # 3. AI Prediction Boost
-            if self.ml_model:
-                try:
-                    hour = datetime.now(timezone.utc).hour
-                    # Simple prediction based on market structure
-                    # If AI predicts WIN for UP, we boost prob_up
-                    # Warning: This is a simplified integration
-                    X = [[market.up_price, 1, hour]]
-                    if self.ml_model.predict(X)[0] == 1:
-                        prob_up += 0.05
-                except: pass
-
-            # 3. Compare with Market
-            # Market prices from WS
-            mkt_up = market.up_price
-            mkt_down = market.down_price
+        time_left = market.time_remaining.total_seconds() / 60.0 # minutes
+        
+        # 2. Calculate Fair Value
+        prob_up = ctx.strategy.calculate_prob_up(current_btc, market.strike_price, time_left)
+        prob_down = 1.0 - prob_up
+        
+        # 3. AI Prediction Boost (model is trained on BTC 15m trades only)
+        if self.ml_model and cfg.use_ml and market.indicators is not None: # No features as of the open: no ML
+            try:
+                # If AI predicts WIN for buying UP at the current price, we boost prob_up
+                features = trade_features(market.up_price, "UP", datetime.now(timezone.utc), market.prev_trend,
+                                          market.indicators)
+                self.ml_model.set_row(0, features)
+                if self.ml_model.predict_proba(1)[0] > 0.5:
+                    prob_up += 0.05
+            except Exception as e:
+                self._throttled_info("ml:error", f"⚠️ ML 推理失败: {e}", 60)
+
+        # 3. Compare with Market
+        # Executable prices (VWAP for our order size) from the WS L2 book
+        mkt_up = market.fill_price("UP", cfg.order_shares)
+        mkt_down = market.fill_price("DOWN", cfg.order_shares)
+        if self.order_cache: # Ladders follow the asks (re-signed in the background)
+            self.order_cache.track(market.token_id_up, market.book_up.best_ask)
+            self.order_cache.track(market.token_id_down, market.book_down.best_ask)
+        
+        # 4. Decision
+        # Calculate dynamic Safety Margin to account for Binance vs Chainlink deviation
+        # using percentage (0.05%) instead of fixed amount
+        safety_margin = market.strike_price * cfg.safety_margin_pct
+        
+        diff = current_btc - market.strike_price
+        
+        # Check Stop Loss for existing positions
+        await self.check_stop_loss(ctx, market)
+
+        # --- [New] Cooldown Period Filter ---
+        # Don't trade in the first 15 seconds of the market cycle to avoid opening noise
+        time_since_start = (datetime.now(timezone.utc) - market.start_time).total_seconds()
+        if time_since_start < 15:
+            self._throttled_info(f"{ctx.spec.key}:cooldown", f"⏳ {tag} 开盘冷静期: 等待趋势确认 ({int(time_since_start)}/15s) - 跳过", 2)
+            return
+
+        # If within safety margin (ambiguous zone), force neutral probability or skip
+        if abs(diff) < safety_margin:
+            self._throttled_info(f"{ctx.spec.key}:margin", f"{tag} 价格差异 ${diff:.4g} 在安全边际(${safety_margin:.4g}, {cfg.safety_margin_pct:.2%})内 - 跳过", 2)
+            return
+        
+        # Only trade if we don't have a position in this market yet (Simple mode)
+        has_position = self.positions.has_market(market.slug)
+        
+        in_cooldown = time.time() < ctx.entry_cooldown_until
+        
+        if not has_position and not in_cooldown and abs(diff) >= safety_margin:
+            # Signal if Edge > Threshold
+            # Use Dynamic Fee
+            fee = market.dynamic_fee
             
-            # 4. Decision
-            # Calculate dynamic Safety Margin to account for Binance vs Chainlink deviation
-            # using percentage (0.05%) instead of fixed amount
-            safety_margin = market.strike_price * self.safety_margin_pct
+            edge_up = prob_up - mkt_up - fee
+            edge_down = prob_down - mkt_down - fee
             
-            diff = current_btc - market.strike_price
+            # --- OBI Filter Integration ---
+            # Notional-weighted, maintained incrementally from the depth stream (no I/O)
+            obi = self.depth_books[ctx.spec.symbol].obi(cfg.obi_depth)
+            # If OBI > 1.0, Bids are heavier (Bullish)
+            # If OBI < 1.0, Asks are heavier (Bearish)
             
-            # Check Stop Loss for existing positions
-            await self.check_stop_loss(market)
-
-            # --- [New] Cooldown Period Filter ---
-            # Don't trade in the first 15 seconds of the market cycle to avoid opening noise
-            time_since_start = (datetime.now(timezone.utc) - market.start_time).total_seconds()
-            if time_since_start < 15:
-                logger.info(f"⏳ 开盘冷静期: 等待趋势确认 ({int(time_since_start)}/15s) - 跳过")
-                await asyncio.sleep(2)
-                continue
-
-            # If within safety margin (ambiguous zone), force neutral probability or skip
-            if abs(diff) < safety_margin:
-                logger.info(f"价格差异 ${diff:.1f} 在安全边际(${safety_margin:.1f}, {self.safety_margin_pct:.2%})内 - 跳过")
-                await asyncio.sleep(2)
-                continue
+            log_msg = (
+                f"{tag} 剩余 {time_left:.1f}m | {ctx.spec.asset.upper()}: ${current_btc:.6g} (Diff: ${diff:+.4g}) | "
+                f"Prob UP: {prob_up:.1%} | σ ${ctx.strategy.last_sigma:.4g}/m | OBI: {obi:.2f}x | Edge: {edge_up:+.1%}"
+            )
             
-            # Only trade if we don't have a position in this market yet (Simple mode)
-            has_position = any(p['market_slug'] == market.slug for p in self.positions)
+            # Only log every 10s
+            self._throttled_info(f"{ctx.spec.key}:status", log_msg)
             
-            if not has_position and abs(diff) >= safety_margin:
-                # Signal if Edge > Threshold
-                # Use Dynamic Fee
-                fee = market.dynamic_fee
-                
-                edge_up = prob_up - mkt_up - fee
-                edge_down = prob_down - mkt_down - fee
-                
-                # --- OBI Filter Integration ---
-                obi = BinanceData.get_order_book_imbalance()
-                # If OBI > 1.0, Bids are heavier (Bullish)
-                # If OBI < 1.0, Asks are heavier (Bearish)
-                
-                log_msg = (
-                    f"剩余 {time_left:.1f}m | BTC: ${current_btc:.1f} (Diff: ${diff:+.1f}) | "
-                    f"Prob UP: {prob_up:.1%} | OBI: {obi:.2f}x | Edge: {edge_up:+.1%}"
-                )
-                
-                # Only log every 10s
-                if int(time.time()) % 10 == 0:
-                    logger.info(log_msg)
-                
-                # Execute Trade (With OBI Filter)
-                # UP: Need Edge + OBI > 1 / Threshold (Don't buy into heavy sell wall)
-                if edge_up > self.min_edge:
-                    if obi > (1 / self.obi_threshold): 
-                        await self.execute_trade(market, "UP", 0.05)
-                    else:
-                        logger.info(f"🛑 拦截 UP 信号: 卖压太重 (OBI {obi:.2f} < {1/self.obi_threshold:.2f})")
-                        
-                # DOWN: Need Edge + OBI < Threshold (Don't sell into heavy buy wall)
-                elif edge_down > self.min_edge:
-                    if obi < self.obi_threshold:
-                        await self.execute_trade(market, "DOWN", 0.05)
-                    else:
-                        logger.info(f"🛑 拦截 DOWN 信号: 买盘太强 (OBI {obi:.2f} > {self.obi_threshold:.2f})")
-                        
-            elif int(time.time()) % 10 == 0:
-                 logger.info(f"监控中... 持仓数: {len(self.positions)} | 价格差: ${diff:+.1f}")
-                
-            await asyncio.sleep(2)
-        
-        await ws_manager.close()
-        
-        # MARKET SETTLEMENT (Simulated)
-        # Fetch Final Price (Binance Candle Open of the NEXT candle, or just current price if immediate)
-        # To be precise: The resolution price is typically the price AT expiration.
-        await asyncio.sleep(5) # Wait for dust to settle
-        final_price = BinanceData.get_current_price()
-        
-        if final_price:
-            logger.info(f"市场结算! Final BTC: ${final_price}")
-            await self.settle_positions(market, final_price)
+            # Execute Trade (With OBI Filter)
+            # UP: Need Edge + OBI > 1 / Threshold (Don't buy into heavy sell wall)
+            if edge_up > cfg.min_edge:
+                if obi > (1 / cfg.obi_threshold): 
+                    await self.execute_trade(ctx, market, "UP", 0.05)
+                else:
+                    logger.info(f"🛑 {tag} 拦截 UP 信号: 卖压太重 (OBI {obi:.2f} < {1/cfg.obi_threshold:.2f})")
+                    
+            # DOWN: Need Edge + OBI < Threshold (Don't sell into heavy buy wall)
+            elif edge_down > cfg.min_edge:
+                if obi < cfg.obi_threshold:
+                    await self.execute_trade(ctx, market, "DOWN", 0.05)
+                else:
+                    logger.info(f"🛑 {tag} 拦截 DOWN 信号: 买盘太强 (OBI {obi:.2f} > {cfg.obi_threshold:.2f})")
+                    
+        else:
+            self._throttled_info(f"{ctx.spec.key}:status", f"{tag} 监控中... 持仓数: {len(self.positions)} | 价格差: ${diff:+.4g}")
 
     async def settle_positions(self, market, final_price):
         """Settle open positions for paper trading"""
@@ -620,139 +1103,131 @@ class PolymarketBotV3:
         
         strike = market.strike_price
         if not strike: return
-        
+        self.settle_market(market.slug, market.condition_id, strike, final_price)
+
+    def settle_market(self, slug: str, condition_id: str, strike: float, final_price: float):
+        """Archive every remaining position of a market against its final price"""
         # Determine Winner
         # "Up" if Final >= Strike
         winner = "UP" if final_price >= strike else "DOWN"
         logger.info(f"🏆 结算结果: {winner} (Strike: {strike} vs Final: {final_price})")
         
         # Iterate remaining positions for this market
-        for p in list(self.positions):
-            if p["market_slug"] != market.slug: continue
+        for p in self.positions.in_market(slug):
+            payout = 1.0 if p.direction == winner else 0.0
+            # One record per position: shares already sold by a partial stop-loss count at their exit price
+            held = p.shares + p.sold_shares
+            exit_price = (p.shares * payout + p.sold_value) / held if held > 0 else payout
+            pnl_amt = exit_price - p.entry_price
+            pnl_pct = pnl_amt / p.entry_price
             
-            payout = 1.0 if p["direction"] == winner else 0.0
-            pnl_amt = payout - p["entry_price"]
-            pnl_pct = pnl_amt / p["entry_price"]
+            logger.info(f"💰 结算归档: {p.direction} -> PnL: {pnl_pct:.1%}")
             
-            logger.info(f"💰 结算归档: {p['direction']} -> PnL: {pnl_pct:.1%}")
-            
-            with open("paper_trades.jsonl", "a") as f:
-                f.write(json.dumps({
-                    "time": datetime.now(timezone.utc).isoformat(),
-                    "type": "SETTLED",
-                    "market": market.slug,
-                    "condition_id": market.condition_id, # [New] Added for Auto-Redeem
-                    "direction": p["direction"],
-                    "entry_price": p["entry_price"],
-                    "exit_price": payout, # 1.0 or 0.0
-                    "pnl": pnl_pct,
-                    "result": "WIN" if payout > 0 else "LOSS"
-                }) + "\n")
+            self.writer.append({
+                "time": datetime.now(timezone.utc).isoformat(),
+                "type": "SETTLED",
+                "market": slug,
+                "condition_id": condition_id, # [New] Added for Auto-Redeem
+                "direction": p.direction,
+                "entry_price": p.entry_price,
+                "exit_price": exit_price, # 1.0 or 0.0 unless partly stopped out
+                "pnl": pnl_pct,
+                "result": "WIN" if pnl_amt > 0 else "LOSS",
+                "prev_trend": p.prev_trend
+            })
             
-            self.positions.remove(p)
+            self.positions.close(p)
 
-    async def check_stop_loss(self, market: Market15m):
+    async def check_stop_loss(self, ctx: MarketContext, market: Market15m):
         """Check if any position needs to be stopped out"""
         # Copy list to modify safe
-        for p in list(self.positions):
-            if p["market_slug"] != market.slug: continue
-            
-            current_price = market.up_price if p["direction"] == "UP" else market.down_price
-            entry_price = p["entry_price"]
+        for p in self.positions.in_market(market.slug):
+            current_price = market.up_price if p.direction == "UP" else market.down_price
+            entry_price = p.entry_price
             
             # PnL calculation
             pnl_pct = (current_price - entry_price) / entry_price
             
-            if pnl_pct < -self.stop_loss_pct:
-                logger.warning(f"🛑 止损触发! {p['direction']} @ {current_price:.2f} (Entry: {entry_price:.2f}, PnL: {pnl_pct:.1%})")
+            if pnl_pct < -ctx.cfg.stop_loss_pct:
+                logger.warning(f"🛑 止损触发! {p.direction} @ {current_price:.2f} (Entry: {entry_price:.2f}, PnL: {pnl_pct:.1%})")
                 
-                if self.paper_trade:
-                    with open("paper_trades.jsonl", "a") as f:
-                        f.write(json.dumps({
-                            "time": datetime.now(timezone.utc).isoformat(),
-                            "type": "STOP_LOSS",
-                            "market": market.slug,
-                            "direction": p["direction"],
-                            "exit_price": current_price,
-                            "pnl": pnl_pct
-                        }) + "\n")
-                else:
-                    # Real sell logic would go here
-                    pass
+                # Sell into the bid, fill-and-kill: whatever is left is retried on the next pass
+                bid = (market.book_up if p.direction == "UP" else market.book_down).best_bid
+                if not bid: # Collapsing token, empty bid side (None / 0.0): nothing to sell into yet
+                    self._throttled_info(f"{market.slug}:sl-nobid", f"🛑 止损无买单可卖 ({p.direction})，下次检查重试", 10)
+                    continue
+                order = await self.broker.submit(p.token_id, "SELL", bid, p.shares, OrderType.FAK, market.condition_id)
+                await self.broker.wait(order, self.order_fill_timeout_sec)
+                if order.filled <= 0:
+                    logger.error(f"❌ 止损卖出未成交 @ {bid:.2f} ({order.state} {order.error or ''})")
+                    continue
+                self.positions.sell(p, order.filled, order.filled * order.net_price)
+                if p.shares > 1e-6: continue # Remainder is retried; the record is written once the position is out
                 
-                self.positions.remove(p)
+                # One record per position, at the share-weighted exit price of all its fills
+                exit_price = p.sold_value / p.sold_shares
+                self.writer.append({
+                    "time": datetime.now(timezone.utc).isoformat(),
+                    "type": "STOP_LOSS",
+                    "market": market.slug,
+                    "direction": p.direction,
+                    "exit_price": exit_price,
+                    "pnl": (exit_price - entry_price) / entry_price
+                })
+                self.positions.close(p)
 
-    async def execute_trade(self, market, direction, size):
+    async def execute_trade(self, ctx: MarketContext, market, direction, size):
         # Double check to prevent duplicates
-        if any(p['market_slug'] == market.slug for p in self.positions):
+        if self.positions.has_market(market.slug):
             logger.warning(f"⚠️ 忽略重复下单请求: {market.slug}")
             return
 
-        # Simple limit order logic
-        price = market.up_price if direction == "UP" else market.down_price
-        # Cap price
-        price = min(0.99, max(0.01, price))
+        # Limit that sweeps our size; live orders go to the CLOB, paper ones to the simulator.
+        # Whatever does not fill within the timeout is cancelled.
+        token_id = market.token_id_up if direction == "UP" else market.token_id_down
+        limit = min(0.99, max(0.01, market.limit_price(direction, ctx.cfg.order_shares)))
+        order = await self.broker.submit(token_id, "BUY", limit, ctx.cfg.order_shares, OrderType.GTC, market.condition_id)
+        await self.broker.wait(order, self.order_fill_timeout_sec)
+        if order.is_open:
+            await self.broker.cancel(order)
+        if order.filled <= 0:
+            logger.error(f"❌ 未成交: [{ctx.spec.key}] BUY {direction} @ {limit:.2f} ({order.state} {order.error or ''})")
+            return
+        price, shares = order.net_price, order.filled
+        mode = "Paper Trade" if self.paper_trade else f"订单 {order.id[:10]}..."
+        logger.info(f"🔥 SIGNAL: [{ctx.spec.key}] BUY {direction} 成交 {shares:g} @ {price:.3f} ({mode})")
         
-        if self.paper_trade:
-             logger.info(f"🔥 SIGNAL: BUY {direction} @ {price:.2f} (Paper Trade)")
-             
-             # Record Position
-             self.positions.append({
-                 "market_slug": market.slug,
-                 "direction": direction,
-                 "entry_price": price,
-                 "size": size,
-                 "timestamp": datetime.now(timezone.utc).isoformat()
-             })
-
-             with open("paper_trades.jsonl", "a") as f:
-                 f.write(json.dumps({
-                     "time": datetime.now().isoformat(),
-                     "type": "V3_SMART",
-                     "direction": direction,
-                     "price": price,
-                     "strike": market.strike_price,
-                     "fee": self.fee_pct # Record fee assumption
-                 }) + "\n")
-             await asyncio.sleep(10) # Cooldown
-        else:
-            # Real execution code here
-            pass
-
-# --- Reusing WebSocket Manager from V2 for compactness ---
-class WebSocketManagerV3:
-    def __init__(self, market):
-        self.market = market
-        self.ws = None
-        self.running = False
-    async def connect(self):
-        self.ws = await websockets.connect(WS_URL)
-        msg = {"assets_ids": [self.market.token_id_up, self.market.token_id_down], "type": "market"}
-        await self.ws.send(json.dumps(msg))
-        self.running = True
-    async def listen(self):
-        try:
-            async for msg in self.ws:
-                if not self.running: break
-                if msg == "PONG": continue
-                try:
-                    data = json.loads(msg)
-                    if isinstance(data, list): [self._process(i) for i in data]
-                    else: self._process(data)
-                except: pass
-        except: pass
-    def _process(self, data):
-        asset = data.get("asset_id")
-        if asset == self.market.token_id_up: self.market.book_up.update(data)
-        elif asset == self.market.token_id_down: self.market.book_down.update(data)
-        elif data.get("event_type") == "price_change":
-            for p in data.get("price_changes", []):
-                aid = p.get("asset_id")
-                if aid == self.market.token_id_up: self.market.book_up.best_ask = float(p.get("best_ask") or 1)
-                elif aid == self.market.token_id_down: self.market.book_down.best_ask = float(p.get("best_ask") or 1)
-    async def close(self):
-        self.running = False
-        if self.ws: await self.ws.close()
+        # Record Position (logged to disk before we move on)
+        self.positions.open(
+            market_slug=market.slug,
+            condition_id=market.condition_id,
+            token_id=token_id,
+            symbol=market.spec.symbol,
+            direction=direction,
+            entry_price=price,
+            size=size,
+            shares=shares,
+            strike=market.strike_price,
+            prev_trend=market.prev_trend,
+            end_ts=market.end_time.timestamp()
+        )
+
+        self.writer.append({
+            "time": datetime.now(timezone.utc).isoformat(),
+            "type": "V3_SMART",
+            "market": market.slug,
+            "direction": direction,
+            "price": price,
+            "strike": market.strike_price,
+            "fee": ctx.cfg.fee_pct # Record fee assumption
+        })
+        # Cooldown (non-blocking, so stop-loss checks keep running)
+        ctx.entry_cooldown_until = time.time() + 10
 
 if __name__ == "__main__":
+    # Load environment
+    load_dotenv()
+    setup_logging()
+    # systemd stops with SIGTERM: exit normally so atexit flushes the journal writer / recorder
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
     asyncio.run(PolymarketBotV3().run())
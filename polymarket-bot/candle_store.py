@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Local OHLCV Candle Store
+- One append-only store per symbol/interval under candles/<SYMBOL>/<interval>/.
+- Columnar: one raw float64 file per column (open/high/low/close/volume) on a
+  dense time grid starting at base_ms, read through np.memmap. The row of a
+  timestamp is (ts - base) / interval, so lookups are O(1) with no index.
+  Candles Binance never produced (maintenance gaps) are NaN rows.
+- meta.json (row count, base, generation) is replaced atomically after the
+  column bytes are written: readers never see a partial row. Prepending older
+  history writes a new generation of column files.
+- sync() fetches only what is missing (before the first / after the last
+  stored candle) from Binance, 1000 candles per request, rate limited.
+  Candles are stored only CLOSE_GRACE_MS after they closed; NaN rows at the
+  tail (published late) are re-requested for REFETCH_MISSING_MS and filled in
+  place. Stored candles are never changed.
+
+Usage:
+    python3 polymarket-bot/candle_store.py sync BTCUSDT 1m 90   # Keep the last 90 days
+    python3 polymarket-bot/candle_store.py info BTCUSDT 1m
+"""
+
+import os
+import sys
+import json
+import time
+import fcntl
+import random
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CANDLE_DIR = "polymarket-bot/candles"
+BINANCE_KLINES = "https://api.binance.com/api/v3/klines"
+COLUMNS = ("open", "high", "low", "close", "volume")
+KLINE_LIMIT = 1000          # Max candles per Binance request
+RETRIES = 4
+CLOSE_GRACE_MS = 3_000           # Binance may publish / finalize a candle a moment after its close
+REFETCH_MISSING_MS = 3_600_000   # Trailing NaN rows this recent are asked for again; older ones are real gaps
+INTERVAL_MS = {"1m": 60_000, "3m": 180_000, "5m": 300_000, "15m": 900_000, "30m": 1_800_000,
+               "1h": 3_600_000, "2h": 7_200_000, "4h": 14_400_000, "1d": 86_400_000}
+
+
+class CandleStore:
+    """Memory-mapped candles of one symbol / interval"""
+
+    def __init__(self, symbol: str = "BTCUSDT", interval: str = "1m", root: str = CANDLE_DIR):
+        self.symbol = symbol.upper()
+        self.interval = interval
+        self.interval_ms = INTERVAL_MS[interval]
+        self.path = os.path.join(root, self.symbol, interval)
+        self.meta_file = os.path.join(self.path, "meta.json")
+        self.base_ms = 0
+        self.count = 0
+        self.generation = 0
+        self.cols: Dict[str, np.ndarray] = {}
+        self._meta_mtime = None
+        self.refresh()
+
+    # --- Reading ---
+
+    def refresh(self) -> bool:
+        """Re-map if another process appended. Returns True if anything changed."""
+        try:
+            st = os.stat(self.meta_file)
+            mtime = (st.st_ino, st.st_mtime_ns) # meta.json is replaced, never edited
+        except OSError:
+            return False
+        if mtime == self._meta_mtime:
+            return False
+        with open(self.meta_file, "r") as f:
+            meta = json.load(f)
+        self._meta_mtime = mtime
+        self.base_ms, self.count, self.generation = meta["base_ms"], meta["count"], meta["generation"]
+        # Plain ndarray views of the mappings (memmap subclass indexing is slower)
+        self.cols = {c: np.memmap(self._col_file(c), dtype=np.float64, mode="r", shape=(self.count,)).view(np.ndarray)
+                     for c in COLUMNS} if self.count else {}
+        return True
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def start_ms(self) -> int:
+        return self.base_ms
+
+    @property
+    def end_ms(self) -> int:
+        """Open time after the last stored candle"""
+        return self.base_ms + self.count * self.interval_ms
+
+    def index(self, ts_ms: int) -> int:
+        """Row of the candle containing ts_ms, -1 if not stored (re-maps once if past the end)"""
+        i = (int(ts_ms) - self.base_ms) // self.interval_ms
+        if i >= self.count and self.refresh():
+            i = (int(ts_ms) - self.base_ms) // self.interval_ms
+        return i if 0 <= i < self.count else -1
+
+    def get(self, ts_ms: int) -> Optional[Tuple[float, float, float, float, float]]:
+        """(open, high, low, close, volume) of the candle containing ts_ms, O(1)"""
+        i = self.index(ts_ms)
+        if i < 0: return None
+        candle = tuple(float(self.cols[c][i]) for c in COLUMNS)
+        return None if candle[0] != candle[0] else candle # NaN row = missing candle
+
+    def open_at(self, ts_ms: int) -> Optional[float]:
+        i = self.index(ts_ms)
+        if i < 0: return None
+        price = float(self.cols["open"][i])
+        return None if price != price else price
+
+    def missing_tail(self, since_ms: int) -> int:
+        """Open time of the first row of the trailing NaN run after since_ms (end_ms if none)"""
+        self.refresh()
+        lo = max(0, (int(since_ms) - self.base_ms) // self.interval_ms)
+        i = self.count
+        opens = self.cols["open"] if self.count else None
+        while i > lo and opens[i - 1] != opens[i - 1]: i -= 1
+        return self.base_ms + i * self.interval_ms
+
+    def range(self, start_ms: int, end_ms: int) -> Dict[str, np.ndarray]:
+        """Column views (no copy) of the candles opening in [start_ms, end_ms), plus "time" """
+        self.refresh()
+        lo = max(0, -(-(int(start_ms) - self.base_ms) // self.interval_ms))
+        hi = min(self.count, max(lo, -(-(int(end_ms) - self.base_ms) // self.interval_ms)))
+        out = {c: self.cols[c][lo:hi] for c in COLUMNS} if self.count else {c: np.empty(0) for c in COLUMNS}
+        out["time"] = self.base_ms + np.arange(lo, hi, dtype=np.int64) * self.interval_ms
+        return out
+
+    # --- Writing ---
+
+    def _col_file(self, col: str, generation: Optional[int] = None) -> str:
+        return os.path.join(self.path, f"{col}.{self.generation if generation is None else generation}.f8")
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._meta_mtime = None
+                self.refresh() # Another writer may have moved on
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write_meta(self, base_ms: int, count: int, generation: int):
+        tmp = self.meta_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"symbol": self.symbol, "interval": self.interval, "base_ms": base_ms,
+                       "count": count, "generation": generation, "columns": list(COLUMNS)}, f)
+        os.replace(tmp, self.meta_file)
+        self._meta_mtime = None
+        self.refresh()
+
+    def _grid(self, rows: Iterable, start_ms: int, end_ms: int) -> np.ndarray:
+        """Binance kline rows -> dense (n, 5) block covering [start_ms, end_ms), NaN where missing"""
+        n = (end_ms - start_ms) // self.interval_ms
+        block = np.full((n, len(COLUMNS)), np.nan)
+        for row in rows:
+            i = (int(row[0]) - start_ms) // self.interval_ms
+            if 0 <= i < n:
+                block[i] = [float(x) for x in row[1:6]]
+        return block
+
+    def write(self, rows: Iterable, start_ms: int, end_ms: int) -> int:
+        """
+        Store kline rows covering [start_ms, end_ms) (grid aligned). Appends after
+        the last candle or prepends before the first; already stored rows are kept,
+        stored NaN rows are filled if `rows` has them. Returns the number of new rows.
+        """
+        rows = list(rows)
+        with self._locked():
+            if not self.count:
+                block = self._grid(rows, start_ms, end_ms)
+                self._append_block(block, base_ms=start_ms)
+                return len(block)
+            added = self._fill_missing(rows, max(start_ms, self.start_ms), min(end_ms, self.end_ms))
+            if start_ms < self.start_ms:
+                block = self._grid(rows, start_ms, self.start_ms)
+                self._prepend_block(block)
+                added += len(block)
+            if end_ms > self.end_ms:
+                block = self._grid(rows, self.end_ms, end_ms)
+                self._append_block(block, base_ms=self.base_ms)
+                added += len(block)
+            return added
+
+    def _append_block(self, block: np.ndarray, base_ms: int):
+        if not len(block): return
+        for j, c in enumerate(COLUMNS):
+            with open(self._col_file(c), "ab") as f:
+                f.truncate(self.count * 8) # Drop bytes of an interrupted write (not in meta)
+                f.write(np.ascontiguousarray(block[:, j]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        self._write_meta(base_ms, self.count + len(block), self.generation)
+
+    def _fill_missing(self, rows: list, start_ms: int, end_ms: int) -> int:
+        """Write rows over stored NaN rows in [start_ms, end_ms), in place (readers' maps see them)"""
+        if end_ms <= start_ms: return 0
+        block = self._grid(rows, start_ms, end_ms)
+        lo = (start_ms - self.base_ms) // self.interval_ms
+        idx = np.nonzero(np.isnan(self.cols["open"][lo:lo + len(block)]) & ~np.isnan(block[:, 0]))[0]
+        if not len(idx): return 0
+        for j, c in enumerate(COLUMNS):
+            with open(self._col_file(c), "r+b") as f:
+                for i in idx:
+                    f.seek((lo + int(i)) * 8)
+                    f.write(block[i, j].tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        return len(idx)
+
+    def _prepend_block(self, block: np.ndarray):
+        """Older history: new generation of column files, then switch meta"""
+        if not len(block): return
+        gen = self.generation + 1
+        for j, c in enumerate(COLUMNS):
+            with open(self._col_file(c, gen), "wb") as f:
+                f.write(np.ascontiguousarray(block[:, j]).tobytes())
+                f.write(np.asarray(self.cols[c]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        old = self.generation
+        self._write_meta(self.base_ms - len(block) * self.interval_ms, self.count + len(block), gen)
+        for c in COLUMNS: # Readers still mapping the old files keep their (unlinked) inode
+            try: os.remove(self._col_file(c, old))
+            except OSError: pass
+
+    def info(self) -> dict:
+        self.refresh()
+        missing = int(np.isnan(self.cols["open"]).sum()) if self.count else 0
+        return {"symbol": self.symbol, "interval": self.interval, "candles": self.count, "missing": missing,
+                "start": time.strftime("%Y-%m-%d %H:%M", time.gmtime(self.start_ms / 1000)) if self.count else None,
+                "end": time.strftime("%Y-%m-%d %H:%M", time.gmtime(self.end_ms / 1000)) if self.count else None}
+
+
+# --- Binance sync ---
+
+class RateLimiter:
+    """Async token bucket shared by all tasks talking to one host"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, cost: float = 1.0):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return
+                await asyncio.sleep((cost - self.tokens) / self.rate)
+
+
+async def get_json(client, limiter: RateLimiter, url: str, params: dict, cost: float = 1.0):
+    """GET with rate limiting; retries 429 / 5xx (honouring Retry-After) and network errors"""
+    import httpx
+    for attempt in range(RETRIES):
+        await limiter.acquire(cost)
+        try:
+            resp = await client.get(url, params=params)
+        except httpx.TransportError:
+            if attempt == RETRIES - 1: raise
+            await asyncio.sleep(2 ** attempt + random.random())
+            continue
+        if (resp.status_code == 429 or resp.status_code >= 500) and attempt < RETRIES - 1:
+            await asyncio.sleep(float(resp.headers.get("Retry-After", 2 ** attempt + random.random())))
+            continue
+        resp.raise_for_status()
+        return resp.json()
+
+
+async def sync(store: CandleStore, start_ms: int, end_ms: Optional[int] = None, client=None,
+               limiter: Optional[RateLimiter] = None, concurrency: int = 8) -> int:
+    """
+    Make the store cover [start_ms, end_ms) (default: up to the last closed candle).
+    Only ranges that are not stored yet (or recent NaN rows) are requested. Returns new rows.
+    """
+    import httpx
+    step = store.interval_ms
+    start_ms = (int(start_ms) // step) * step
+    closed_ms = ((int(time.time() * 1000) - CLOSE_GRACE_MS) // step) * step # Never store a candle still forming
+    end_ms = min(closed_ms, closed_ms if end_ms is None else (int(end_ms) // step) * step)
+    store.refresh()
+    if store.count:
+        tail_ms = store.missing_tail(closed_ms - REFETCH_MISSING_MS)
+        ranges = [(start_ms, min(end_ms, store.start_ms)), (tail_ms, end_ms)]
+    else:
+        ranges = [(start_ms, end_ms)]
+    ranges = [(a, b) for a, b in ranges if b > a]
+    if not ranges: return 0
+
+    # Binance allows 6000 weight/min: default bucket 40 weight/s (klines cost 2)
+    limiter = limiter or RateLimiter(40.0)
+    sem = asyncio.Semaphore(concurrency)
+    own_client = client is None
+    client = client or httpx.AsyncClient(timeout=10)
+    try:
+        async def fetch(chunk_start: int, chunk_end: int):
+            params = {"symbol": store.symbol, "interval": store.interval, "startTime": chunk_start,
+                      "endTime": chunk_end - 1, "limit": KLINE_LIMIT}
+            async with sem:
+                return await get_json(client, limiter, BINANCE_KLINES, params, cost=2)
+
+        added = 0
+        for a, b in ranges:
+            chunks = [(c, min(c + KLINE_LIMIT * step, b)) for c in range(a, b, KLINE_LIMIT * step)]
+            results = await asyncio.gather(*(fetch(*c) for c in chunks))
+            rows = [row for part in results for row in part]
+            # File writes are small and sequential: fine off the loop
+            added += await asyncio.to_thread(store.write, rows, a, b)
+        return added
+    finally:
+        if own_client: await client.aclose()
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "info"
+    symbol = sys.argv[2] if len(sys.argv) > 2 else "BTCUSDT"
+    interval = sys.argv[3] if len(sys.argv) > 3 else "1m"
+    store = CandleStore(symbol, interval)
+    if cmd == "sync":
+        days = float(sys.argv[4]) if len(sys.argv) > 4 else 30
+        t0 = time.time()
+        n = asyncio.run(sync(store, int((time.time() - days * 86400) * 1000)))
+        print(f"✅ +{n} 根 K线 ({time.time() - t0:.1f}s)")
+    print(json.dumps(store.info(), indent=2))
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Local Stand-in CLOB
+- Speaks the parts of the Polymarket CLOB that the bot uses: REST order entry
+  (/order, /orders, cancel, /data/order/<id>, tick size / neg risk / fee rate)
+  and the authenticated user channel (order + trade events) over a websocket.
+- Signed orders from the real ClobClient are accepted as-is (no signature or
+  auth checks) and matched against seeded liquidity; whatever does not cross
+  rests and can be filled later with fill().
+- Everything runs on localhost, so order_manager.py can be driven through
+  thousands of submit / fill / cancel cycles without touching the network.
+
+Usage:
+    python3 polymarket-bot/clob_standin.py [http_port] [ws_port]
+"""
+
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+import websockets
+
+UNIT = 1_000_000 # Order amounts are 6-decimal fixed point
+
+
+class StandInClob:
+    """In-memory exchange behind a local REST server and user-channel websocket"""
+
+    def __init__(self, host: str = "127.0.0.1", http_port: int = 0, ws_port: int = 0, tick_size: str = "0.01"):
+        self.bind = host
+        self.http_port = http_port
+        self.ws_port = ws_port
+        self.tick_size = tick_size
+        self.lock = threading.Lock()
+        # Outside liquidity per token: {"asks": {price: size}, "bids": {price: size}}
+        self.liquidity: Dict[str, Dict[str, Dict[float, float]]] = {}
+        self.markets: Dict[str, str] = {}   # token -> condition id
+        self.orders: Dict[str, dict] = {}   # Our orders by id
+        self.trade_ids = itertools.count(1)
+        self.clients = set()
+        self.loop = None
+        self.http = None
+        self.ws_server = None
+        self.requests = 0
+
+    @property
+    def host(self) -> str:
+        return f"http://{self.bind}:{self.http_port}"
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.bind}:{self.ws_port}/ws/user"
+
+    # --- Test controls ---
+
+    def seed(self, token_id: str, asks: Iterable[Tuple[float, float]] = (), bids: Iterable[Tuple[float, float]] = (),
+             market: str = "0xstandin"):
+        """Set the outside liquidity of a token"""
+        with self.lock:
+            self.liquidity[token_id] = {"asks": dict(asks), "bids": dict(bids)}
+            self.markets[token_id] = market
+
+    def fill(self, order_id: str, size: Optional[float] = None) -> float:
+        """An outside taker hits one of our resting orders. Returns the size filled."""
+        with self.lock:
+            o = self.orders.get(order_id)
+            if o is None or o["status"] != "LIVE": return 0.0
+            take = min(size if size is not None else o["remaining"], o["remaining"])
+            events = self._match_resting(o, take)
+        self._publish(events)
+        return take
+
+    # --- Lifecycle ---
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.ws_server = await websockets.serve(self._ws_handler, self.bind, self.ws_port)
+        self.ws_port = self.ws_server.sockets[0].getsockname()[1]
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True # Headers and body are separate writes: no 40ms delayed-ACK stalls
+
+            def log_message(self, *args): pass
+
+            def _reply(self, body, status=200):
+                raw = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _body(self):
+                n = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(n)) if n else None
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                status, body = standin.handle("GET", url.path, parse_qs(url.query), None)
+                self._reply(body, status)
+
+            def do_POST(self):
+                status, body = standin.handle("POST", urlparse(self.path).path, {}, self._body())
+                self._reply(body, status)
+
+            def do_DELETE(self):
+                status, body = standin.handle("DELETE", urlparse(self.path).path, {}, self._body())
+                self._reply(body, status)
+
+        self.http = ThreadingHTTPServer((self.bind, self.http_port), Handler)
+        self.http.daemon_threads = True
+        self.http_port = self.http.server_address[1]
+        threading.Thread(target=self.http.serve_forever, name="clob-standin", daemon=True).start()
+
+    async def stop(self):
+        if self.http:
+            self.http.shutdown()
+            self.http.server_close()
+        if self.ws_server:
+            self.ws_server.close()
+            await self.ws_server.wait_closed()
+
+    # --- REST ---
+
+    def handle(self, method: str, path: str, query: dict, body) -> Tuple[int, object]:
+        self.requests += 1
+        if method == "GET":
+            if path == "/tick-size": return 200, {"minimum_tick_size": self.tick_size}
+            if path == "/neg-risk": return 200, {"neg_risk": False}
+            if path == "/fee-rate": return 200, {"base_fee": 0}
+            if path == "/time": return 200, int(time.time())
+            if path.startswith("/data/order/"):
+                with self.lock:
+                    o = self.orders.get(path.rsplit("/", 1)[1])
+                    return (200, self._order_view(o)) if o else (404, {"error": "order not found"})
+        elif method == "POST":
+            if path == "/order": return 200, self._post(body)
+            if path == "/orders": return 200, [self._post(b) for b in body]
+        elif method == "DELETE":
+            if path == "/order": return 200, self._cancel([body["orderID"]])
+            if path == "/orders": return 200, self._cancel(body)
+            if path == "/cancel-all":
+                with self.lock: ids = [i for i, o in self.orders.items() if o["status"] == "LIVE"]
+                return 200, self._cancel(ids)
+        return 404, {"error": f"{method} {path} not supported by the stand-in"}
+
+    def _post(self, body: dict) -> dict:
+        signed, order_type = body["order"], body.get("orderType", "GTC")
+        maker, taker = int(signed["makerAmount"]), int(signed["takerAmount"])
+        side = signed["side"]
+        # BUY pays USDC (maker) for shares (taker); SELL the other way round
+        size = (taker if side == "BUY" else maker) / UNIT
+        price = round((maker / taker if side == "BUY" else taker / maker), 6)
+        order_id = "0x" + hashlib.sha256(signed["signature"].encode()).hexdigest()
+        token = signed["tokenId"]
+        with self.lock:
+            if order_id in self.orders:
+                return {"success": False, "errorMsg": "order already exists", "orderID": order_id}
+            o = {"id": order_id, "asset_id": token, "market": self.markets.get(token, "0xstandin"), "side": side,
+                 "price": price, "original_size": size, "remaining": size, "matched": 0.0, "status": "LIVE",
+                 "type": order_type, "created_at": int(time.time())}
+            if body.get("postOnly") and self._crosses(o):
+                return {"success": False, "errorMsg": "invalid post-only order: order crosses book", "orderID": ""}
+            if order_type == "FOK" and self._available(o) + 1e-9 < size:
+                return {"success": False, "errorMsg": "order couldn't be fully filled. FOK orders are fully filled or killed.",
+                        "orderID": ""}
+            self.orders[order_id] = o
+            events = [self._order_event(o, "PLACEMENT")]
+            events += self._match_incoming(o)
+            if o["remaining"] > 1e-9 and order_type in ("FOK", "FAK"):
+                o["status"] = "CANCELED"
+                events.append(self._order_event(o, "CANCELLATION"))
+            elif o["remaining"] <= 1e-9:
+                o["status"] = "MATCHED"
+            status = "matched" if o["matched"] > 0 else ("live" if o["status"] == "LIVE" else "unmatched")
+            making = o["matched"] * price if side == "BUY" else o["matched"]
+            taking = o["matched"] if side == "BUY" else o["matched"] * price
+            resp = {"success": True, "errorMsg": "", "orderID": order_id, "status": status,
+                    "makingAmount": f"{making:.6f}", "takingAmount": f"{taking:.6f}", "transactionsHashes": []}
+        self._publish(events)
+        return resp
+
+    def _cancel(self, ids: List[str]) -> dict:
+        canceled, not_canceled, events = [], {}, []
+        with self.lock:
+            for i in ids:
+                o = self.orders.get(i)
+                if o is None:
+                    not_canceled[i] = "order not found"
+                elif o["status"] != "LIVE":
+                    not_canceled[i] = "order can't be found - already canceled or matched"
+                else:
+                    o["status"] = "CANCELED"
+                    canceled.append(i)
+                    events.append(self._order_event(o, "CANCELLATION"))
+        self._publish(events)
+        return {"canceled": canceled, "not_canceled": not_canceled}
+
+    # --- Matching (caller holds the lock) ---
+
+    def _levels(self, o: dict) -> Dict[float, float]:
+        book = self.liquidity.setdefault(o["asset_id"], {"asks": {}, "bids": {}})
+        return book["asks"] if o["side"] == "BUY" else book["bids"]
+
+    def _crossing(self, o: dict) -> List[float]:
+        levels = self._levels(o)
+        if o["side"] == "BUY":
+            return sorted(p for p in levels if p <= o["price"] + 1e-9)
+        return sorted((p for p in levels if p >= o["price"] - 1e-9), reverse=True)
+
+    def _crosses(self, o: dict) -> bool:
+        return bool(self._crossing(o))
+
+    def _available(self, o: dict) -> float:
+        levels = self._levels(o)
+        return sum(levels[p] for p in self._crossing(o))
+
+    def _match_incoming(self, o: dict) -> List[dict]:
+        """Our order as taker: sweep crossing outside liquidity, best price first"""
+        levels, events = self._levels(o), []
+        for p in self._crossing(o):
+            if o["remaining"] <= 1e-9: break
+            take = min(levels[p], o["remaining"])
+            levels[p] -= take
+            if levels[p] <= 1e-9: del levels[p]
+            o["remaining"] -= take
+            o["matched"] += take
+            events.append({"event_type": "trade", "type": "TRADE", "id": f"t{next(self.trade_ids)}",
+                           "taker_order_id": o["id"], "maker_orders": [], "asset_id": o["asset_id"],
+                           "market": o["market"], "side": o["side"], "price": f"{p}", "size": f"{take}",
+                           "status": "MATCHED", "timestamp": str(int(time.time()))})
+        if events:
+            events.append(self._order_event(o, "UPDATE"))
+        return events
+
+    def _match_resting(self, o: dict, take: float) -> List[dict]:
+        """Our resting order as maker"""
+        o["remaining"] -= take
+        o["matched"] += take
+        if o["remaining"] <= 1e-9: o["status"] = "MATCHED"
+        trade = {"event_type": "trade", "type": "TRADE", "id": f"t{next(self.trade_ids)}",
+                 "taker_order_id": f"ext-{next(self.trade_ids)}", "asset_id": o["asset_id"], "market": o["market"],
+                 "side": "SELL" if o["side"] == "BUY" else "BUY", "price": f"{o['price']}", "size": f"{take}",
+                 "maker_orders": [{"order_id": o["id"], "matched_amount": f"{take}", "price": f"{o['price']}",
+                                   "asset_id": o["asset_id"]}],
+                 "status": "MATCHED", "timestamp": str(int(time.time()))}
+        return [trade, self._order_event(o, "UPDATE")]
+
+    def _order_event(self, o: dict, kind: str) -> dict:
+        return {"event_type": "order", "type": kind, **self._order_view(o), "timestamp": str(int(time.time()))}
+
+    @staticmethod
+    def _order_view(o: dict) -> dict:
+        return {"id": o["id"], "status": o["status"], "asset_id": o["asset_id"], "market": o["market"],
+                "side": o["side"], "price": f"{o['price']}", "original_size": f"{o['original_size']}",
+                "size_matched": f"{o['matched']}", "order_type": o["type"], "created_at": o["created_at"]}
+
+    # --- User channel ---
+
+    def _publish(self, events: List[dict]):
+        if events and self.loop:
+            self.loop.call_soon_threadsafe(self._broadcast, json.dumps(events))
+
+    def _broadcast(self, raw: str):
+        for ws in list(self.clients):
+            asyncio.ensure_future(self._send(ws, raw))
+
+    @staticmethod
+    async def _send(ws, raw: str):
+        try:
+            await ws.send(raw)
+        except Exception:
+            pass
+
+    async def _ws_handler(self, ws):
+        subscribed = False
+        try:
+            async for msg in ws:
+                if msg == "PING":
+                    await ws.send("PONG")
+                    continue
+                data = json.loads(msg)
+                if data.get("type") == "user" and data.get("auth"):
+                    subscribed = True
+                    self.clients.add(ws)
+        finally:
+            if subscribed: self.clients.discard(ws)
+
+
+async def _serve(http_port: int, ws_port: int):
+    standin = StandInClob(http_port=http_port, ws_port=ws_port)
+    await standin.start()
+    print(f"Stand-in CLOB: REST {standin.host} | user channel {standin.ws_url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_serve(int(sys.argv[1]) if len(sys.argv) > 1 else 8080, int(sys.argv[2]) if len(sys.argv) > 2 else 8081))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Persistent Polymarket Market Stream
+- One long-lived connection to the CLOB market channel for every market the bot trades.
+- Assets are added / removed per cycle with subscribe / unsubscribe operations.
+- Text PING heartbeats; a missing PONG forces a reconnect (exponential backoff).
+- After every (re)connect all books are resynced from hash-checked REST snapshots.
+- is_stale() tells the trade loop when books cannot be trusted.
+"""
+
+import json
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+import websockets
+
+logger = logging.getLogger(__name__)
+
+CLOB_HOST = "https://clob.polymarket.com"
+WS_URL = "wss://ws-subscriptions-clob.polymarket.com/ws/market"
+
+
+def fetch_book_snapshot(token_id: str, host: str = CLOB_HOST) -> Optional[dict]:
+    """REST order book snapshot (blocking, call from a worker thread)"""
+    resp = requests.get(f"{host}/book", params={"token_id": token_id}, timeout=5)
+    return resp.json() if resp.status_code == 200 else None
+
+
+class ClobMarketStream:
+    """
+    Multiplexed market-channel connection.
+
+    Books are any objects with `asset_id`, `update(msg)`, `load_snapshot(raw)`,
+    `needs_resync` and `depth.synced` (see OrderBook in btc_15m_bot_v3.py).
+    """
+
+    def __init__(self, url: str = WS_URL, ping_interval: float = 10.0, stale_after: float = 30.0):
+        self.url = url
+        self.ping_interval = ping_interval
+        self.stale_after = stale_after
+        self.books: Dict[str, object] = {}
+        self.listeners: Dict[str, Callable[[], None]] = {}
+        self.taps: List[Callable[[dict], None]] = [] # Every event, after it was applied to the books
+        self.recorder = None # recorder.MarketRecorder: keeps raw messages + REST snapshots
+        self.ws = None
+        self.running = False
+        self.connected = False
+        self.last_msg_at = 0.0
+        self.last_pong_at = 0.0
+        self.reconnects = 0
+        self.resyncing = set()
+        self.last_resync: Dict[str, float] = {}
+        self.has_assets = asyncio.Event() # Only hold a connection while something is subscribed
+
+    # --- Subscriptions ---
+
+    async def subscribe(self, books: Iterable, on_update: Optional[Callable[[], None]] = None):
+        new_ids = []
+        for book in books:
+            self.books[book.asset_id] = book
+            if on_update: self.listeners[book.asset_id] = on_update
+            new_ids.append(book.asset_id)
+        if new_ids: self.has_assets.set()
+        if self.connected and new_ids:
+            await self._send({"assets_ids": new_ids, "operation": "subscribe"})
+
+    async def unsubscribe(self, asset_ids: Iterable[str]):
+        ids = [a for a in asset_ids if a in self.books]
+        for a in ids:
+            self.books.pop(a, None)
+            self.listeners.pop(a, None)
+            self.last_resync.pop(a, None)
+        if self.connected and ids:
+            await self._send({"assets_ids": ids, "operation": "unsubscribe"})
+
+    def set_listener(self, asset_ids: Iterable[str], on_update: Optional[Callable[[], None]]):
+        for a in asset_ids:
+            if on_update: self.listeners[a] = on_update
+            else: self.listeners.pop(a, None)
+
+    def is_stale(self, asset_ids: Iterable[str]) -> bool:
+        """True if the connection is down/silent or any of the books is not in sync"""
+        if not self.connected or time.time() - self.last_msg_at > self.stale_after:
+            return True
+        for a in asset_ids:
+            book = self.books.get(a)
+            if book is None or book.needs_resync or not book.depth.synced:
+                return True
+        return False
+
+    # --- Connection ---
+
+    async def run(self):
+        self.running = True
+        backoff = 1
+        while self.running:
+            await self.has_assets.wait()
+            try:
+                async with websockets.connect(self.url, ping_interval=None, max_queue=None) as ws:
+                    self.ws = ws
+                    self.connected = True
+                    self.last_msg_at = self.last_pong_at = time.time()
+                    backoff = 1
+                    logger.info(f"📡 Polymarket WS 已连接 ({len(self.books)} 个资产)")
+
+                    await self._send({"assets_ids": list(self.books), "type": "market"})
+                    self._resync_all()
+
+                    heartbeat = asyncio.create_task(self._heartbeat(ws))
+                    try:
+                        async for msg in ws:
+                            self._on_message(msg)
+                    finally:
+                        heartbeat.cancel()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Polymarket WS error: {e}")
+
+            self.connected = False
+            self.ws = None
+            # Anything received from now on is a gap: books must be resynced
+            for book in self.books.values(): book.needs_resync = True
+
+            if not self.books: self.has_assets.clear()
+            if self.running:
+                self.reconnects += 1
+                logger.warning(f"⚠️ Polymarket WS 断开，{backoff}s 后重连 (第 {self.reconnects} 次)")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+
+    async def _heartbeat(self, ws):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            if time.time() - self.last_pong_at > 3 * self.ping_interval:
+                logger.warning("⚠️ Polymarket WS 心跳超时，强制重连")
+                await ws.close()
+                return
+            await ws.send("PING")
+
+    async def _send(self, msg: dict):
+        try:
+            await self.ws.send(json.dumps(msg))
+        except Exception as e:
+            logger.warning(f"Polymarket WS send failed: {e}")
+
+    async def close(self):
+        self.running = False
+        if self.ws: await self.ws.close()
+
+    # --- Messages ---
+
+    def _on_message(self, msg):
+        self.last_msg_at = time.time()
+        if msg == "PONG":
+            self.last_pong_at = self.last_msg_at
+            return
+        try:
+            data = json.loads(msg)
+        except ValueError:
+            logger.debug(f"Non-JSON WS message: {msg[:100]}")
+            return
+
+        touched = set()
+        for event in (data if isinstance(data, list) else [data]):
+            try:
+                self._process(event, touched)
+                for tap in self.taps: tap(event)
+            except Exception as e:
+                logger.error(f"WS message error: {e}")
+
+        if self.recorder: self.recorder.record("clob_market", msg, ",".join(sorted(touched)))
+
+        callbacks = {self.listeners[a] for a in touched if a in self.listeners}
+        for cb in callbacks: cb()
+
+        for a in touched:
+            book = self.books.get(a)
+            if book is not None and book.needs_resync and a not in self.resyncing \
+                    and time.time() - self.last_resync.get(a, 0) > 2:
+                self._schedule_resync(book)
+
+    def _process(self, data: dict, touched: set):
+        if data.get("event_type") == "price_change":
+            # One message can carry changes for several assets
+            for a in {c.get("asset_id") for c in data.get("price_changes", [])}:
+                book = self.books.get(a)
+                if book is not None:
+                    book.update(data)
+                    touched.add(a)
+        else:
+            book = self.books.get(data.get("asset_id"))
+            if book is not None:
+                book.update(data)
+                touched.add(book.asset_id)
+
+    # --- Resync ---
+
+    def _resync_all(self):
+        for book in list(self.books.values()):
+            if book.asset_id not in self.resyncing:
+                self._schedule_resync(book)
+
+    def _schedule_resync(self, book):
+        self.resyncing.add(book.asset_id)
+        self.last_resync[book.asset_id] = time.time()
+        asyncio.create_task(self._resync(book))
+
+    async def _resync(self, book):
+        """Reload a book from a hash-checked REST snapshot"""
+        try:
+            raw = await asyncio.to_thread(fetch_book_snapshot, book.asset_id)
+            if raw and book.load_snapshot(raw):
+                if self.recorder: self.recorder.record("clob_book", json.dumps(raw), book.asset_id)
+                logger.info(f"🔄 订单簿已重新同步: {book.asset_id[:10]}...")
+                cb = self.listeners.get(book.asset_id)
+                if cb: cb()
+        except Exception as e:
+            logger.error(f"Book resync error: {e}")
+        finally:
+            self.resyncing.discard(book.asset_id)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Event-Driven Decision Trigger
+- Book updates and BTC ticks mark the market 'dirty'.
+- The trade loop wakes up right away, debounced by a minimum re-evaluation interval.
+- Tick-to-decision latency is recorded in log-spaced histograms (ms) so the
+  event-driven mode can be compared against the old 2s polling loop.
+"""
+
+import time
+import asyncio
+from bisect import bisect_left
+from typing import Optional, Tuple
+
+# Upper bounds of the histogram buckets in milliseconds (last bucket is open-ended)
+LATENCY_BUCKETS_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2000, 5000)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram, O(log buckets) per sample"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float):
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+        if ms > self.max_ms: self.max_ms = ms
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket containing the q-th percentile"""
+        if self.total == 0: return 0.0
+        target = q * self.total
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(LATENCY_BUCKETS_MS[i], self.max_ms) if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def summary(self) -> str:
+        if self.total == 0: return f"{self.name}: n=0"
+        return (
+            f"{self.name}: n={self.total} avg={self.sum_ms / self.total:.1f}ms "
+            f"p50<={self.percentile(0.5):g}ms p90<={self.percentile(0.9):g}ms "
+            f"p99<={self.percentile(0.99):g}ms max={self.max_ms:.1f}ms"
+        )
+
+
+class DecisionTrigger:
+    """Coalesces market events into debounced evaluations"""
+
+    def __init__(self, min_interval: float = 0.1):
+        self.min_interval = min_interval
+        self.event = asyncio.Event()
+        self.pending: Optional[Tuple[float, str]] = None  # (perf_counter, source) of oldest unhandled tick
+        self.last_eval = 0.0
+        self.histograms = {
+            "book": LatencyHistogram("Book→Decision"),
+            "btc": LatencyHistogram("BTC→Decision"),
+        }
+
+    def mark_dirty(self, source: str = "book"):
+        """Called from the WS / price feed callbacks for every update"""
+        if self.pending is None:
+            self.pending = (time.perf_counter(), source)
+        self.event.set()
+
+    def take(self) -> Optional[Tuple[float, str]]:
+        """Claim the pending tick (if any) for the evaluation that starts now"""
+        pending, self.pending = self.pending, None
+        self.event.clear()
+        self.last_eval = time.perf_counter()
+        return pending
+
+    async def wait(self, timeout: float = 1.0) -> Optional[Tuple[float, str]]:
+        """
+        Wait until the market is dirty (or `timeout` elapses, so time-based
+        checks like expiry still run), respecting the minimum interval.
+        """
+        gap = self.min_interval - (time.perf_counter() - self.last_eval)
+        if gap > 0:
+            await asyncio.sleep(gap)
+        if not self.event.is_set():
+            try:
+                await asyncio.wait_for(self.event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.take()
+
+    def decided(self, pending: Optional[Tuple[float, str]]):
+        """Record tick-to-decision latency once an evaluation has finished"""
+        if pending is None: return
+        ts, source = pending
+        self.histograms[source].record((time.perf_counter() - ts) * 1000.0)
+
+    def summary(self) -> str:
+        return " | ".join(h.summary() for h in self.histograms.values())
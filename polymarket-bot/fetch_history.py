@@ -1,162 +1,209 @@
-import requests
+#!/usr/bin/env python3
+"""
+Historical Market Ingestion
+- Probes the Gamma API for every past cycle of a recurring up/down market
+  (market_registry slug rules) with bounded concurrency and a shared rate limiter.
+- Resolved results are checkpointed, so an interrupted run continues where it
+  stopped (markets already in the trade journal are skipped too).
+- Binance 1m klines come from the local candle store (candle_store.py), which
+  only downloads ranges it does not have yet (1000 candles per request):
+  strike = open of the cycle's first minute, prev_trend = move of the previous cycle.
+- Results are appended to the trade journal as synthetic SETTLED trades for training.
+
+Usage:
+    python3 polymarket-bot/fetch_history.py [--days 90] [--market btc-15m] [--concurrency 16] [--rate 40]
+"""
+
+import os
 import json
 import time
-import os
-from datetime import datetime, timezone, timedelta
+import asyncio
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from trade_journal import TradeJournal
+from market_registry import REGISTRY, MarketSpec
+from candle_store import CandleStore, RateLimiter, get_json, sync as sync_candles
 
 GAMMA_API = "https://gamma-api.polymarket.com"
+CHECKPOINT_FILE = "polymarket-bot/cache/fetch_history_{market}.json"
+MINUTE_MS = 60_000
 
-# Fetch past 24h of BTC 15m markets
-# We need to reconstruct the "slugs" or just search by tag/series
-# Series slug: "btc-up-or-down-15m" (From previous inspect)
 
-def fetch_historical_markets():
-    print("Fetching historical markets from Gamma API...")
-    
-    # Calculate timestamps
-    now = int(time.time())
-    # Extended: Look back 30 days to get massive data for V6
-    start_ts = now - (86400 * 30) 
-    
-    # Align to 15m
-    start_ts = (start_ts // 900) * 900
-    
-    # Load existing slugs to avoid duplicates
-    existing_slugs = set()
-    if os.path.exists("polymarket-bot/paper_trades.jsonl"):
-        with open("polymarket-bot/paper_trades.jsonl", "r") as f:
-            for line in f:
-                try:
-                    rec = json.loads(line)
-                    if "market" in rec: existing_slugs.add(rec["market"])
-                except: pass
-    print(f"Found {len(existing_slugs)} existing records. Skipping duplicates.")
-
-    markets_data = []
-    
-    # Iterate
-    start_time = time.time()
-    count = 0
-    
-    for ts in range(start_ts, now, 900):
-        # SELF-PROTECTION: Exit if running longer than 120 seconds
-        if time.time() - start_time > 120:
-             print("⏳ Time limit reached (120s). Stopping to prevent crash.")
-             break
-             
-        slug = f"btc-updown-15m-{ts}"
-        
-        if slug in existing_slugs:
-            continue
-            
-        try:
-            resp = requests.get(f"{GAMMA_API}/events?slug={slug}", timeout=5)
-            data = resp.json()
-            
-            if not data:
-                print(f"Skipping {slug} (No data)")
-                continue
-                
-            event = data[0]
-            market = event.get("markets", [])[0]
-            
-            # We need: Strike Price, End Price (Resolution), and Result
-            # Strike Price is not explicitly in API, but it's the Open Price of the candle at StartTime
-            # We will fetch that from Binance later.
-            
-            # Result: "outcomePrices": "[\"1\", \"0\"]" -> UP won
-            prices = json.loads(market.get("outcomePrices", '["0.5", "0.5"]'))
-            winner = "UP" if prices[0] == "1" else "DOWN" if prices[1] == "1" else "UNKNOWN"
-            
-            if winner == "UNKNOWN": continue
-            
-            start_time_iso = event.get("startDate") # 2026-01-27T18:30:00Z
-            
-            markets_data.append({
-                "ts": ts,
-                "start_time": start_time_iso,
-                "winner": winner,
-                "slug": slug
-            })
-            print(f"Found: {slug} -> {winner}")
-            time.sleep(0.1) # Rate limit nice
-            
-        except Exception as e:
-            print(f"Error fetching {slug}: {e}")
-            
-    return markets_data
-
-def enrich_with_binance(markets):
-    print("\nEnriching with Binance OHLCV data...")
+# --- Checkpoint ---
+
+def load_checkpoint(path: str) -> Dict[str, Optional[dict]]:
+    """ts -> {"winner", "start_time"} for resolved markets, None for slugs without an event"""
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get("markets", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_checkpoint(path: str, markets: Dict[str, Optional[dict]]):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"updated_at": datetime.now(timezone.utc).isoformat(), "markets": markets}, f)
+    os.replace(tmp, path)
+
+
+# --- Gamma ---
+
+def parse_event(data, ts: int) -> Optional[dict]:
+    """Winner of a resolved event, None if there is no event, "UNKNOWN" while unresolved"""
+    if not data:
+        return None
+    event = data[0]
+    market = event.get("markets", [])[0]
+    # Result: "outcomePrices": "[\"1\", \"0\"]" -> UP won
+    prices = json.loads(market.get("outcomePrices", '["0.5", "0.5"]'))
+    winner = "UP" if prices[0] == "1" else "DOWN" if prices[1] == "1" else "UNKNOWN"
+    start = event.get("startDate") or datetime.fromtimestamp(ts, timezone.utc).isoformat()
+    return {"winner": winner, "start_time": start}
+
+
+async def fetch_historical_markets(client: httpx.AsyncClient, spec: MarketSpec, timestamps: List[int],
+                                   limiter: RateLimiter, concurrency: int, checkpoint: str) -> Dict[str, Optional[dict]]:
+    """Probe all cycles (those not in the checkpoint yet) with `concurrency` workers"""
+    done = load_checkpoint(checkpoint)
+    todo = [ts for ts in timestamps if str(ts) not in done]
+    print(f"Gamma: {len(timestamps)} cycles, {len(timestamps) - len(todo)} from checkpoint, {len(todo)} to probe")
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for ts in todo: queue.put_nowait(ts)
+    stats = {"probed": 0, "found": 0, "errors": 0, "since_save": 0}
+    start = time.time()
+
+    async def worker():
+        while True:
+            try:
+                ts = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            slug = spec.slug(ts)
+            try:
+                result = parse_event(await get_json(client, limiter, f"{GAMMA_API}/events", {"slug": slug}), ts)
+                if result is None or result["winner"] != "UNKNOWN": # Unresolved: ask again next run
+                    done[str(ts)] = result
+                    stats["found"] += result is not None
+            except Exception as e:
+                stats["errors"] += 1
+                print(f"Error fetching {slug}: {e}")
+            stats["probed"] += 1
+            stats["since_save"] += 1
+            if stats["since_save"] >= 500:
+                stats["since_save"] = 0
+                save_checkpoint(checkpoint, done)
+                rate = stats["probed"] / (time.time() - start)
+                print(f"  {stats['probed']}/{len(todo)} probed ({rate:.0f}/s), {stats['found']} resolved")
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        save_checkpoint(checkpoint, done) # Also on Ctrl-C: the next run resumes from here
+    print(f"Gamma done: {stats['found']} new resolved markets, {stats['errors']} errors ({time.time() - start:.0f}s)")
+    return done
+
+
+# --- Binance ---
+
+def enrich_with_binance(markets: List[dict], candles: CandleStore, spec: MarketSpec) -> List[dict]:
+    """Join strike (open of the first minute) and previous-cycle trend from the local candle store"""
     enriched = []
-    
     for m in markets:
         ts_ms = m["ts"] * 1000
-        # Get candle at start time (Strike)
-        # And candle at end time (Resolution) - roughly +15m
-        
-        try:
-            # Get Strike (Open of start candle)
-            url = "https://api.binance.com/api/v3/klines"
-            
-            # 1. Strike Price
-            params = {"symbol": "BTCUSDT", "interval": "1m", "startTime": ts_ms, "limit": 1}
-            resp = requests.get(url, params=params, timeout=5)
-            kline_start = resp.json()
-            strike = float(kline_start[0][1]) # Open
-            
-            # 2. Volatility / Trend Feature (Previous 15m candle)
-            # Get the candle BEFORE this market started to calculate trend
-            params_prev = {"symbol": "BTCUSDT", "interval": "15m", "startTime": ts_ms - 900000, "limit": 1}
-            resp_prev = requests.get(url, params=params_prev, timeout=5)
-            kline_prev = resp_prev.json()
-            prev_open = float(kline_prev[0][1])
-            prev_close = float(kline_prev[0][4])
-            trend_pct = (prev_close - prev_open) / prev_open
-            
-            m["strike_price"] = strike
-            m["prev_trend"] = trend_pct
-            
-            enriched.append(m)
-            print(f"Enriched {m['slug']}: Strike {strike}, Trend {trend_pct:.4%}")
-            time.sleep(0.1)
-            
-        except Exception as e:
-            print(f"Binance error for {m['slug']}: {e}")
-            
+        first = candles.get(ts_ms)
+        prev_first = candles.get(ts_ms - spec.interval_sec * 1000)
+        prev_last = candles.get(ts_ms - MINUTE_MS)
+        if not first:
+            continue
+        m["strike_price"] = first[0]
+        # Previous cycle: open of its first minute -> close of its last minute
+        m["prev_trend"] = (prev_last[3] - prev_first[0]) / prev_first[0] if prev_first and prev_last else None
+        enriched.append(m)
+    print(f"Enriched {len(enriched)}/{len(markets)} markets with Binance data")
     return enriched
 
+
 def save_to_training_data(data):
     # Convert to format compatible with training script
-    # We need to simulate "trades". 
+    # We need to simulate "trades".
     # Since we know the winner, we can generate synthetic "Winning Trades" to teach the model WHAT WINS.
-    
+
     print(f"\nGenerating synthetic training data from {len(data)} markets...")
-    
-    with open("polymarket-bot/paper_trades.jsonl", "a") as f:
-        for m in data:
-            # Synthetic Trade: If UP won, we simulate a "BUY UP" trade that won.
-            # We want the model to learn to predict the WINNER.
-            
-            record = {
-                "time": m["start_time"],
-                "type": "SETTLED", # Mark as settled for training
-                "market": m["slug"],
-                "direction": m["winner"], # The winning direction
-                "entry_price": 0.50, # Assume avg entry
-                "exit_price": 1.0,
-                "pnl": 1.0, # Dummy positive PnL
-                "result": "WIN",
-                # Extra features for ML
-                "strike_price": m["strike_price"],
-                "prev_trend": m["prev_trend"]
-            }
-            f.write(json.dumps(record) + "\n")
-            
-    print("✅ Successfully appended historical data to paper_trades.jsonl")
+
+    records = []
+    for m in data:
+        # Synthetic Trade: If UP won, we simulate a "BUY UP" trade that won.
+        # We want the model to learn to predict the WINNER.
+
+        records.append({
+            "time": m["start_time"],
+            "type": "SETTLED", # Mark as settled for training
+            "market": m["slug"],
+            "direction": m["winner"], # The winning direction
+            "entry_price": 0.50, # Assume avg entry
+            "exit_price": 1.0,
+            "pnl": 1.0, # Dummy positive PnL
+            "result": "WIN",
+            # Extra features for ML
+            "strike": m["strike_price"],
+            "prev_trend": m["prev_trend"]
+        })
+    # One batch: back-filled history is merged into the time index once
+    TradeJournal().extend(records)
+
+    print("✅ Successfully appended historical data to the trade journal")
+
+
+async def ingest(days: float = 30, market: str = "btc-15m", concurrency: int = 16, rate: float = 40.0):
+    spec = REGISTRY[market]
+    now = int(time.time())
+    first = spec.boundary(int(now - days * 86400))
+    timestamps = []
+    ts = first
+    while ts + spec.interval_sec <= now: # Only cycles that have closed
+        timestamps.append(ts)
+        ts = spec.boundary(ts + spec.interval_sec)
+
+    existing = TradeJournal().markets()
+    checkpoint = CHECKPOINT_FILE.format(market=market)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=10, limits=limits) as client:
+        results = await fetch_historical_markets(client, spec, timestamps, RateLimiter(rate), concurrency, checkpoint)
+
+        markets = []
+        for ts in timestamps:
+            r = results.get(str(ts))
+            if r and spec.slug(ts) not in existing:
+                markets.append({"ts": ts, "slug": spec.slug(ts), **r})
+        print(f"{len(markets)} resolved markets not in the journal yet ({len(existing)} existing records skipped)")
+        if not markets:
+            return
+
+        # Candles we already have are read locally; only missing ranges are downloaded
+        candles = CandleStore(spec.symbol, "1m")
+        start = time.time()
+        added = await sync_candles(candles, (markets[0]["ts"] - spec.interval_sec) * 1000,
+                                   client=client, concurrency=concurrency)
+        print(f"Binance: +{added} x 1m {spec.symbol} candles ({len(candles)} stored, {time.time() - start:.1f}s)")
+
+    save_to_training_data(enrich_with_binance(markets, candles, spec))
+
 
 if __name__ == "__main__":
-    markets = fetch_historical_markets()
-    if markets:
-        enriched = enrich_with_binance(markets)
-        save_to_training_data(enriched)
+    parser = argparse.ArgumentParser(description="Back-fill resolved up/down markets into the trade journal")
+    parser.add_argument("--days", type=float, default=30, help="How far back to go (default 30)")
+    parser.add_argument("--market", default="btc-15m", choices=sorted(REGISTRY), help="Market from market_registry")
+    parser.add_argument("--concurrency", type=int, default=16, help="Parallel requests")
+    parser.add_argument("--rate", type=float, default=40.0, help="Gamma requests per second")
+    args = parser.parse_args()
+    try:
+        asyncio.run(ingest(args.days, args.market, args.concurrency, args.rate))
+    except KeyboardInterrupt:
+        print("\n⏸️ Interrupted - progress is checkpointed, run again to resume")
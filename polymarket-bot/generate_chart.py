@@ -1,10 +1,9 @@
-import json
-import os
 import matplotlib.pyplot as plt
 from datetime import datetime, timezone
 
+from trade_journal import TradeJournal, CLOSED_TYPES, day_range
+
 # Data Source
-LOG_FILE = "polymarket-bot/paper_trades.jsonl"
 today_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
 
 # 1. Parse Data
@@ -13,18 +12,12 @@ cumulative_pnl = [0.0]
 timestamps = ["Start"]
 running_pnl = 0.0
 
-if os.path.exists(LOG_FILE):
-    with open(LOG_FILE, "r") as f:
-        for line in f:
-            try:
-                t = json.loads(line)
-                if t["time"].startswith(today_str) and "pnl" in t:
-                    running_pnl += float(t["pnl"])
-                    cumulative_pnl.append(running_pnl)
-                    # Simple timestamp HH:MM
-                    ts = t["time"].split("T")[1][:5]
-                    timestamps.append(ts)
-            except: pass
+for t in TradeJournal().query(*day_range(), types=CLOSED_TYPES):
+    running_pnl += float(t["pnl"])
+    cumulative_pnl.append(running_pnl)
+    # Simple timestamp HH:MM
+    ts = t["time"].split("T")[1][:5]
+    timestamps.append(ts)
 
 # 2. Plotting
 plt.figure(figsize=(10, 6))
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Streaming Technical Indicators
+- RSI, Bollinger width, ATR %, distance to rolling VWAP and multi-horizon
+  returns, each updated in O(1) per closed 1m candle (Wilder smoothing or
+  ring buffers with running sums).
+- One IndicatorEngine class serves both sides: indicator_series() runs it over
+  the stored candle history for training, the bot advances it candle by candle
+  from the same candle store. Same code + same candles = identical features.
+- Model features are the values as of a cycle's open (last candle closed
+  before the strike), so they are ready before the first trading decision.
+"""
+
+import math
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from volatility import RingBuffer
+
+INDICATOR_FEATURES = ("rsi_14", "bb_width_20", "atr_pct_14", "vwap_dist_60", "ret_5m", "ret_15m", "ret_60m")
+# Value used while an indicator is warming up (training and live alike)
+NEUTRAL = {"rsi_14": 50.0, "bb_width_20": 0.0, "atr_pct_14": 0.0, "vwap_dist_60": 0.0,
+           "ret_5m": 0.0, "ret_15m": 0.0, "ret_60m": 0.0}
+MINUTE_MS = 60_000
+
+
+class RSI:
+    """Wilder RSI: simple average of the first n changes, then smoothing"""
+
+    def __init__(self, n: int = 14):
+        self.n = n
+        self.prev = None
+        self.gain = self.loss = 0.0
+        self.count = 0
+        self.value = math.nan
+
+    def update(self, close: float):
+        if self.prev is not None:
+            change = close - self.prev
+            gain, loss = max(change, 0.0), max(-change, 0.0)
+            self.count += 1
+            if self.count <= self.n:
+                self.gain += gain / self.n
+                self.loss += loss / self.n
+            else:
+                self.gain = (self.gain * (self.n - 1) + gain) / self.n
+                self.loss = (self.loss * (self.n - 1) + loss) / self.n
+            if self.count >= self.n:
+                if self.loss == 0:
+                    self.value = 100.0 if self.gain > 0 else 50.0
+                else:
+                    self.value = 100.0 - 100.0 / (1.0 + self.gain / self.loss)
+        self.prev = close
+
+
+class BollingerWidth:
+    """(upper - lower) / middle band over n closes, k standard deviations"""
+
+    def __init__(self, n: int = 20, k: float = 2.0):
+        self.n, self.k = n, k
+        self.ref = None  # Prices are shifted by the first close to keep sum of squares well-conditioned
+        self.x = RingBuffer(n)
+        self.x2 = RingBuffer(n)
+        self.updates = 0
+        self.value = math.nan
+
+    def update(self, close: float):
+        if self.ref is None: self.ref = close
+        d = close - self.ref
+        self.x.push(d)
+        self.x2.push(d * d)
+        self.updates += 1
+        if self.updates % 10000 == 0:
+            self.x.recompute()
+            self.x2.recompute()
+        if self.x.count == self.n:
+            mean = self.x.total / self.n
+            var = max(self.x2.total / self.n - mean * mean, 0.0)
+            mid = mean + self.ref
+            self.value = 2.0 * self.k * math.sqrt(var) / mid if mid else math.nan
+
+
+class ATRPct:
+    """Wilder average true range as a fraction of the close"""
+
+    def __init__(self, n: int = 14):
+        self.n = n
+        self.prev_close = None
+        self.atr = 0.0
+        self.count = 0
+        self.value = math.nan
+
+    def update(self, high: float, low: float, close: float):
+        tr = high - low if self.prev_close is None else \
+            max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.count += 1
+        if self.count <= self.n:
+            self.atr += tr / self.n
+        else:
+            self.atr = (self.atr * (self.n - 1) + tr) / self.n
+        if self.count >= self.n and close:
+            self.value = self.atr / close
+        self.prev_close = close
+
+
+class VWAPDistance:
+    """(close - rolling VWAP) / VWAP over the last n candles (typical price)"""
+
+    def __init__(self, n: int = 60):
+        self.n = n
+        self.pv = RingBuffer(n)
+        self.v = RingBuffer(n)
+        self.updates = 0
+        self.value = math.nan
+
+    def update(self, high: float, low: float, close: float, volume: float):
+        self.pv.push((high + low + close) / 3.0 * volume)
+        self.v.push(volume)
+        self.updates += 1
+        if self.updates % 10000 == 0:
+            self.pv.recompute()
+            self.v.recompute()
+        if self.v.count == self.n:
+            self.value = close / (self.pv.total / self.v.total) - 1.0 if self.v.total > 0 else 0.0
+
+
+class Returns:
+    """close / close h candles ago - 1, for several horizons"""
+
+    def __init__(self, horizons: Tuple[int, ...] = (5, 15, 60)):
+        self.horizons = horizons
+        self.closes = RingBuffer(max(horizons) + 1)
+        self.values = [math.nan] * len(horizons)
+
+    def update(self, close: float):
+        ring = self.closes
+        ring.push(close)
+        for j, h in enumerate(self.horizons):
+            if ring.count > h:
+                past = ring.values[(ring.pos - 1 - h) % ring.size]
+                self.values[j] = close / past - 1.0 if past else math.nan
+
+
+class IndicatorEngine:
+    """All indicators of one symbol, advanced one closed 1m candle at a time"""
+
+    def __init__(self):
+        self.rsi = RSI(14)
+        self.bb = BollingerWidth(20, 2.0)
+        self.atr = ATRPct(14)
+        self.vwap = VWAPDistance(60)
+        self.ret = Returns((5, 15, 60))
+        self.last_ms = None  # Open time of the last candle applied
+        self.last_close = None
+
+    def update(self, open_ms: int, o: float, h: float, l: float, c: float, v: float):
+        """One closed candle. A missing (NaN) candle is a flat, zero-volume minute."""
+        if c != c:
+            if self.last_close is None: return
+            h = l = c = self.last_close
+            v = 0.0
+        self.rsi.update(c)
+        self.bb.update(c)
+        self.atr.update(h, l, c)
+        self.vwap.update(h, l, c, v)
+        self.ret.update(c)
+        self.last_close = c
+        self.last_ms = int(open_ms)
+
+    def values(self) -> Dict[str, float]:
+        """Current values (NaN while warming up)"""
+        return dict(zip(INDICATOR_FEATURES, (
+            self.rsi.value, self.bb.value, self.atr.value, self.vwap.value, *self.ret.values,
+        )))
+
+    def catch_up(self, candles, until_ms: Optional[int] = None) -> int:
+        """Apply every stored candle after the last one seen (candle_store.CandleStore), opening
+        before `until_ms` if given. Returns how many."""
+        start = candles.start_ms if self.last_ms is None else self.last_ms + MINUTE_MS
+        if start >= candles.end_ms:
+            candles.refresh()
+            if start >= candles.end_ms: return 0
+        end = candles.end_ms if until_ms is None else min(candles.end_ms, int(until_ms))
+        if start >= end: return 0
+        data = candles.range(start, end)
+        cols = [data[k].tolist() for k in ("open", "high", "low", "close", "volume")]
+        for t, o, h, l, c, v in zip(data["time"].tolist(), *cols):
+            self.update(t, o, h, l, c, v)
+        return len(data["time"])
+
+    def features_at(self, cycle_start_ms: int) -> Optional[Dict[str, float]]:
+        """Values as of a cycle open, if the engine has reached the candle before it"""
+        if self.last_ms != cycle_start_ms - MINUTE_MS:
+            return None
+        return self.values()
+
+
+def features_from(candles, cycle_start_ms: int) -> Optional[Dict[str, float]]:
+    """Values as of a cycle open, replayed by a fresh engine over the stored history (as
+    indicator_series does): for a live engine already past that open, e.g. after a restart mid-cycle"""
+    engine = IndicatorEngine()
+    engine.catch_up(candles, until_ms=cycle_start_ms)
+    return engine.features_at(cycle_start_ms)
+
+
+def fill_neutral(values: Optional[Dict[str, float]]) -> Dict[str, float]:
+    """Replace missing / warming-up values (same rule in training and live)"""
+    out = dict(NEUTRAL)
+    for k, v in (values or {}).items():
+        if k in out and v is not None and v == v:
+            out[k] = float(v)
+    return out
+
+
+def indicator_series(candles, start_ms: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Batch run over the stored history: (open times, values) where row i holds
+    the indicators after candle i closed. Same engine as live.
+    """
+    engine = IndicatorEngine()
+    data = candles.range(candles.start_ms if start_ms is None else start_ms, candles.end_ms)
+    n = len(data["time"])
+    out = np.full((n, len(INDICATOR_FEATURES)), np.nan)
+    cols = [data[k].tolist() for k in ("open", "high", "low", "close", "volume")]
+    for i, (t, o, h, l, c, v) in enumerate(zip(data["time"].tolist(), *cols)):
+        engine.update(t, o, h, l, c, v)
+        out[i] = (engine.rsi.value, engine.bb.value, engine.atr.value, engine.vwap.value, *engine.ret.values)
+    return data["time"], out
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Background Journal / Log Writer
+- Trade journal records and bot.log lines are queued from the event loop and
+  written by one thread: a slow or stalled disk never delays a trading decision.
+- One FIFO queue for both: each file gets its items in the order they happened.
+  A batch's journal records go to TradeJournal.extend() at once (one lock +
+  index update); its log lines are written with a single flush, keeping the
+  RotatingFileHandler's size-based rotation.
+- Durability policy (`fsync`):
+    record    fsync after every journal record / log line
+    batch     fsync once per written batch (default)
+    interval  fsync at most every `fsync_interval_sec` (and on flush / close)
+- Bounded queue: when `max_pending` items are waiting, log lines are dropped
+  and journal records are still accepted (a trade is never lost) but counted
+  as over the limit. The loop never blocks either way.
+- Backpressure metrics: queue depth + high-water mark, drops, batch sizes,
+  enqueue -> written latency, fsync count / worst fsync. See summary().
+- close() (atexit) writes everything queued, in order, then fsyncs.
+
+Usage:
+    writer = JournalWriter(journal.path, fsync="batch")
+    writer.capture_logging()     # File handlers of the root logger go through the writer
+    writer.append(record)        # From async code: returns immediately
+    writer.flush()               # Block until everything queued so far is on disk
+"""
+
+import os
+import copy
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from typing import List, Optional
+
+from trade_journal import JOURNAL_DIR, TradeJournal
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ("record", "batch", "interval")
+JOURNAL, LOG, BARRIER = 0, 1, 2 # Queue item kinds
+
+
+class QueuedLogHandler(logging.Handler):
+    """Takes the place of a file handler: lines are formatted and written by the writer thread"""
+
+    def __init__(self, writer: "JournalWriter", target: logging.FileHandler):
+        super().__init__(target.level)
+        self.writer = writer
+        self.target = target
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            # Resolve args / traceback now: they may change (or be gone) by the time the line is written
+            record = copy.copy(record)
+            record.msg, record.args = record.getMessage(), None
+            if record.exc_info:
+                record.exc_text = (self.target.formatter or logging.Formatter()).formatException(record.exc_info)
+                record.exc_info = None
+            self.writer._put(LOG, (self.target, record))
+        except Exception:
+            self.handleError(record)
+
+
+class JournalWriter:
+    """Off-loop, batched journal + log writer with a configurable fsync policy"""
+
+    def __init__(self, path: str = JOURNAL_DIR, fsync: str = "batch", fsync_interval_sec: float = 1.0,
+                 max_pending: int = 10_000, batch_max: int = 500):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync policy must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.journal = TradeJournal(path) # Own instance: mmaps / string table are not shared with loop-side readers
+        self.fsync = fsync
+        self.fsync_interval_sec = fsync_interval_sec
+        self.max_pending = max_pending
+        self.batch_max = 1 if fsync == "record" else batch_max
+        self.pending = deque() # (kind, payload, enqueued_at)
+        self.cond = threading.Condition()
+        self.captured = [] # (logger, original handler, queued handler)
+        self.dirty_logs = set() # Handlers written since the last fsync
+        self.dirty_journal = False
+        self.last_sync = time.monotonic()
+        self.stopped = False
+        self.drained = False # Writer thread is done: late writes go straight to disk
+        self.stats = {"records": 0, "lines": 0, "batches": 0, "high_water": 0, "dropped_lines": 0,
+                      "over_limit": 0, "fsyncs": 0, "max_fsync_ms": 0.0, "max_lag_ms": 0.0, "errors": 0}
+        self._last_error = 0.0
+        self.thread = threading.Thread(target=self._writer, name="journal-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.close) # Registered after logging's own hook, so it runs first
+
+    # --- Event loop side ---
+
+    def append(self, record: dict):
+        """Queue one journal record (never dropped, never blocks)"""
+        self._put(JOURNAL, record)
+
+    def capture_logging(self, target: Optional[logging.Logger] = None):
+        """Route the file handlers of `target` (default: root logger) through the writer"""
+        target = target or logging.getLogger()
+        for h in list(target.handlers):
+            if isinstance(h, logging.FileHandler):
+                queued = QueuedLogHandler(self, h)
+                target.removeHandler(h)
+                target.addHandler(queued)
+                self.captured.append((target, h, queued))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything queued before this call is written and fsync'd"""
+        if self.stopped: return True
+        done = threading.Event()
+        self._put(BARRIER, done)
+        return done.wait(timeout)
+
+    def metrics(self) -> dict:
+        with self.cond:
+            depth = len(self.pending)
+            lag = time.monotonic() - self.pending[0][2] if self.pending else 0.0
+        return {**self.stats, "depth": depth, "lag_ms": lag * 1000, "max_pending": self.max_pending}
+
+    def summary(self) -> str:
+        m = self.metrics()
+        avg = (m["records"] + m["lines"]) / m["batches"] if m["batches"] else 0.0
+        return (f"写入器 队列 {m['depth']}/{m['max_pending']} (峰值 {m['high_water']}) | 批次 {m['batches']} "
+                f"(平均 {avg:.1f} 条) | 最大延迟 {m['max_lag_ms']:.1f}ms | fsync {m['fsyncs']} ({self.fsync}, "
+                f"最长 {m['max_fsync_ms']:.1f}ms) | 丢弃日志 {m['dropped_lines']} | 超限记录 {m['over_limit']}")
+
+    def close(self):
+        """Write everything queued (in order), fsync, and hand the file handlers back to logging"""
+        if self.stopped: return
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        self.thread.join()
+        for target, original, queued in self.captured:
+            target.removeHandler(queued)
+            target.addHandler(original)
+        self.captured = []
+        self.journal.close()
+
+    def _put(self, kind: int, payload):
+        with self.cond:
+            if self.drained: # Late writes after close (atexit ordering): write in-line
+                if kind == JOURNAL: self.journal.append(payload)
+                elif kind == LOG: payload[0].handle(payload[1])
+                else: payload.set()
+                return
+            if len(self.pending) >= self.max_pending and kind != BARRIER:
+                if kind == LOG:
+                    self.stats["dropped_lines"] += 1
+                    return
+                self.stats["over_limit"] += 1
+            self.pending.append((kind, payload, time.monotonic()))
+            if len(self.pending) > self.stats["high_water"]: self.stats["high_water"] = len(self.pending)
+            self.cond.notify()
+
+    # --- Writer thread ---
+
+    def _writer(self):
+        while True:
+            with self.cond:
+                if not self.pending and not self.stopped:
+                    self.cond.wait(self.fsync_interval_sec if self.fsync == "interval" else None)
+                batch = [self.pending.popleft() for _ in range(min(len(self.pending), self.batch_max))]
+                stopping = self.stopped and not self.pending
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    self._failed(batch, e)
+                    continue
+            try:
+                if stopping or self.fsync != "interval" or time.monotonic() - self.last_sync >= self.fsync_interval_sec:
+                    self._sync()
+            except Exception as e:
+                self._failed([], e)
+            if stopping:
+                with self.cond: # Only now may callers write in-line: this thread is done with the journal
+                    if self.pending: continue # Queued while the last batch was written: go round again
+                    self.drained = True
+                return
+
+    def _write(self, batch: List[tuple]):
+        now, enqueued = time.monotonic(), batch[0][2]
+        records = [p for kind, p, _ in batch if kind == JOURNAL]
+        lines = [p for kind, p, _ in batch if kind == LOG]
+        barriers = [p for kind, p, _ in batch if kind == BARRIER]
+        # Journal and log are separate files: each keeps its own order, no need to interleave writes.
+        # Written items leave `batch`, so a failure only puts the rest back.
+        if records:
+            written = [] # Filled under the journal's lock: only this writer's records, even if extend raises
+            try:
+                self.journal.extend(records, written) # A torn partial record is cut off by the journal itself
+            finally:
+                if written: self.dirty_journal = True
+                self.stats["records"] += len(written)
+                self._drop(batch, JOURNAL, len(written))
+        if lines:
+            self._write_lines(lines)
+            self._drop(batch, LOG, len(lines))
+            self.stats["lines"] += len(lines)
+        if barriers: self._sync()
+        for done in barriers: done.set()
+        if records or lines: self.stats["batches"] += 1
+        lag = (now - enqueued) * 1000
+        if lag > self.stats["max_lag_ms"]: self.stats["max_lag_ms"] = lag
+
+    @staticmethod
+    def _drop(batch: List[tuple], kind: int, n: int):
+        """Remove the first `n` items of `kind` from the batch (written: not to be retried)"""
+        keep = []
+        for item in batch:
+            if item[0] == kind and n: n -= 1
+            else: keep.append(item)
+        batch[:] = keep
+
+    def _write_lines(self, lines: list):
+        written = set()
+        for handler, record in lines:
+            handler.acquire()
+            try:
+                if isinstance(handler, RotatingFileHandler) and handler.shouldRollover(record):
+                    handler.doRollover()
+                if handler.stream is None: handler.stream = handler._open()
+                handler.stream.write(handler.format(record) + handler.terminator)
+            finally:
+                handler.release()
+            written.add(handler)
+        for handler in written:
+            handler.flush()
+        self.dirty_logs |= written
+
+    def _sync(self):
+        if not self.dirty_journal and not self.dirty_logs: return
+        t0 = time.perf_counter()
+        if self.dirty_journal: self.journal.sync()
+        for handler in self.dirty_logs:
+            handler.acquire()
+            try:
+                if handler.stream is not None: os.fsync(handler.stream.fileno())
+            finally:
+                handler.release()
+        self.dirty_journal, self.dirty_logs = False, set()
+        self.last_sync = time.monotonic()
+        ms = (time.perf_counter() - t0) * 1000
+        self.stats["fsyncs"] += 1
+        if ms > self.stats["max_fsync_ms"]: self.stats["max_fsync_ms"] = ms
+
+    def _failed(self, batch: List[tuple], error: Exception):
+        """Disk error: put the unwritten rest of the batch back at the front (order kept) and retry after a pause"""
+        self.stats["errors"] += 1
+        with self.cond:
+            self.pending.extendleft(reversed(batch))
+            stopping = self.stopped
+        if time.monotonic() - self._last_error >= 60:
+            self._last_error = time.monotonic()
+            logger.error(f"❌ 日志/交易记录写入失败 (将重试): {error}")
+        if stopping and self.stats["errors"] > 10: # Shutting down on a dead disk: give up rather than hang
+            with self.cond:
+                for kind, payload, _ in self.pending:
+                    if kind == BARRIER: payload.set()
+                self.pending.clear()
+            return
+        time.sleep(1.0)
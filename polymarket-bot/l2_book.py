@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Incremental L2 Order Book
+- Each side keeps its price levels in two parallel array('d') buffers, sorted best-first.
+- A level update is a binary search (O(log n)) to find the level. Changing a size is
+  O(1) in place; adding / removing a level is an array insert / delete, an O(n)
+  memmove of the levels behind it (contiguous doubles: cheap for book-sized n).
+- Snapshots from the CLOB REST API can be validated against the server hash.
+- cost_to_fill / vwap walk the levels to get executable prices for a given size.
+"""
+
+from array import array
+from bisect import bisect_left
+from typing import Iterable, List, Optional, Tuple
+
+
+class BookSide:
+    """Sorted price levels for one side. Bids store -price so both sides sort best-first."""
+
+    def __init__(self, is_bid: bool):
+        self.is_bid = is_bid
+        self.keys = array('d')   # -price for bids, price for asks
+        self.sizes = array('d')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _key(self, price: float) -> float:
+        return -price if self.is_bid else price
+
+    def price_at(self, i: int) -> float:
+        k = self.keys[i]
+        return -k if self.is_bid else k
+
+    def find(self, price: float) -> Tuple[int, bool]:
+        """Index where `price` is (or would be inserted) and whether it exists"""
+        key = self._key(price)
+        i = bisect_left(self.keys, key)
+        return i, (i < len(self.keys) and self.keys[i] == key)
+
+    def set(self, price: float, size: float) -> Tuple[int, float, int]:
+        """
+        Set the aggregate size at a price level (size <= 0 removes it).
+        Returns (index, old_size, shift) where shift is +1 for an inserted level,
+        -1 for a removed level and 0 for an in-place change.
+        """
+        i, exists = self.find(price)
+        if size <= 0:
+            if not exists: return i, 0.0, 0
+            old = self.sizes[i]
+            del self.keys[i]
+            del self.sizes[i]
+            return i, old, -1
+        if exists:
+            old = self.sizes[i]
+            self.sizes[i] = size
+            return i, old, 0
+        self.keys.insert(i, self._key(price))
+        self.sizes.insert(i, size)
+        return i, 0.0, 1
+
+    def load(self, levels: Iterable[Tuple[float, float]]):
+        """Replace all levels (any input order)"""
+        pairs = sorted((self._key(p), s) for p, s in levels if s > 0)
+        self.keys = array('d', [k for k, _ in pairs])
+        self.sizes = array('d', [s for _, s in pairs])
+
+    def best(self) -> Optional[Tuple[float, float]]:
+        if not self.keys: return None
+        return self.price_at(0), self.sizes[0]
+
+    def levels(self, n: Optional[int] = None) -> List[Tuple[float, float]]:
+        n = len(self.keys) if n is None else min(n, len(self.keys))
+        return [(self.price_at(i), self.sizes[i]) for i in range(n)]
+
+
+class L2Book:
+    """Full-depth book for one asset"""
+
+    def __init__(self, asset_id: str):
+        self.asset_id = asset_id
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.hash = None        # Hash of the last snapshot
+        self.timestamp = None   # Exchange timestamp of the last event
+        self.synced = False     # True once a snapshot has been loaded
+
+    @property
+    def best_bid(self) -> Optional[float]:
+        return self.bids.price_at(0) if self.bids.keys else None
+
+    @property
+    def best_ask(self) -> Optional[float]:
+        return self.asks.price_at(0) if self.asks.keys else None
+
+    def apply_snapshot(self, bids, asks, hash: str = None, timestamp=None):
+        """Load a full snapshot. bids/asks are [{"price": "...", "size": "..."}, ...]"""
+        self.bids.load((float(l["price"]), float(l["size"])) for l in bids)
+        self.asks.load((float(l["price"]), float(l["size"])) for l in asks)
+        self.hash = hash
+        self.timestamp = timestamp
+        self.synced = True
+
+    def apply_delta(self, is_bid: bool, price: float, size: float):
+        """Set the new aggregate size at one level"""
+        (self.bids if is_bid else self.asks).set(price, size)
+
+    def cost_to_fill(self, size: float, side: str = "BUY") -> Tuple[float, float]:
+        """
+        Walk the opposite side for `size` shares.
+        Returns (cost, filled) - filled < size means the book is too thin.
+        """
+        book = self.asks if side == "BUY" else self.bids
+        cost = 0.0
+        remaining = size
+        for i in range(len(book.keys)):
+            take = min(remaining, book.sizes[i])
+            cost += take * book.price_at(i)
+            remaining -= take
+            if remaining <= 1e-12: break
+        return cost, size - remaining
+
+    def vwap(self, size: float, side: str = "BUY") -> Optional[float]:
+        """Average executable price for `size` shares, None if depth is insufficient"""
+        if size <= 0: return None
+        cost, filled = self.cost_to_fill(size, side)
+        if filled + 1e-9 < size: return None
+        return cost / filled
+
+    def sweep_price(self, size: float, side: str = "BUY") -> Optional[float]:
+        """Worst level needed to fill `size` shares (the limit price that takes them all), None if too thin"""
+        book = self.asks if side == "BUY" else self.bids
+        remaining = size
+        for i in range(len(book.keys)):
+            remaining -= book.sizes[i]
+            if remaining <= 1e-9: return book.price_at(i)
+        return None
+
+
+def verify_summary_hash(raw: dict) -> bool:
+    """Check a raw CLOB /book response against its server-side hash"""
+    from py_clob_client.utilities import parse_raw_orderbook_summary, generate_orderbook_summary_hash
+
+    expected = raw.get("hash")
+    if not expected: return False
+    try:
+        return generate_orderbook_summary_hash(parse_raw_orderbook_summary(raw)) == expected
+    except (KeyError, TypeError):
+        return False
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Market Registry
+- Describes every recurring up/down market the bot can trade (asset x horizon).
+- Knows how to align cycle boundaries and build the Gamma event slug for each.
+- Merges per-market config sections over the global parameters.
+
+config.json:
+    "markets": {
+        "btc-15m": {"enabled": true},
+        "eth-15m": {"enabled": true, "min_edge": 0.10, "volatility_per_min": 1.6}
+    }
+Without a "markets" section only btc-15m runs (same as before).
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Dict, List
+from zoneinfo import ZoneInfo
+
+ET = "America/New_York"
+ASSET_NAMES = {"btc": "bitcoin", "eth": "ethereum", "sol": "solana", "xrp": "xrp"}
+
+# Strategy parameters a market section may override
+MARKET_PARAMS = (
+    "stop_loss_pct", "safety_margin_pct", "min_edge", "fee_pct", "obi_threshold",
+    "obi_depth", "order_shares", "volatility_per_min", "vol_estimator", "use_ml", "prewarm_lead_sec",
+)
+
+
+@dataclass(frozen=True)
+class MarketSpec:
+    key: str               # "btc-15m"
+    asset: str             # "btc"
+    symbol: str            # Binance symbol for strike / fair value
+    interval_sec: int      # Cycle length
+    slug_format: str       # Gamma event slug, see slug()
+    tz: str = "UTC"        # Timezone the boundaries are aligned in
+    offset_sec: int = 0    # Boundary offset from local midnight (daily markets)
+    defaults: Dict = field(default_factory=dict, compare=False, hash=False)
+
+    def boundary(self, ts: int) -> int:
+        """Start (epoch seconds) of the cycle containing `ts`"""
+        if self.tz == "UTC" and self.interval_sec <= 86400 and 86400 % self.interval_sec == 0 and not self.offset_sec:
+            return (ts // self.interval_sec) * self.interval_sec
+        local = datetime.fromtimestamp(ts, ZoneInfo(self.tz))
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        since = (local - midnight).total_seconds() - self.offset_sec
+        start = midnight + timedelta(seconds=self.offset_sec + (since // self.interval_sec) * self.interval_sec)
+        return int(start.timestamp())
+
+    def slug(self, start_ts: int) -> str:
+        """
+        Fields: {ts} start epoch, {name} long asset name, and local (tz) start /
+        end parts {month} {day} {hour12} {ampm} / {end_month} {end_day}.
+        """
+        tz = ZoneInfo(self.tz)
+        start = datetime.fromtimestamp(start_ts, tz)
+        end = datetime.fromtimestamp(start_ts + self.interval_sec, tz)
+        return self.slug_format.format(
+            ts=start_ts,
+            name=ASSET_NAMES.get(self.asset, self.asset),
+            month=start.strftime("%B").lower(), day=start.day,
+            hour12=start.hour % 12 or 12, ampm="am" if start.hour < 12 else "pm",
+            end_month=end.strftime("%B").lower(), end_day=end.day,
+        )
+
+
+def _updown(asset: str, symbol: str, vol: float) -> List[MarketSpec]:
+    ml = {"use_ml": asset == "btc", "volatility_per_min": vol}
+    return [
+        MarketSpec(f"{asset}-15m", asset, symbol, 900, f"{asset}-updown-15m-{{ts}}", defaults=ml),
+        MarketSpec(f"{asset}-1h", asset, symbol, 3600, "{name}-up-or-down-{month}-{day}-{hour12}{ampm}-et",
+                   tz=ET, defaults={**ml, "use_ml": False}),
+        MarketSpec(f"{asset}-4h", asset, symbol, 14400, f"{asset}-updown-4h-{{ts}}",
+                   defaults={**ml, "use_ml": False}),
+        MarketSpec(f"{asset}-daily", asset, symbol, 86400, "{name}-up-or-down-on-{end_month}-{end_day}",
+                   tz=ET, offset_sec=12 * 3600, defaults={**ml, "use_ml": False}),
+    ]
+
+
+# Rough USD volatility per minute per asset (fallback until the live estimate is warm,
+# and floor for it, see ProbabilityStrategy)
+REGISTRY: Dict[str, MarketSpec] = {
+    spec.key: spec
+    for asset, symbol, vol in (
+        ("btc", "BTCUSDT", 25.0),
+        ("eth", "ETHUSDT", 1.5),
+        ("sol", "SOLUSDT", 0.12),
+        ("xrp", "XRPUSDT", 0.002),
+    )
+    for spec in _updown(asset, symbol, vol)
+}
+
+
+def enabled_markets(conf: dict) -> List[MarketSpec]:
+    """Specs enabled in config.json (btc-15m only if there is no markets section)"""
+    sections = conf.get("markets") or {"btc-15m": {"enabled": True}}
+    specs = []
+    for key, section in sections.items():
+        if key not in REGISTRY:
+            raise ValueError(f"Unknown market '{key}' (known: {', '.join(sorted(REGISTRY))})")
+        if section.get("enabled", True):
+            specs.append(REGISTRY[key])
+    return specs
+
+
+def market_config(spec: MarketSpec, base: dict, conf: dict) -> SimpleNamespace:
+    """Global params <- spec defaults <- config.json markets.<key> section"""
+    section = (conf.get("markets") or {}).get(spec.key, {})
+    merged = {k: base[k] for k in MARKET_PARAMS if k in base}
+    merged.update({k: v for k, v in spec.defaults.items() if k in MARKET_PARAMS})
+    merged.update({k: v for k, v in section.items() if k in MARKET_PARAMS})
+    return SimpleNamespace(**merged)
@@ -11,14 +11,16 @@ import time
 import os
 from collections import defaultdict
 
-LOG_FILE = "polymarket-bot/paper_trades.jsonl"
+from trade_journal import TradeJournal
+
 CONFIG_FILE = "polymarket-bot/config.json"
 MEM_DB = "polymarket-bot/mem_db.json"
 
 class MemoryCore:
     def __init__(self):
         self.knowledge = self.load_memory()
-        self.last_pos = 0
+        self.journal = TradeJournal()
+        self.last_pos = 0 # Journal record cursor
         
     def load_memory(self):
         if os.path.exists(MEM_DB):
@@ -33,17 +35,11 @@ class MemoryCore:
             json.dump(self.knowledge, f, indent=2)
 
     def process_logs(self):
-        """Read new logs incrementally"""
-        if not os.path.exists(LOG_FILE): return
-        
-        with open(LOG_FILE, "r") as f:
-            f.seek(self.last_pos)
-            lines = f.readlines()
-            self.last_pos = f.tell()
+        """Read new journal records incrementally"""
+        trades, self.last_pos = self.journal.read_from(self.last_pos)
             
-        for line in lines:
+        for trade in trades:
             try:
-                trade = json.loads(line)
                 if "pnl" in trade:
                     self.learn_from_trade(trade)
             except: pass
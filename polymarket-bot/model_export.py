@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+ML Model Export + Inference
+- Flattens a trained RandomForestClassifier into contiguous NumPy node arrays
+  (all trees concatenated, leaves are self-loops) plus a JSON manifest with the
+  feature schema the model was trained on.
+- ForestPredictor walks every tree for a whole batch at once (one vectorized
+  step per tree level) using preallocated buffers: no sklearn, no input
+  validation, no allocations per prediction.
+- The manifest is checked against the caller's feature list at load time, so a
+  schema mismatch fails loudly instead of inside a silent `except`.
+
+Usage:
+    python3 polymarket-bot/model_export.py [model.pkl]   # pkl -> npz + manifest
+"""
+
+import os
+import sys
+import json
+import hashlib
+from datetime import datetime, timezone
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from indicators import INDICATOR_FEATURES, fill_neutral
+
+MODEL_FILE = "polymarket-bot/ml_model_v1.pkl"
+EXPORT_FILE = "polymarket-bot/ml_model_v1.npz"
+FORMAT_VERSION = 1
+
+# Feature schema of the WIN/LOSS model (train_ml.py builds these columns)
+FEATURES = (
+    "entry_price", "direction_code", "hour", "dayofweek",
+    "prev_trend", "momentum_strength", "is_overbought", "is_oversold",
+    *INDICATOR_FEATURES, # Streaming indicators as of the cycle open (indicators.py)
+)
+TREND_EXTREME = 0.005 # |prev_trend| above this counts as overbought / oversold
+
+
+def trade_features(entry_price: float, direction: str, ts: datetime, prev_trend: float,
+                   indicators: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+    """Model inputs for one candidate trade, by feature name (same rules as train_ml.py)"""
+    return {
+        "entry_price": entry_price,
+        "direction_code": 1.0 if direction == "UP" else 0.0,
+        "hour": ts.hour,
+        "dayofweek": ts.weekday(),
+        "prev_trend": prev_trend,
+        "momentum_strength": abs(prev_trend),
+        "is_overbought": 1.0 if prev_trend > TREND_EXTREME else 0.0,
+        "is_oversold": 1.0 if prev_trend < -TREND_EXTREME else 0.0,
+        **fill_neutral(indicators),
+    }
+
+
+def manifest_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def export_forest(clf, features: Sequence[str], path: str = EXPORT_FILE, extra: Optional[dict] = None) -> dict:
+    """Write the flattened forest (npz) and its manifest (json). Returns the manifest."""
+    features = list(features)
+    if getattr(clf, "n_features_in_", len(features)) != len(features):
+        raise ValueError(f"Model has {clf.n_features_in_} inputs, schema lists {len(features)}")
+    names = getattr(clf, "feature_names_in_", None)
+    if names is not None and list(names) != features:
+        raise ValueError(f"Model was trained on {list(names)}, schema is {features}")
+    classes = [int(c) for c in clf.classes_]
+    if len(classes) != 2 or getattr(clf, "n_outputs_", 1) != 1:
+        raise ValueError("Only single-output binary forests can be exported")
+    positive = classes.index(1) if 1 in classes else 1
+
+    feature, threshold, children, value, roots = [], [], [], [], []
+    offset, depth = 0, 0
+    for est in clf.estimators_:
+        t = est.tree_
+        n = t.node_count
+        ids = np.arange(n) + offset
+        leaf = t.children_left == -1
+        roots.append(offset)
+        feature.append(np.where(leaf, 0, t.feature))
+        threshold.append(np.where(leaf, 0.0, t.threshold))
+        left = np.where(leaf, ids, t.children_left + offset)
+        right = np.where(leaf, ids, t.children_right + offset)
+        children.append(np.stack([right, left], axis=1)) # [node, go_left]
+        counts = t.value[:, 0, :]
+        value.append(counts[:, positive] / np.maximum(counts.sum(axis=1), 1e-12))
+        depth = max(depth, int(t.max_depth))
+        offset += n
+
+    arrays = {
+        "feature": np.ascontiguousarray(np.concatenate(feature), dtype=np.intp),
+        "threshold": np.ascontiguousarray(np.concatenate(threshold), dtype=np.float64),
+        "children": np.ascontiguousarray(np.concatenate(children).ravel(), dtype=np.intp),
+        "value": np.ascontiguousarray(np.concatenate(value), dtype=np.float64),
+        "roots": np.asarray(roots, dtype=np.intp),
+    }
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "model": type(clf).__name__,
+        "features": features,
+        "classes": classes,
+        "n_trees": len(roots),
+        "n_nodes": offset,
+        "max_depth": depth,
+        "sha256": _sha256(path),
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        **(extra or {}),
+    }
+    tmp = manifest_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path(path))
+    return manifest
+
+
+class ForestPredictor:
+    """Batched tree walk over the exported arrays (P(class 1) = mean leaf value)"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], manifest: dict, max_batch: int = 64):
+        self.manifest = manifest
+        self.features = list(manifest["features"])
+        self.col = {name: i for i, name in enumerate(self.features)}
+        self.feature = arrays["feature"].astype(np.intp)
+        self.threshold = arrays["threshold"].astype(np.float64)
+        self.children = arrays["children"].astype(np.intp)
+        self.value = arrays["value"].astype(np.float64)
+        self.roots = arrays["roots"].astype(np.intp)
+        self.depth = int(manifest["max_depth"])
+        self.max_batch = max_batch
+
+        n_nodes, n_feat, n_trees = len(self.feature), len(self.features), len(self.roots)
+        if not (len(self.threshold) == len(self.value) == n_nodes == manifest["n_nodes"]
+                and len(self.children) == 2 * n_nodes and n_trees == manifest["n_trees"]):
+            raise ValueError("Exported arrays do not match the manifest")
+        if n_nodes and (self.feature.min() < 0 or self.feature.max() >= n_feat):
+            raise ValueError("Node feature index outside the manifest schema")
+        if n_nodes and (self.children.min() < 0 or self.children.max() >= n_nodes):
+            raise ValueError("Corrupt child index")
+
+        # Inputs are float32 like sklearn's predict, so thresholds compare identically
+        self.inputs = np.zeros((max_batch, n_feat), dtype=np.float32)
+        self._flat_inputs = self.inputs.reshape(-1)
+        self._row_offset = (np.arange(max_batch, dtype=np.intp) * n_feat)[:, None]
+        shape = (max_batch, n_trees)
+        self._nodes = np.empty(shape, dtype=np.intp)
+        self._idx = np.empty(shape, dtype=np.intp)
+        self._x = np.empty(shape, dtype=np.float32)
+        self._thr = np.empty(shape, dtype=np.float64)
+        self._go = np.empty(shape, dtype=bool)
+        self._leaf = np.empty(shape, dtype=np.float64)
+        self._proba = np.empty(max_batch, dtype=np.float64)
+
+    @classmethod
+    def load(cls, path: str = EXPORT_FILE, features: Optional[Sequence[str]] = FEATURES, max_batch: int = 64) -> "ForestPredictor":
+        """Load an export; raises ValueError if the schema or checksum does not match"""
+        with open(manifest_path(path), "r") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported export format {manifest.get('format')}")
+        if features is not None and list(features) != list(manifest["features"]):
+            missing = [x for x in features if x not in manifest["features"]]
+            extra = [x for x in manifest["features"] if x not in features]
+            raise ValueError(f"Feature schema mismatch (missing {missing}, unexpected {extra}, or order differs)")
+        if manifest.get("sha256") and manifest["sha256"] != _sha256(path):
+            raise ValueError("Model file checksum does not match its manifest")
+        with np.load(path) as data:
+            arrays = {k: data[k] for k in ("feature", "threshold", "children", "value", "roots")}
+        return cls(arrays, manifest, max_batch)
+
+    def set_row(self, i: int, values: Dict[str, float]):
+        """Write one input row by feature name (KeyError if a feature is missing)"""
+        row = self.inputs[i]
+        for name, j in self.col.items():
+            row[j] = values[name]
+
+    def predict_proba(self, n: int = 1) -> np.ndarray:
+        """P(class 1) for inputs[:n]. Returns a view into an internal buffer."""
+        if not 0 < n <= self.max_batch:
+            raise ValueError(f"Batch size must be 1..{self.max_batch}")
+        nodes, idx, x = self._nodes[:n], self._idx[:n], self._x[:n]
+        thr, go, leaf = self._thr[:n], self._go[:n], self._leaf[:n]
+        nodes[...] = self.roots
+        for _ in range(self.depth):
+            # x = inputs[row, feature[node]]; node = children[node, x <= threshold[node]]
+            np.take(self.feature, nodes, out=idx, mode="clip")
+            np.add(idx, self._row_offset[:n], out=idx)
+            np.take(self._flat_inputs, idx, out=x, mode="clip")
+            np.take(self.threshold, nodes, out=thr, mode="clip")
+            np.less_equal(x, thr, out=go)
+            np.multiply(nodes, 2, out=idx)
+            np.add(idx, go, out=idx)
+            np.take(self.children, idx, out=nodes, mode="clip")
+        np.take(self.value, nodes, out=leaf, mode="clip")
+        return np.mean(leaf, axis=1, out=self._proba[:n])
+
+    def predict(self, n: int = 1) -> np.ndarray:
+        """Class labels (ties go to class 0, like sklearn)"""
+        return (self.predict_proba(n) > 0.5).astype(np.int64)
+
+
+if __name__ == "__main__":
+    import joblib
+
+    src = sys.argv[1] if len(sys.argv) > 1 else MODEL_FILE
+    clf = joblib.load(src)
+    names = getattr(clf, "feature_names_in_", None)
+    manifest = export_forest(clf, list(names) if names is not None else FEATURES,
+                             os.path.splitext(src)[0] + ".npz", extra={"source": os.path.basename(src)})
+    print(f"✅ 已导出 {manifest['n_trees']} 棵树 / {manifest['n_nodes']} 个节点 (深度 {manifest['max_depth']}) -> "
+          f"{os.path.splitext(src)[0]}.npz")
@@ -6,67 +6,39 @@ Polymarket Bot Monitor Dashboard (Server Guardian Edition)
 - Auto-Healing (Restart service, Clean disk)
 """
 
-import os
 import time
-import json
 import shutil
 import psutil
 import subprocess
-from datetime import datetime, timezone
+from datetime import datetime
+
+from trade_journal import CLOSED_TYPES, day_range
+from perf_stats import PerfStats
 
-LOG_FILE = "polymarket-bot/paper_trades.jsonl"
 BOT_SERVICE = "polymarket-bot"
 
 def clear_screen():
     print("\033[H\033[J", end="")
 
-def get_today_trades():
-    trades = []
-    if not os.path.exists(LOG_FILE):
-        return []
-    
-    today_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+_perf = None
+
+def get_today_stats():
+    """Today's stats from the incremental aggregates + the intraday equity curve"""
+    global _perf
+    if _perf is None: _perf = PerfStats()
+    _perf.update()
+    today = _perf.day()
     
-    with open(LOG_FILE, "r") as f:
-        for line in f:
-            try:
-                t = json.loads(line)
-                if t["time"].startswith(today_str):
-                    trades.append(t)
-            except: pass
-    return trades
-
-def calculate_stats(trades):
-    wins = 0
-    losses = 0
-    total_pnl = 0.0
-    gross_profit = 0.0
-    gross_loss = 0.0
     pnl_history = [0.0]
-    
-    for t in trades:
-        if "pnl" in t:
-            pnl = float(t["pnl"])
-            total_pnl += pnl
-            pnl_history.append(total_pnl)
-            
-            if pnl > 0:
-                wins += 1
-                gross_profit += pnl
-            else:
-                losses += 1
-                gross_loss += abs(pnl)
-                
-    total_closed = wins + losses
-    win_rate = (wins / total_closed) if total_closed > 0 else 0.0
-    profit_factor = (gross_profit / gross_loss) if gross_loss > 0 else 999.0
+    for t in _perf.journal.query(*day_range(), types=CLOSED_TYPES):
+        pnl_history.append(pnl_history[-1] + float(t["pnl"]))
     
     return {
-        "wins": wins,
-        "losses": losses,
-        "win_rate": win_rate,
-        "profit_factor": profit_factor,
-        "total_pnl": total_pnl,
+        "wins": today["wins"],
+        "losses": today["losses"],
+        "win_rate": today["win_rate"],
+        "profit_factor": min(today["profit_factor"], 999.0) if today["losses"] else 999.0,
+        "total_pnl": today["net_pnl"],
         "pnl_history": pnl_history
     }
 
@@ -149,8 +121,7 @@ def get_ascii_face(pnl):
 
 def main():
     try:
-        trades = get_today_trades()
-        stats = calculate_stats(trades)
+        stats = get_today_stats()
         active, last_log = get_bot_status()
         health = get_system_health()
         
@@ -1,8 +1,9 @@
 import json
 import requests
-import os
 from datetime import datetime, timezone
 
+from perf_stats import PerfStats
+
 # Configuration (Add these to your env or config.json)
 CONFIG_FILE = "polymarket-bot/config.json"
 
@@ -15,32 +16,21 @@ def load_config():
 conf = load_config()
 NOTION_TOKEN = conf.get("notion_token")
 DATABASE_ID = conf.get("notion_database_id")
-LOG_FILE = "polymarket-bot/paper_trades.jsonl"
 
 def get_daily_stats():
     today_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    trades = []
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r") as f:
-            for line in f:
-                try:
-                    t = json.loads(line)
-                    if t["time"].startswith(today_str):
-                        trades.append(t)
-                except: pass
+    perf = PerfStats()
+    perf.update()
+    today = perf.day()
     
-    if not trades: return None
-
-    wins = len([t for t in trades if float(t.get("pnl", 0)) > 0])
-    losses = len([t for t in trades if float(t.get("pnl", 0)) < 0])
-    total_pnl = sum([float(t.get("pnl", 0)) for t in trades])
+    if not today["trades"]: return None
     
     return {
         "date": today_str,
-        "pnl": total_pnl,
-        "trades": len(trades),
-        "wins": wins,
-        "losses": losses
+        "pnl": today["net_pnl"],
+        "trades": today["trades"],
+        "wins": today["wins"],
+        "losses": today["losses"]
     }
 
 def push_to_notion(stats):
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Pre-signed Order Cache
+- EIP-712 signing (ClobClient.create_order) costs milliseconds of CPU. Doing it
+  between the decision and post_order delays every fill attempt, so BUY orders
+  are signed ahead of time instead.
+- When a market is selected, each token gets a ladder of signed BUY orders
+  (ticks around the best ask x configured share sizes). The cache follows the
+  ask: when it moves, entries that left the ladder are dropped and new ones are
+  signed in a background thread (closest to the ask first).
+- A signed order can only be posted once: take() removes it and re-signs that
+  slot in the background. Misses (price outside the ladder, size changed)
+  fall back to sign() on the caller's side.
+- Tick size, neg-risk flag and fee rate are resolved once per token (the
+  client caches them), so background signing does no network I/O.
+"""
+
+import math
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TICKS_BELOW = 2  # Ladder below the ask (the ask may drop before we act)
+TICKS_ABOVE = 4  # ... and above it (paying up to sweep several levels)
+
+
+class _Ladder:
+    """Signed orders of one token, keyed by (price in ticks, size)"""
+
+    def __init__(self):
+        self.center = None         # Ask the ladder is built around, in ticks
+        self.generation = 0        # Bumped on every move: stale refreshes stop early
+        self.orders: Dict[Tuple[int, float], object] = {}
+
+
+class OrderCache:
+    """Pre-signed BUY orders per token, refreshed off the event loop"""
+
+    def __init__(self, client, sizes: Iterable[float] = (5.0,), ticks_below: int = TICKS_BELOW,
+                 ticks_above: int = TICKS_ABOVE):
+        self.client = client
+        self.sizes = tuple(sorted({float(s) for s in sizes}))
+        self.ticks_below = ticks_below
+        self.ticks_above = ticks_above
+        self.ladders: Dict[str, _Ladder] = {}
+        self.meta: Dict[str, Tuple[float, object]] = {}  # token -> (tick, PartialCreateOrderOptions)
+        self.lock = threading.Lock()
+        # One signer thread: signing is CPU bound, more threads would only fight over the GIL
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="order-sign")
+        self.hits = self.misses = self.signed = 0
+
+    # --- Event loop side (cheap, never blocks) ---
+
+    def track(self, token_id: str, ask: Optional[float]):
+        """Keep the token's ladder around `ask`; re-signing happens in the background"""
+        if not ask or not 0 < ask < 1: return
+        with self.lock:
+            ladder = self.ladders.setdefault(token_id, _Ladder())
+            tick = self.meta.get(token_id, (None,))[0]
+            if tick is None and ladder.generation: return  # First refresh (resolving the tick) is queued
+            center = round(ask / tick) if tick else None
+            if tick and center == ladder.center: return
+            ladder.center = center
+            ladder.generation += 1
+            generation = ladder.generation
+        self.pool.submit(self._refresh, token_id, ask, generation)
+
+    def take(self, token_id: str, price: float, size: float):
+        """Ready-to-post signed BUY for (price rounded up to the tick, size), or None"""
+        with self.lock:
+            ladder = self.ladders.get(token_id)
+            tick = self.meta.get(token_id, (None,))[0]
+            order = ladder.orders.pop((self.ticks(price, tick), float(size)), None) if ladder and tick else None
+            if order is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            generation, center = ladder.generation, ladder.center
+        # Single use: sign a fresh one for this slot
+        if center is not None:
+            self.pool.submit(self._refresh, token_id, center * tick, generation)
+        return order
+
+    def drop(self, token_ids: Iterable[str]):
+        """Forget the ladders of finished markets"""
+        with self.lock:
+            for token_id in token_ids:
+                ladder = self.ladders.pop(token_id, None)
+                if ladder: ladder.generation += 1  # Stops a refresh in flight
+
+    def summary(self) -> str:
+        with self.lock:
+            ready = sum(len(l.orders) for l in self.ladders.values())
+        total = self.hits + self.misses
+        return f"预签名订单 {ready} 个就绪 | 命中 {self.hits}/{total} | 已签名 {self.signed}"
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- Signing (background thread, or the caller on a miss) ---
+
+    @staticmethod
+    def ticks(price: float, tick: float, side: str = "BUY") -> int:
+        """Limit on the tick grid, rounded towards crossing (BUY up, SELL down)"""
+        if side == "SELL":
+            return int(math.floor(price / tick + 1e-9))
+        return int(math.ceil(price / tick - 1e-9))
+
+    def resolve(self, token_id: str) -> Tuple[float, object]:
+        """Tick size + order options of a token (network on first use only)"""
+        meta = self.meta.get(token_id)
+        if meta is None:
+            from py_clob_client.clob_types import PartialCreateOrderOptions
+            tick_size = self.client.get_tick_size(token_id)
+            options = PartialCreateOrderOptions(tick_size=tick_size, neg_risk=self.client.get_neg_risk(token_id))
+            self.client.get_fee_rate_bps(token_id)  # Cached by the client for create_order
+            meta = (float(tick_size), options)
+            with self.lock:
+                self.meta[token_id] = meta
+        return meta
+
+    def sign(self, token_id: str, price: float, size: float, side: str = "BUY"):
+        """Sign one order now (blocking)"""
+        from py_clob_client.clob_types import OrderArgs
+        tick, options = self.resolve(token_id)
+        decimals = max(0, -int(math.floor(math.log10(tick))))
+        limit = round(self.ticks(price, tick, side) * tick, decimals)
+        order = self.client.create_order(OrderArgs(token_id=token_id, price=limit, size=float(size), side=side), options)
+        self.signed += 1
+        return order
+
+    def _refresh(self, token_id: str, ask: float, generation: int):
+        try:
+            tick, _ = self.resolve(token_id)
+            center = round(ask / tick)
+            lo = max(1, center - self.ticks_below)
+            hi = min(int(round(1 / tick)) - 1, center + self.ticks_above)
+            wanted = sorted(((p, s) for p in range(lo, hi + 1) for s in self.sizes),
+                            key=lambda k: (abs(k[0] - center), k[1]))
+            with self.lock:
+                ladder = self.ladders.get(token_id)
+                if ladder is None or ladder.generation != generation: return
+                ladder.center = center
+                for key in [k for k in ladder.orders if not lo <= k[0] <= hi]:
+                    del ladder.orders[key]
+                missing = [k for k in wanted if k not in ladder.orders]
+            for key in missing:
+                order = self.sign(token_id, key[0] * tick, key[1])
+                with self.lock:
+                    if ladder.generation != generation: return  # Ask moved: a newer refresh takes over
+                    ladder.orders[key] = order
+        except Exception as e:
+            logger.warning(f"⚠️ 预签名失败 ({token_id[:10]}...): {e}")
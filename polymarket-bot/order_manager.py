@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Async Order Manager
+- Order lifecycle on top of ClobClient: PENDING (sent) -> LIVE (resting) ->
+  PARTIAL -> FILLED, or CANCELLED / REJECTED. Only forward transitions are
+  taken; a cancelled order may still carry the fills it got before the cancel.
+- Fills come from the authenticated user channel. Trade events repeat per
+  settlement step (MATCHED / MINED / CONFIRMED), so they are counted once per
+  trade id, and FAILED reverses them. Order events carry the cumulative
+  size_matched. Events that arrive before the POST response names the order id
+  are parked until it does.
+- While the channel is down, and after every reconnect, open orders are
+  reconciled from REST (get_order), so no fill or cancel is missed.
+- Orders are signed through order_cache.py (pre-signed BUYs when available),
+  posted off the event loop; submit_many() batches through post_orders;
+  replace() is cancel + re-post of the unfilled remainder (no amend on the CLOB).
+- clob_standin.py serves the same REST + user channel locally for tests.
+"""
+
+import json
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import websockets
+
+from order_cache import OrderCache
+
+logger = logging.getLogger(__name__)
+
+USER_WS_URL = "wss://ws-subscriptions-clob.polymarket.com/ws/user"
+
+PENDING, LIVE, PARTIAL, FILLED, CANCELLED, REJECTED = "PENDING", "LIVE", "PARTIAL", "FILLED", "CANCELLED", "REJECTED"
+TERMINAL = (FILLED, CANCELLED, REJECTED)
+TRANSITIONS = {
+    PENDING: {LIVE, PARTIAL, FILLED, CANCELLED, REJECTED},
+    LIVE: {PARTIAL, FILLED, CANCELLED},
+    PARTIAL: {FILLED, CANCELLED},
+}
+BATCH_LIMIT = 15      # Orders per post_orders call
+EPS = 1e-6            # Share amounts are 6-decimal fixed point
+PARK_SEC = 30         # How long events for unknown order ids are kept
+KEEP_DONE_SEC = 600   # Finished orders stay queryable this long
+
+
+@dataclass
+class Order:
+    token_id: str
+    side: str
+    price: float
+    size: float
+    order_type: str = "GTC"
+    market: Optional[str] = None           # Condition id (user channel subscription)
+    id: Optional[str] = None               # Exchange order id, once acknowledged
+    state: str = PENDING
+    acknowledged: bool = False
+    cancel_seen: bool = False
+    trade_filled: float = 0.0              # From de-duplicated trade events
+    trade_cost: float = 0.0
+    reported_filled: float = 0.0           # Cumulative size_matched (order events / REST)
+    trades: Dict[str, float] = field(default_factory=dict)
+    fee: float = 0.0                       # USDC paid in fees (simulated fills)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def filled(self) -> float:
+        return max(self.trade_filled, self.reported_filled)
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self.size - self.filled)
+
+    @property
+    def avg_price(self) -> float:
+        """Average fill price (the limit until trade prices are known)"""
+        return self.trade_cost / self.trade_filled if self.trade_filled > EPS else self.price
+
+    @property
+    def net_price(self) -> float:
+        """Average price after fees (a BUY pays them on top, a SELL receives less)"""
+        if self.trade_filled <= EPS: return self.avg_price
+        return self.avg_price + (self.fee if self.side == "BUY" else -self.fee) / self.trade_filled
+
+    @property
+    def is_open(self) -> bool:
+        return self.state not in TERMINAL
+
+
+class OrderManager:
+    """Tracks our orders through REST responses, the user channel and reconciliation"""
+
+    def __init__(self, client, cache: Optional[OrderCache] = None, ws_url: str = USER_WS_URL,
+                 ping_interval: float = 10.0, reconcile_sec: float = 15.0):
+        self.client = client
+        self.cache = cache or OrderCache(client)
+        self.ws_url = ws_url
+        self.ping_interval = ping_interval
+        self.reconcile_sec = reconcile_sec
+        self.orders: Dict[str, Order] = {}      # By exchange id
+        self.inflight = 0                       # Posts without a response yet
+        self.parked: Dict[str, List[tuple]] = {}  # Order id -> [(received at, event)]
+        self.markets: set = set()
+        self.listeners: List[Callable[[Order], None]] = []
+        self.ws = None
+        self.running = False
+        self.connected = False
+        self.reconnects = 0
+        self.last_pong_at = 0.0
+        self.has_markets = asyncio.Event()
+        self.stats = {"submitted": 0, "rejected": 0, "cancelled": 0, "filled": 0, "events": 0, "reconciled": 0}
+
+    # --- Orders ---
+
+    async def submit(self, token_id: str, side: str, price: float, size: float, order_type: str = "GTC",
+                     market: Optional[str] = None) -> Order:
+        """Sign (pre-signed if cached) and post one order. Never raises: failures end as REJECTED."""
+        return (await self.submit_many([(token_id, side, price, size, order_type, market)]))[0]
+
+    async def submit_many(self, specs: Sequence[tuple]) -> List[Order]:
+        """
+        Post (token_id, side, price, size[, order_type[, market]]) orders, at most
+        BATCH_LIMIT per post_orders request. Returns the orders in the same order.
+        """
+        orders = [Order(*spec) for spec in specs]
+        signed = [self.cache.take(o.token_id, o.price, o.size) if o.side == "BUY" else None for o in orders]
+        misses = [i for i, s in enumerate(signed) if s is None]
+        if misses:
+            try:
+                fresh = await asyncio.to_thread(
+                    lambda: [self.cache.sign(orders[i].token_id, orders[i].price, orders[i].size, orders[i].side)
+                             for i in misses])
+            except Exception as e:
+                for o in orders: self._reject(o, f"signing failed: {e}")
+                return orders
+            for i, s in zip(misses, fresh): signed[i] = s
+        for o, s in zip(orders, signed):
+            o.price = self._limit(s)
+        self.watch(o.market for o in orders)
+
+        self.stats["submitted"] += len(orders)
+        self.inflight += len(orders)
+        try:
+            for k in range(0, len(orders), BATCH_LIMIT):
+                batch, payloads = orders[k:k + BATCH_LIMIT], signed[k:k + BATCH_LIMIT]
+                try:
+                    if len(batch) == 1:
+                        responses = [await asyncio.to_thread(self.client.post_order, payloads[0], batch[0].order_type)]
+                    else:
+                        from py_clob_client.clob_types import PostOrdersArgs
+                        args = [PostOrdersArgs(order=s, orderType=o.order_type) for o, s in zip(batch, payloads)]
+                        responses = await asyncio.to_thread(self.client.post_orders, args)
+                except Exception as e:
+                    for o in batch: self._reject(o, str(e))
+                    continue
+                for o, resp in zip(batch, responses if isinstance(responses, list) else [responses]):
+                    self._on_post_response(o, resp)
+        finally:
+            self.inflight -= len(orders)
+        return orders
+
+    async def cancel(self, order: Order) -> bool:
+        """Cancel one open order. True if it ended up cancelled (possibly after partial fills)."""
+        return (await self.cancel_many([order]))[0]
+
+    async def cancel_many(self, orders: Iterable[Order]) -> List[bool]:
+        orders = list(orders)
+        ids = [o.id for o in orders if o.id and o.is_open]
+        if ids:
+            try:
+                if len(ids) == 1:
+                    resp = await asyncio.to_thread(self.client.cancel, ids[0])
+                else:
+                    resp = await asyncio.to_thread(self.client.cancel_orders, ids)
+            except Exception as e:
+                logger.warning(f"⚠️ 撤单请求失败: {e}")
+                resp = {}
+            canceled = set(resp.get("canceled") or [])
+            for o in orders:
+                if o.id in canceled:
+                    o.cancel_seen = True
+                    self._advance(o)
+            # Not cancelled: usually filled in the meantime, ask the exchange
+            stale = [o for o in orders if o.id in ids and o.id not in canceled and o.is_open]
+            if stale: await self.reconcile(stale)
+        return [o.state == CANCELLED for o in orders]
+
+    async def replace(self, order: Order, price: float, size: Optional[float] = None) -> Optional[Order]:
+        """Cancel, then post the unfilled remainder (of `size`, default the original size) at `price`"""
+        if order.is_open and not await self.cancel(order):
+            return None # Filled (or unknown) instead of cancelled: nothing to replace
+        remaining = (order.size if size is None else size) - order.filled
+        if remaining <= EPS: return None
+        return await self.submit(order.token_id, order.side, price, remaining, order.order_type, order.market)
+
+    async def wait(self, order: Order, timeout: Optional[float] = None) -> Order:
+        """Wait until the order is FILLED / CANCELLED / REJECTED (or the timeout passes)"""
+        try:
+            await asyncio.wait_for(order.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return order
+
+    def open_orders(self) -> List[Order]:
+        return [o for o in self.orders.values() if o.is_open]
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"订单 提交 {s['submitted']} | 成交 {s['filled']} | 撤单 {s['cancelled']} | 拒绝 {s['rejected']} | "
+                f"挂单中 {len(self.open_orders())} | 用户频道 {'已连接' if self.connected else '断开'}")
+
+    # --- State machine ---
+
+    @staticmethod
+    def _limit(signed) -> float:
+        """Limit price of a signed order (amounts are USDC / shares in fixed point)"""
+        d = signed.dict()
+        maker, taker = int(d["makerAmount"]), int(d["takerAmount"])
+        return round(maker / taker if d["side"] == "BUY" else taker / maker, 6)
+
+    def _on_post_response(self, order: Order, resp):
+        if not isinstance(resp, dict) or not resp.get("success", False) or not resp.get("orderID"):
+            msg = resp.get("errorMsg") if isinstance(resp, dict) else resp
+            self._reject(order, msg or "rejected")
+            return
+        order.id = resp["orderID"]
+        self.orders[order.id] = order
+        status = resp.get("status")
+        if status in ("live", "matched"): order.acknowledged = True
+        if status == "unmatched": # FAK / FOK that found nothing
+            order.acknowledged = order.cancel_seen = True
+        for _, event in self.parked.pop(order.id, []):
+            self._apply(order, event)
+        self._advance(order)
+
+    def _reject(self, order: Order, error: str):
+        order.error = str(error)
+        self.stats["rejected"] += 1
+        logger.warning(f"❌ 订单被拒: {order.side} {order.size:g} @ {order.price:.2f}: {order.error}")
+        self._set_state(order, REJECTED)
+
+    def _advance(self, order: Order):
+        """Derive the state from what we know (fills, cancel, acknowledgement)"""
+        if order.filled >= order.size - EPS: target = FILLED
+        elif order.cancel_seen: target = CANCELLED
+        elif order.filled > EPS: target = PARTIAL
+        elif order.acknowledged: target = LIVE
+        else: return
+        if target == order.state:
+            self._notify(order) # Fill progress within PARTIAL, or late fills of a finished order
+        elif order.state in TERMINAL:
+            self._notify(order)
+        elif target in TRANSITIONS[order.state]:
+            self._set_state(order, target)
+        else:
+            logger.warning(f"⚠️ 非法订单状态迁移 {order.state} -> {target} ({order.id})")
+
+    def _set_state(self, order: Order, state: str):
+        order.state = state
+        order.updated_at = time.time()
+        if state == FILLED: self.stats["filled"] += 1
+        if state == CANCELLED: self.stats["cancelled"] += 1
+        if state in TERMINAL: order.done.set()
+        self._notify(order)
+
+    def _notify(self, order: Order):
+        for cb in self.listeners:
+            try:
+                cb(order)
+            except Exception as e:
+                logger.error(f"Order listener error: {e}")
+
+    # --- User channel ---
+
+    def watch(self, markets: Iterable[Optional[str]]):
+        """Receive user events for these condition ids"""
+        new = [m for m in markets if m and m not in self.markets]
+        if not new: return
+        self.markets.update(new)
+        self.has_markets.set()
+        if self.connected:
+            asyncio.ensure_future(self._send({"markets": new, "operation": "subscribe"}))
+
+    async def run(self):
+        self.running = True
+        reconciler = asyncio.create_task(self._reconcile_loop())
+        backoff = 1
+        try:
+            while self.running:
+                await self.has_markets.wait()
+                try:
+                    async with websockets.connect(self.ws_url, ping_interval=None, max_queue=None) as ws:
+                        self.ws = ws
+                        creds = self.client.creds
+                        await ws.send(json.dumps({"auth": {"apiKey": creds.api_key, "secret": creds.api_secret,
+                                                           "passphrase": creds.api_passphrase},
+                                                  "markets": sorted(self.markets), "type": "user"}))
+                        self.connected = True
+                        self.last_pong_at = time.time()
+                        backoff = 1
+                        logger.info(f"📡 用户频道已连接 ({len(self.markets)} 个市场)")
+                        # Anything that happened while we were away
+                        asyncio.create_task(self.reconcile())
+                        heartbeat = asyncio.create_task(self._heartbeat(ws))
+                        try:
+                            async for msg in ws:
+                                self._on_message(msg)
+                        finally:
+                            heartbeat.cancel()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"User channel error: {e}")
+                self.connected = False
+                self.ws = None
+                if self.running:
+                    self.reconnects += 1
+                    logger.warning(f"⚠️ 用户频道断开，{backoff}s 后重连 (第 {self.reconnects} 次)")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+        finally:
+            reconciler.cancel()
+
+    async def close(self):
+        self.running = False
+        if self.ws: await self.ws.close()
+
+    async def _heartbeat(self, ws):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            if time.time() - self.last_pong_at > 3 * self.ping_interval:
+                logger.warning("⚠️ 用户频道心跳超时，强制重连")
+                await ws.close()
+                return
+            await ws.send("PING")
+
+    async def _send(self, msg: dict):
+        try:
+            await self.ws.send(json.dumps(msg))
+        except Exception as e:
+            logger.warning(f"User channel send failed: {e}")
+
+    def _on_message(self, msg):
+        if msg == "PONG":
+            self.last_pong_at = time.time()
+            return
+        try:
+            data = json.loads(msg)
+        except ValueError:
+            return
+        for event in (data if isinstance(data, list) else [data]):
+            self.stats["events"] += 1
+            try:
+                self._dispatch(event)
+            except Exception as e:
+                logger.error(f"User event error: {e}")
+
+    def _dispatch(self, event: dict):
+        if event.get("event_type") == "trade":
+            ids = [event.get("taker_order_id")] + [m.get("order_id") for m in event.get("maker_orders") or []]
+        else:
+            ids = [event.get("id")]
+        for order_id in ids:
+            if not order_id: continue
+            order = self.orders.get(order_id)
+            if order is not None:
+                self._apply(order, event)
+                self._advance(order)
+            elif self.inflight:
+                # Possibly ours, with the POST response still on its way
+                self.parked.setdefault(order_id, []).append((time.time(), event))
+
+    def _apply(self, order: Order, event: dict):
+        if event.get("event_type") == "trade":
+            if event.get("taker_order_id") == order.id:
+                size, price = float(event["size"]), float(event["price"])
+            else:
+                mine = next(m for m in event.get("maker_orders") or [] if m.get("order_id") == order.id)
+                size, price = float(mine["matched_amount"]), float(mine["price"])
+            key = event.get("id")
+            if event.get("status") == "FAILED":
+                if key in order.trades: # Settlement failed: the fill did not happen
+                    counted = order.trades.pop(key)
+                    order.trade_filled -= counted
+                    order.trade_cost -= counted * price
+                    order.reported_filled = min(order.reported_filled, order.trade_filled)
+            elif key not in order.trades:
+                order.trades[key] = size
+                order.trade_filled += size
+                order.trade_cost += size * price
+        else:
+            order.acknowledged = True
+            if event.get("size_matched") is not None:
+                order.reported_filled = max(order.reported_filled, float(event["size_matched"]))
+            if event.get("type") == "CANCELLATION":
+                order.cancel_seen = True
+
+    # --- Reconciliation ---
+
+    async def reconcile(self, orders: Optional[List[Order]] = None):
+        """Refresh open orders from REST (cumulative matched size + status)"""
+        orders = [o for o in (orders if orders is not None else self.open_orders()) if o.id]
+        if not orders: return
+
+        async def one(o: Order):
+            try:
+                raw = await asyncio.to_thread(self.client.get_order, o.id)
+            except Exception as e:
+                logger.debug(f"get_order {o.id} failed: {e}")
+                return
+            if not raw: return
+            o.acknowledged = True
+            o.reported_filled = max(o.reported_filled, float(raw.get("size_matched") or 0))
+            if str(raw.get("status", "")).upper().startswith(("CANCELED", "INVALID")):
+                o.cancel_seen = True
+            self._advance(o)
+
+        await asyncio.gather(*(one(o) for o in orders))
+        self.stats["reconciled"] += len(orders)
+
+    async def _reconcile_loop(self):
+        while self.running:
+            await asyncio.sleep(self.reconcile_sec)
+            now = time.time()
+            for order_id in [i for i, events in self.parked.items() if now - events[-1][0] > PARK_SEC]:
+                del self.parked[order_id]
+            for order_id in [i for i, o in self.orders.items() if not o.is_open and now - o.updated_at > KEEP_DONE_SEC]:
+                del self.orders[order_id]
+            if not self.connected:
+                try:
+                    await self.reconcile()
+                except Exception as e:
+                    logger.error(f"Order reconcile error: {e}")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Incremental Performance Stats
+- Consumes closed trades (SETTLED / STOP_LOSS) from the trade journal once, via a record cursor.
+- Every trade updates the aggregates in O(1): all-time totals + equity drawdown,
+  a rolling window of the last N closed trades and per-hour buckets.
+- Time windows ("last 24h", "today", "365 days") are sums of hour buckets, so a
+  report never touches individual trades (hour resolution).
+- State is checkpointed next to the journal, so a restart only reads trades
+  appended since the last checkpoint.
+"""
+
+import os
+import json
+import time
+import tempfile
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from trade_journal import TradeJournal, CLOSED_TYPES, parse_time, day_range
+
+CHECKPOINT_NAME = "perf_stats.json"  # Stored in the journal directory
+WINDOW = 20               # Rolling "last N closed trades" window
+BUCKET_RETENTION_H = 400 * 24
+
+
+def summarize(wins: int, losses: int, gross_profit: float, gross_loss: float, **extra) -> dict:
+    """Derived metrics from raw win/loss sums"""
+    total = wins + losses
+    if gross_loss > 0:
+        profit_factor = gross_profit / gross_loss
+    else:
+        profit_factor = float('inf') if gross_profit > 0 else 0.0
+    return {
+        "trades": total,
+        "wins": wins,
+        "losses": losses,
+        "win_rate": wins / total if total else 0.0,
+        "profit_factor": profit_factor,
+        "avg_win": gross_profit / wins if wins else 0.0,
+        "avg_loss": gross_loss / losses if losses else 0.0,
+        "net_pnl": gross_profit - gross_loss,
+        **extra,
+    }
+
+
+class PerfStats:
+    """Running aggregates over the journal's closed trades"""
+
+    def __init__(self, journal: Optional[TradeJournal] = None, checkpoint: Optional[str] = None, window: int = WINDOW):
+        self.journal = journal if journal is not None else TradeJournal() # An empty journal is falsy (__len__)
+        self.checkpoint = checkpoint or os.path.join(self.journal.path, CHECKPOINT_NAME)
+        self.window_size = window
+        self.reset()
+        self.load()
+
+    def reset(self):
+        self.cursor = 0  # Next journal record number to read
+        # All-time: [wins, losses, gross_profit, gross_loss]
+        self.total = [0, 0, 0.0, 0.0]
+        self.equity = 0.0
+        self.peak = 0.0
+        self.max_drawdown = 0.0
+        # Last N closed trades + their running sums
+        self.window = deque()
+        self.window_sums = [0, 0, 0.0, 0.0]
+        # Epoch hour -> [wins, losses, gross_profit, gross_loss]
+        self.buckets: Dict[int, list] = {}
+
+    # --- Updates ---
+
+    def update(self) -> int:
+        """Fold in trades appended to the journal since the last call. Returns how many were closed trades."""
+        if self.cursor > len(self.journal): # Journal was replaced: start over
+            self.reset()
+        records, self.cursor = self.journal.read_from(self.cursor)
+        added = 0
+        for rec in records:
+            if rec.get("type") in CLOSED_TYPES and "pnl" in rec:
+                self.add(parse_time(rec["time"]), float(rec["pnl"]))
+                added += 1
+        if records: self.save()
+        return added
+
+    def add(self, ts: float, pnl: float):
+        """Apply one closed trade, O(1)"""
+        row = (1, 0, pnl, 0.0) if pnl > 0 else (0, 1, 0.0, -pnl)
+        for i in range(4): self.total[i] += row[i]
+
+        self.equity += pnl
+        if self.equity > self.peak: self.peak = self.equity
+        if self.peak - self.equity > self.max_drawdown: self.max_drawdown = self.peak - self.equity
+
+        self.window.append(row)
+        for i in range(4): self.window_sums[i] += row[i]
+        if len(self.window) > self.window_size:
+            old = self.window.popleft()
+            for i in range(4): self.window_sums[i] -= old[i]
+
+        bucket = self.buckets.setdefault(int(ts // 3600), [0, 0, 0.0, 0.0])
+        for i in range(4): bucket[i] += row[i]
+
+    # --- Queries ---
+
+    def all_time(self) -> dict:
+        return summarize(*self.total, max_drawdown=self.max_drawdown, equity=self.equity)
+
+    def recent(self) -> dict:
+        """Stats of the last `window` closed trades (drawdown within the window)"""
+        equity = peak = dd = 0.0
+        for _, _, gp, gl in self.window:
+            equity += gp - gl
+            peak = max(peak, equity)
+            dd = max(dd, peak - equity)
+        return summarize(*self.window_sums, max_drawdown=dd)
+
+    def between(self, start: float, end: float) -> dict:
+        """Stats of trades in [start, end), by hour bucket"""
+        lo, hi = int(start // 3600), int(end // 3600)
+        if end % 3600: hi += 1
+        sums = [0, 0, 0.0, 0.0]
+        if hi - lo < len(self.buckets):
+            for h in range(lo, hi):
+                b = self.buckets.get(h)
+                if b:
+                    for i in range(4): sums[i] += b[i]
+        else:
+            for h, b in self.buckets.items():
+                if lo <= h < hi:
+                    for i in range(4): sums[i] += b[i]
+        return summarize(*sums)
+
+    def last_hours(self, hours: float) -> dict:
+        now = time.time()
+        return self.between(now - hours * 3600, now)
+
+    def day(self, day: Optional[datetime] = None) -> dict:
+        """Stats of a UTC calendar day (default: today)"""
+        return self.between(*day_range(day))
+
+    def hourly(self, hours: int = 24) -> List[dict]:
+        """Per-hour stats for the last `hours` hours (oldest first)"""
+        now_h = int(time.time() // 3600)
+        out = []
+        for h in range(now_h - hours + 1, now_h + 1):
+            b = self.buckets.get(h, [0, 0, 0.0, 0.0])
+            out.append({"hour": datetime.fromtimestamp(h * 3600, timezone.utc).isoformat(), **summarize(*b)})
+        return out
+
+    # --- Checkpoint ---
+
+    def save(self):
+        cutoff = int(time.time() // 3600) - BUCKET_RETENTION_H
+        state = {
+            "cursor": self.cursor,
+            "total": self.total,
+            "equity": self.equity,
+            "peak": self.peak,
+            "max_drawdown": self.max_drawdown,
+            "window_size": self.window_size,
+            "window": list(self.window),
+            "buckets": {str(h): b for h, b in self.buckets.items() if h >= cutoff},
+        }
+        # Unique tmp name: the bot, analytics, daily_report, dashboards... may all save at once
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.checkpoint) or ".", prefix=CHECKPOINT_NAME, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.checkpoint)
+        except BaseException:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+
+    def load(self):
+        """Restore the last checkpoint (fresh state if missing / unreadable / other window size)"""
+        if not os.path.exists(self.checkpoint): return
+        try:
+            with open(self.checkpoint, "r") as f:
+                state = json.load(f)
+            if state.get("window_size") != self.window_size: return
+            self.cursor = state["cursor"]
+            self.total = state["total"]
+            self.equity = state["equity"]
+            self.peak = state["peak"]
+            self.max_drawdown = state["max_drawdown"]
+            self.window = deque(tuple(r) for r in state["window"])
+            self.window_sums = [sum(r[i] for r in self.window) for i in range(4)]
+            self.buckets = {int(h): b for h, b in state["buckets"].items()}
+        except Exception:
+            self.reset()
+
+
+if __name__ == "__main__":
+    stats = PerfStats()
+    stats.update()
+    print(json.dumps({
+        "last_20": stats.recent(),
+        "24h": stats.last_hours(24),
+        "today": stats.day(),
+        "all_time": stats.all_time(),
+    }, indent=2))
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Crash-Safe Position Book
+- Open positions as compact __slots__ records, indexed by id, market slug and
+  token: "do we hold this market", stop-loss and settlement lookups are dict
+  hits instead of list scans.
+- Every mutation (open / sell / close) is applied in memory and queued for
+  a write-ahead log. Frame = <length, crc32> + compact JSON op carrying a
+  sequence number. A writer thread appends and fsyncs queued frames in
+  groups, so a disk stall never blocks the event loop; a crash loses at most
+  the ops of the fsync in flight. flush() waits until everything is durable.
+- Every `snapshot_every` ops the whole book is written to snapshot.json
+  (tmp + fsync + atomic replace, in order with the log) and the log is truncated.
+- Recovery = snapshot + log ops with a higher sequence number; a torn or
+  corrupt tail frame (crash mid-write) is cut off. A restart is back in
+  business in milliseconds with every open position.
+
+Usage:
+    python3 polymarket-bot/position_book.py [DIR]   # List recovered open positions
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import atexit
+import struct
+import logging
+import threading
+from collections import deque
+from typing import Dict, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+POSITIONS_DIR = "polymarket-bot/positions"
+FRAME = struct.Struct("<II") # payload bytes, crc32
+SNAPSHOT_EVERY = 256
+FIELDS = ("id", "market_slug", "condition_id", "token_id", "symbol", "direction", "entry_price",
+          "size", "shares", "strike", "prev_trend", "opened_at", "end_ts", "sold_shares", "sold_value")
+
+
+class Position:
+    """One open position (fields as in FIELDS; end_ts = settlement time of its market,
+    sold_shares / sold_value = partial exits so far, shares = what is still held)"""
+
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for k in FIELDS:
+            setattr(self, k, fields.get(k))
+        if self.sold_shares is None: self.sold_shares, self.sold_value = 0.0, 0.0
+
+    def to_dict(self) -> dict:
+        return {k: getattr(self, k) for k in FIELDS}
+
+    def __repr__(self) -> str:
+        return f"Position({self.id} {self.market_slug} {self.direction} {self.shares:g} @ {self.entry_price:.3f})"
+
+
+class PositionBook:
+    """Open positions, write-ahead logged"""
+
+    def __init__(self, path: str = POSITIONS_DIR, snapshot_every: int = SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_every = snapshot_every
+        os.makedirs(path, exist_ok=True)
+        self.wal_file = os.path.join(path, "wal.log")
+        self.snapshot_file = os.path.join(path, "snapshot.json")
+        self.items: Dict[int, Position] = {}
+        self.by_market: Dict[str, Dict[int, Position]] = {}
+        self.by_token: Dict[str, Dict[int, Position]] = {}
+        self.seq = 0
+        self.next_id = 1
+        self.logged = 0 # Ops in the log since the last snapshot
+        t0 = time.perf_counter()
+        replayed = self._recover()
+        self.wal = open(self.wal_file, "ab")
+        self.wal_size = os.fstat(self.wal.fileno()).st_size # End of the last complete write: a failed one is cut back to it
+        self.queue = deque() # (seq, frame bytes) | (seq, snapshot dict)
+        self.cond = threading.Condition()
+        self.durable_seq = self.seq
+        self.stopped = False
+        self.thread = threading.Thread(target=self._writer, name="position-wal", daemon=True)
+        self.thread.start()
+        atexit.register(self.close_book)
+        if self.items or replayed:
+            logger.info(f"📒 持仓已恢复: {len(self.items)} 个 (日志 {replayed} 条, {(time.perf_counter() - t0) * 1000:.1f}ms)")
+
+    # --- Queries ---
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __iter__(self) -> Iterator[Position]:
+        return iter(list(self.items.values()))
+
+    def in_market(self, slug: str) -> List[Position]:
+        """Positions of one market (a copy: safe to close while iterating)"""
+        return list(self.by_market.get(slug, {}).values())
+
+    def has_market(self, slug: str) -> bool:
+        return slug in self.by_market
+
+    def for_token(self, token_id: str) -> List[Position]:
+        return list(self.by_token.get(token_id, {}).values())
+
+    def markets(self) -> List[str]:
+        return list(self.by_market)
+
+    # --- Mutations (logged, then applied) ---
+
+    def open(self, **fields) -> Position:
+        fields = {k: fields.get(k) for k in FIELDS if k != "id"}
+        fields["id"] = self.next_id
+        if fields["opened_at"] is None: fields["opened_at"] = time.time()
+        self._log({"op": "open", **fields})
+        pos = self._open(fields)
+        self._rotate()
+        return pos
+
+    def sell(self, pos: Position, shares: float, value: float):
+        """Record a partial exit: `shares` sold for `value` in total (the position stays open)"""
+        if pos.id not in self.items: return
+        op = {"shares": pos.shares - shares, "sold_shares": pos.sold_shares + shares, "sold_value": pos.sold_value + value}
+        self._log({"op": "sell", "id": pos.id, **op})
+        for k, v in op.items(): setattr(pos, k, v)
+        self._rotate()
+
+    def close(self, pos: Position):
+        if pos.id not in self.items: return
+        self._log({"op": "close", "id": pos.id})
+        self._close(pos.id)
+        self._rotate()
+
+    def expire(self, before_ts: float) -> int:
+        """Drop positions of markets that ended before `before_ts` (one check per market)"""
+        stale = [p for ps in self.by_market.values() if (next(iter(ps.values())).end_ts or 0) < before_ts
+                 for p in ps.values()]
+        for p in stale:
+            self.close(p)
+        return len(stale)
+
+    def summary(self) -> str:
+        return f"持仓簿 {len(self.items)} 个 | {len(self.by_market)} 个市场 | 日志 {self.logged}/{self.snapshot_every} | seq {self.seq}"
+
+    # --- Log / snapshot ---
+
+    def _log(self, op: dict):
+        self.seq += 1
+        body = json.dumps({**op, "seq": self.seq}, separators=(",", ":")).encode()
+        self._queue(FRAME.pack(len(body), zlib.crc32(body)) + body)
+        self.logged += 1
+
+    def _rotate(self):
+        """Snapshot once enough ops are logged (after the last one was applied)"""
+        if self.logged >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        """Queue the whole book as a snapshot; the log restarts empty after it"""
+        self._queue({"seq": self.seq, "next_id": self.next_id, "positions": [p.to_dict() for p in self.items.values()]})
+        self.logged = 0
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until every op so far is fsync'd (shutdown / tests; never from the event loop)"""
+        target = self.seq
+        with self.cond:
+            return self.cond.wait_for(lambda: self.durable_seq >= target or self.stopped and not self.thread.is_alive(), timeout)
+
+    def close_book(self):
+        """Write everything queued, then close the log"""
+        if self.stopped: return
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        self.thread.join()
+        if not self.wal.closed: self.wal.close()
+
+    def _queue(self, item):
+        with self.cond:
+            self.queue.append((self.seq, item))
+            self.cond.notify_all()
+
+    # --- Writer thread ---
+
+    def _writer(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.queue or self.stopped)
+                items = list(self.queue)
+                self.queue.clear()
+                stopping = self.stopped
+            if items:
+                try:
+                    self._write(items)
+                except Exception as e:
+                    logger.error(f"❌ 持仓日志写入失败 (将重试): {e}")
+                    with self.cond:
+                        self.queue.extendleft(reversed(items))
+                    if stopping: return # Shutting down on a dead disk: don't hang
+                    time.sleep(1.0)
+                    continue
+            with self.cond:
+                if items: self.durable_seq = items[-1][0]
+                self.cond.notify_all()
+                if stopping and not self.queue: return
+
+    def _write(self, items: list):
+        if os.fstat(self.wal.fileno()).st_size != self.wal_size: # A failed write left part of a batch: retry it whole
+            self.wal.truncate(self.wal_size)
+        frames = []
+        for _, item in items:
+            if isinstance(item, bytes):
+                frames.append(item)
+            else:
+                self._append(frames)
+                frames = []
+                self._write_snapshot(item)
+        self._append(frames)
+
+    def _append(self, frames: list):
+        if not frames: return
+        self.wal.write(b"".join(frames))
+        self.wal.flush()
+        os.fsync(self.wal.fileno())
+        self.wal_size = os.fstat(self.wal.fileno()).st_size
+
+    def _write_snapshot(self, state: dict):
+        tmp = self.snapshot_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_file)
+        _fsync_dir(self.path)
+        # A crash before this truncate is harmless: ops up to the snapshot's seq are skipped on recovery
+        self.wal.truncate(0)
+        self.wal.flush()
+        os.fsync(self.wal.fileno())
+        self.wal_size = 0
+
+    def _recover(self) -> int:
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, "r") as f:
+                snap = json.load(f)
+            self.seq, self.next_id = snap["seq"], snap["next_id"]
+            for fields in snap["positions"]:
+                self._open(fields)
+        if not os.path.exists(self.wal_file): return 0
+        with open(self.wal_file, "rb") as f:
+            data = f.read()
+        pos, replayed = 0, 0
+        while pos + FRAME.size <= len(data):
+            length, crc = FRAME.unpack_from(data, pos)
+            body = data[pos + FRAME.size:pos + FRAME.size + length]
+            if len(body) < length or zlib.crc32(body) != crc: break # Torn / corrupt tail
+            op = json.loads(body)
+            pos += FRAME.size + length
+            if op["seq"] <= self.seq: continue # Already in the snapshot
+            self.seq = op["seq"]
+            self._apply(op)
+            replayed += 1
+        if pos < len(data):
+            logger.warning(f"⚠️ 持仓日志尾部损坏，已截断 {len(data) - pos} 字节")
+            with open(self.wal_file, "r+b") as f:
+                f.truncate(pos)
+                os.fsync(f.fileno())
+        self.logged = replayed
+        return replayed
+
+    def _apply(self, op: dict):
+        kind = op["op"]
+        if kind == "open":
+            self._open(op)
+        elif kind == "sell" and op["id"] in self.items:
+            pos = self.items[op["id"]]
+            pos.shares, pos.sold_shares, pos.sold_value = op["shares"], op["sold_shares"], op["sold_value"]
+        elif kind == "close":
+            self._close(op["id"])
+
+    def _open(self, fields: dict) -> Position:
+        pos = Position(**fields)
+        self.items[pos.id] = pos
+        self.by_market.setdefault(pos.market_slug, {})[pos.id] = pos
+        self.by_token.setdefault(pos.token_id, {})[pos.id] = pos
+        self.next_id = max(self.next_id, pos.id + 1)
+        return pos
+
+    def _close(self, pos_id: int):
+        pos = self.items.pop(pos_id, None)
+        if pos is None: return
+        for index, key in ((self.by_market, pos.market_slug), (self.by_token, pos.token_id)):
+            bucket = index.get(key)
+            if bucket is None: continue
+            bucket.pop(pos_id, None)
+            if not bucket: del index[key]
+
+
+def _fsync_dir(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+if __name__ == "__main__":
+    book = PositionBook(sys.argv[1] if len(sys.argv) > 1 else POSITIONS_DIR)
+    for p in book:
+        print(json.dumps(p.to_dict(), ensure_ascii=False))
+    print(book.summary())
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Market Data Recorder
+- Keeps every raw message the bot receives: Polymarket market channel and REST
+  book snapshots, Binance trade / bookTicker and depth streams (+ depth
+  snapshots), and the bot's cycle metadata (tokens, strike, final price), each
+  stamped with its receive time in ns.
+- One directory per channel under RECORD_DIR, holding hourly segment files of
+  zstd-compressed chunks. record() only appends to a list on the event loop;
+  a writer thread packs, compresses and writes whole chunks.
+- Chunk = header + key table (JSON) + one zstd frame of records
+  (<ts_ns, key id, length> + raw bytes). Closing a segment writes a sidecar
+  .idx listing, per key (token / symbol), the chunks that contain it; a
+  segment cut short by a crash is indexed by scanning chunk headers.
+- read() mmaps segments, skips chunks the index rules out and yields records
+  whose payload is a memoryview into the decompressed chunk (no per-record
+  copies), merged in timestamp order across channels (both venues).
+- export_ticks() turns a recording into backtest_engine.py tick files.
+
+Usage:
+    python3 polymarket-bot/recorder.py stats [DIR]
+    python3 polymarket-bot/recorder.py ticks [DIR] [OUT]
+"""
+
+import os
+import sys
+import json
+import mmap
+import time
+import heapq
+import atexit
+import struct
+import logging
+import threading
+from collections import namedtuple
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import zstandard
+
+logger = logging.getLogger(__name__)
+
+RECORD_DIR = "polymarket-bot/recordings"
+CHANNELS = ("clob_market", "clob_book", "binance_stream", "binance_depth", "binance_depth_snapshot", "bot_cycle")
+CHUNK_MAGIC = b"RCK1"
+CHUNK_HEAD = struct.Struct("<4sIIIqq")  # magic, key table bytes, frame bytes, records, first ts, last ts
+RECORD_HEAD = struct.Struct("<qHI")     # receive ts (ns), key id, payload bytes
+SEGMENT_SEC = 3600
+
+Record = namedtuple("Record", "ts_ns channel key payload")
+
+
+class _Segment:
+    """Open segment file of one channel (writer thread only)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.chunks: List[list] = []          # [offset, length, first ts, last ts, records]
+        self.keys: Dict[str, List[int]] = {}  # key -> chunk numbers
+        if os.path.exists(path): # Restarted within the hour: append after the last complete chunk
+            index = _load_index(path)
+            self.chunks, self.keys = index["chunks"], index["keys"]
+            os.truncate(path, self.chunks[-1][0] + self.chunks[-1][1] if self.chunks else 0)
+            _drop_index(path)
+        self.file = open(path, "ab")
+
+    def close(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        _write_index(self.path, {"chunks": self.chunks, "keys": self.keys})
+
+
+class MarketRecorder:
+    """Batched, compressed, off-loop recording of raw feed messages"""
+
+    def __init__(self, root: str = RECORD_DIR, chunk_records: int = 2000, flush_sec: float = 1.0,
+                 segment_sec: int = SEGMENT_SEC, level: int = 3, max_pending: int = 500_000):
+        self.root = root
+        self.chunk_records = chunk_records
+        self.flush_sec = flush_sec
+        self.segment_sec = segment_sec
+        self.max_pending = max_pending
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.lock = threading.Lock()
+        self.pending: Dict[str, list] = {}
+        self.pending_count = 0
+        self.wake = threading.Event()
+        self.stopped = False
+        self.segments: Dict[str, _Segment] = {}
+        self.stats = {"records": 0, "chunks": 0, "raw_bytes": 0, "written_bytes": 0, "dropped": 0}
+        self.thread = threading.Thread(target=self._writer, name="recorder", daemon=True)
+        self.thread.start()
+        atexit.register(self.close) # Normal exit flushes; a crash loses at most flush_sec of data
+
+    # --- Event loop side ---
+
+    def record(self, channel: str, payload, key: str = "", ts_ns: Optional[int] = None):
+        """Queue one raw message (str or bytes). `key`: token / symbol, comma-separated if several."""
+        ts_ns = time.time_ns() if ts_ns is None else ts_ns
+        with self.lock:
+            if self.pending_count >= self.max_pending: # Writer stalled: drop rather than grow without bound
+                self.stats["dropped"] += 1
+                return
+            batch = self.pending.setdefault(channel, [])
+            batch.append((ts_ns, key, payload))
+            self.pending_count += 1
+        if len(batch) >= self.chunk_records: self.wake.set()
+
+    def summary(self) -> str:
+        s = self.stats
+        ratio = s["raw_bytes"] / s["written_bytes"] if s["written_bytes"] else 0.0
+        return (f"录制 {s['records']} 条 | {s['written_bytes'] / 1e6:.1f} MB (压缩 {ratio:.1f}x) | "
+                f"待写 {self.pending_count} | 丢弃 {s['dropped']}")
+
+    def close(self):
+        """Write everything queued, then close segments (writes their indexes)"""
+        if self.stopped: return
+        self.stopped = True
+        self.wake.set()
+        self.thread.join()
+
+    # --- Writer thread ---
+
+    def _writer(self):
+        while True:
+            self.wake.wait(self.flush_sec)
+            self.wake.clear()
+            stopping = self.stopped
+            with self.lock:
+                pending, self.pending = self.pending, {}
+                self.pending_count = 0
+            for channel, batch in pending.items():
+                for i in range(0, len(batch), self.chunk_records):
+                    try:
+                        self._write_chunk(channel, batch[i:i + self.chunk_records])
+                    except Exception as e:
+                        logger.error(f"Recorder write failed ({channel}): {e}")
+            if stopping: break
+        for segment in self.segments.values():
+            segment.close()
+        self.segments.clear()
+
+    def _segment(self, channel: str, ts_ns: int) -> _Segment:
+        start = ts_ns // 1_000_000_000 // self.segment_sec * self.segment_sec
+        path = os.path.join(self.root, channel, f"{start}.seg")
+        segment = self.segments.get(channel)
+        if segment is not None and segment.path != path:
+            segment.close()
+            segment = None
+        if segment is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            segment = _Segment(path)
+            self.segments[channel] = segment
+        return segment
+
+    def _write_chunk(self, channel: str, batch: list):
+        segment = self._segment(channel, batch[0][0])
+        key_ids: Dict[str, int] = {}
+        body = bytearray()
+        for ts_ns, key, payload in batch:
+            if isinstance(payload, str): payload = payload.encode()
+            kid = key_ids.setdefault(key, len(key_ids))
+            body += RECORD_HEAD.pack(ts_ns, kid, len(payload))
+            body += payload
+        frame = self.compressor.compress(bytes(body))
+        keys = json.dumps(list(key_ids)).encode()
+        head = CHUNK_HEAD.pack(CHUNK_MAGIC, len(keys), len(frame), len(batch), batch[0][0], batch[-1][0])
+        offset = segment.file.tell()
+        segment.file.write(head + keys + frame)
+        segment.file.flush()
+        n = len(segment.chunks)
+        segment.chunks.append([offset, len(head) + len(keys) + len(frame), batch[0][0], batch[-1][0], len(batch)])
+        for key in key_ids:
+            for part in key.split(","):
+                chunk_ids = segment.keys.setdefault(part, [])
+                if not chunk_ids or chunk_ids[-1] != n: chunk_ids.append(n)
+        self.stats["records"] += len(batch)
+        self.stats["chunks"] += 1
+        self.stats["raw_bytes"] += len(body)
+        self.stats["written_bytes"] += segment.chunks[-1][1]
+
+
+# --- Index ---
+
+def _write_index(path: str, index: dict):
+    tmp = path + ".idx.tmp"
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, path + ".idx")
+
+
+def _drop_index(path: str):
+    try:
+        os.remove(path + ".idx")
+    except FileNotFoundError:
+        pass
+
+
+def _load_index(path: str) -> dict:
+    """Sidecar index, or one rebuilt from the chunk headers (segment still open / cut short)"""
+    try:
+        with open(path + ".idx", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    chunks, keys = [], {}
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        offset = 0
+        while offset + CHUNK_HEAD.size <= size:
+            f.seek(offset)
+            magic, klen, flen, n, t0, t1 = CHUNK_HEAD.unpack(f.read(CHUNK_HEAD.size))
+            length = CHUNK_HEAD.size + klen + flen
+            if magic != CHUNK_MAGIC or offset + length > size: break # Torn tail
+            for key in json.loads(f.read(klen)):
+                for part in key.split(","):
+                    ids = keys.setdefault(part, [])
+                    if not ids or ids[-1] != len(chunks): ids.append(len(chunks))
+            chunks.append([offset, length, t0, t1, n])
+            offset += length
+    return {"chunks": chunks, "keys": keys}
+
+
+# --- Reading ---
+
+def segments(root: str, channel: str) -> List[str]:
+    folder = os.path.join(root, channel)
+    if not os.path.isdir(folder): return []
+    names = sorted((int(n[:-4]), n) for n in os.listdir(folder) if n.endswith(".seg"))
+    return [os.path.join(folder, n) for _, n in names]
+
+
+def read_channel(root: str, channel: str, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+                 keys: Optional[Iterable[str]] = None) -> Iterator[Record]:
+    """Records of one channel in write order, optionally limited to a time range / keys"""
+    wanted = set(keys) if keys is not None else None
+    decompressor = zstandard.ZstdDecompressor()
+    for path in segments(root, channel):
+        index = _load_index(path)
+        chunk_ids = range(len(index["chunks"]))
+        if wanted is not None:
+            chunk_ids = sorted({i for k in wanted for i in index["keys"].get(k, [])})
+        chunk_ids = [i for i in chunk_ids if (end_ns is None or index["chunks"][i][2] <= end_ns)
+                     and (start_ns is None or index["chunks"][i][3] >= start_ns)]
+        if not chunk_ids: continue
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                for i in chunk_ids:
+                    offset = index["chunks"][i][0]
+                    _, klen, flen, n, _, _ = CHUNK_HEAD.unpack_from(view, offset)
+                    pos = offset + CHUNK_HEAD.size
+                    table = json.loads(bytes(view[pos:pos + klen]))
+                    match = [wanted is None or not wanted.isdisjoint(k.split(",")) for k in table]
+                    data = decompressor.decompress(view[pos + klen:pos + klen + flen])
+                    body, p = memoryview(data), 0
+                    for _ in range(n):
+                        ts_ns, kid, length = RECORD_HEAD.unpack_from(data, p)
+                        p += RECORD_HEAD.size
+                        if match[kid] and (start_ns is None or ts_ns >= start_ns) and (end_ns is None or ts_ns <= end_ns):
+                            yield Record(ts_ns, channel, table[kid], body[p:p + length])
+                        p += length
+            finally:
+                view.release()
+
+
+def span(root: str = RECORD_DIR, channels: Optional[Iterable[str]] = None) -> Optional[tuple]:
+    """(first ts_ns, last ts_ns) over the given channels, from the indexes only; None if empty"""
+    chunks = [c for ch in (channels or CHANNELS) for p in segments(root, ch) for c in _load_index(p)["chunks"]]
+    if not chunks: return None
+    return min(c[2] for c in chunks), max(c[3] for c in chunks)
+
+
+def read(root: str = RECORD_DIR, start_ns: Optional[int] = None, end_ns: Optional[int] = None,
+         channels: Optional[Iterable[str]] = None, keys: Optional[Iterable[str]] = None) -> Iterator[Record]:
+    """Every recorded message, both venues merged in receive-time order"""
+    keys = list(keys) if keys is not None else None
+    streams = [read_channel(root, c, start_ns, end_ns, keys) for c in (channels or CHANNELS)]
+    return heapq.merge(*streams, key=lambda r: r.ts_ns)
+
+
+# --- Backtest export ---
+
+def export_ticks(root: str = RECORD_DIR, out: Optional[str] = None) -> int:
+    """
+    One backtest_engine.py tick file per recorded cycle with a strike and a final
+    price: Binance trades + UP / DOWN top of book. Returns the number of files.
+    """
+    import numpy as np
+    from l2_book import L2Book
+    from backtest_engine import TICKS_DIR
+
+    out = out or TICKS_DIR
+    cycles: Dict[str, dict] = {}
+    for rec in read_channel(root, "bot_cycle"):
+        info = json.loads(bytes(rec.payload))
+        cycles.setdefault(info["slug"], {}).update(info)
+
+    os.makedirs(out, exist_ok=True)
+    written = 0
+    for slug, c in cycles.items():
+        if c.get("strike") is None or c.get("final") is None: continue
+        start_ns, end_ns = int(c["start"] * 1e9), int(c["end"] * 1e9)
+        tokens = {c["token_up"]: "up", c["token_down"]: "down"}
+        books = {t: L2Book(t) for t in tokens}
+        tops = {side: [] for side in tokens.values()}
+        # Books need the snapshot from before the open: start one segment early
+        for rec in read(root, start_ns - SEGMENT_SEC * 1_000_000_000, end_ns, ("clob_market", "clob_book"), tokens):
+            events = json.loads(bytes(rec.payload))
+            changed = set()
+            for e in (events if isinstance(events, list) else [events]):
+                if rec.channel == "clob_book" or e.get("event_type") == "book":
+                    if e.get("asset_id") in books:
+                        books[e["asset_id"]].apply_snapshot(e.get("bids", []), e.get("asks", []))
+                        changed.add(e["asset_id"])
+                elif e.get("event_type") == "price_change":
+                    for ch in e.get("price_changes", []):
+                        if ch.get("asset_id") in books and "price" in ch:
+                            books[ch["asset_id"]].apply_delta(ch.get("side") == "BUY", float(ch["price"]), float(ch["size"]))
+                            changed.add(ch["asset_id"])
+            if rec.ts_ns < start_ns: continue
+            for t in changed:
+                b = books[t]
+                tops[tokens[t]].append((rec.ts_ns / 1e9, b.best_bid or np.nan, b.best_ask or np.nan))
+        trades = []
+        for rec in read_channel(root, "binance_stream", start_ns, end_ns, [c["symbol"]]):
+            msg = json.loads(bytes(rec.payload))
+            if msg.get("stream", "").endswith("@trade"):
+                trades.append((rec.ts_ns / 1e9, float(msg["data"]["p"])))
+        if not trades or not tops["up"] or not tops["down"]: continue
+
+        arrays = {"meta": np.array([c["start"], c["end"], c["strike"], c["final"]], dtype=float)}
+        arrays["btc_ts"], arrays["btc_px"] = (np.array(col, dtype=float) for col in zip(*trades))
+        for side in ("up", "down"):
+            ts, bid, ask = (np.array(col, dtype=float) for col in zip(*tops[side]))
+            arrays.update({f"{side}_ts": ts, f"{side}_bid": bid, f"{side}_ask": ask})
+        np.savez_compressed(os.path.join(out, f"{slug}.npz"), **arrays)
+        written += 1
+    print(f"Exported {written} cycles to {out}")
+    return written
+
+
+def stats(root: str = RECORD_DIR):
+    for channel in CHANNELS:
+        paths = segments(root, channel)
+        if not paths: continue
+        chunks = [c for p in paths for c in _load_index(p)["chunks"]]
+        size = sum(os.path.getsize(p) for p in paths)
+        first = time.strftime("%Y-%m-%d %H:%M", time.gmtime(chunks[0][2] / 1e9)) if chunks else "-"
+        last = time.strftime("%Y-%m-%d %H:%M", time.gmtime(chunks[-1][3] / 1e9)) if chunks else "-"
+        print(f"{channel:24s} {len(paths):4d} segments {sum(c[4] for c in chunks):10d} records "
+              f"{size / 1e6:9.1f} MB  {first} -> {last} UTC")
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if cmd == "ticks":
+        export_ticks(sys.argv[2] if len(sys.argv) > 2 else RECORD_DIR, sys.argv[3] if len(sys.argv) > 3 else None)
+    else:
+        stats(sys.argv[2] if len(sys.argv) > 2 else RECORD_DIR)
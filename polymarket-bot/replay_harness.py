@@ -0,0 +1,555 @@
+#!/usr/bin/env python3
+"""
+Deterministic Replay Harness
+- Runs the unmodified PolymarketBotV3 (paper trading, sim_exchange.py fills)
+  over a recorder.py recording, as fast as the CPU allows.
+- Virtual clock: the event loop never blocks. When nothing is ready it jumps
+  straight to the next timer (a sleep in the bot or the next recorded message).
+  While a replay runs, time.time / time_ns / monotonic / perf_counter and
+  datetime.now in the bot's modules read that clock; work the bot sends to
+  threads runs inline. Everything is restored afterwards.
+- Feeds: the Polymarket market WS, Binance trade / depth streams and the
+  candle store are swapped for subclasses fed from the recording (no sockets,
+  no candles after the virtual time). REST calls (Gamma, /book, klines,
+  ticker, depth) are answered from the recording as of the virtual time.
+- Deterministic: same recording + config + seed -> same journal; the report
+  carries its sha256 digest. The bot runs in a scratch directory, so the live
+  journal, config and volatility state are never touched.
+
+Usage:
+    python3 polymarket-bot/replay_harness.py [DIR] [--start ISO] [--end ISO] [--seed N]
+                                             [--config FILE] [--set min_edge=0.1 ...] [--workdir DIR]
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import asyncio
+import hashlib
+import logging
+import argparse
+import selectors
+import tempfile
+import concurrent.futures
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from urllib.parse import urlparse, parse_qs
+
+import requests
+from py_clob_client.utilities import parse_raw_orderbook_summary, generate_orderbook_summary_hash
+
+import recorder
+import clob_ws
+import binance_feed
+from l2_book import L2Book
+from clob_ws import ClobMarketStream
+from binance_feed import BinancePriceFeed, BinanceDepthBook
+from candle_store import CandleStore
+from model_export import EXPORT_FILE
+from trade_journal import parse_time
+
+logger = logging.getLogger(__name__)
+
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Channels the replay consumes (bot_cycle is read up front for the Gamma answers)
+REPLAYED = ("clob_market", "clob_book", "binance_stream", "binance_depth", "binance_depth_snapshot")
+# Always applied on top of the config: no recording of the replay itself, no retraining mid-run
+CONFIG_OVERRIDES = {"record_market_data": False, "retrain_interval_h": 1e9}
+SECRET_ENV = ("PK", "PRIVATE_KEY") # Unset during a replay: paper mode, no CLOB client
+LINKED = ("candles", "models", os.path.basename(EXPORT_FILE)) # Shared read-only with the scratch directory
+BOOK_DEFAULTS = {"market": "", "min_order_size": "5", "tick_size": "0.01", "neg_risk": False, "last_trade_price": "0.5"}
+
+_wall = time.perf_counter # Real clock, for the speed report
+
+
+# --- Virtual time ---
+
+class VirtualClock:
+    """Replay time in epoch seconds; only moves when the loop has nothing to run"""
+
+    def __init__(self, start: float):
+        self.now = float(start)
+
+    def time(self) -> float:
+        return self.now
+
+    def time_ns(self) -> int:
+        return int(self.now * 1e9)
+
+    def advance(self, dt: float):
+        target = self.now + dt
+        # At epoch magnitudes a tiny dt can round to nothing: always move forward
+        self.now = target if target > self.now else math.nextafter(self.now, math.inf)
+
+
+class VirtualSelector(selectors.DefaultSelector):
+    """Polls instead of blocking; a blocking wait becomes a clock jump"""
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if ready or (timeout is not None and timeout <= 0):
+            return ready
+        if timeout is None:
+            raise RuntimeError("replay stalled: no timer pending and nothing to run")
+        self.clock.advance(timeout)
+        return ready
+
+
+class VirtualLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock: VirtualClock):
+        super().__init__(VirtualSelector(clock))
+        self.clock = clock
+        self._clock_resolution = 1e-6
+
+    def time(self) -> float:
+        return self.clock.now
+
+
+class InlineExecutor(concurrent.futures.ThreadPoolExecutor):
+    """asyncio.to_thread work (REST calls, file writes) runs at once, in order"""
+
+    def submit(self, fn, /, *args, **kwargs):
+        fut = concurrent.futures.Future()
+        try:
+            fut.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            fut.set_exception(e)
+        return fut
+
+
+class VirtualDatetime(datetime):
+    clock: Optional[VirtualClock] = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.fromtimestamp(cls.clock.now, tz)
+
+    @classmethod
+    def utcnow(cls):
+        return cls.fromtimestamp(cls.clock.now, timezone.utc).replace(tzinfo=None)
+
+
+class _Patches:
+    """Attribute swaps undone in reverse order"""
+
+    def __init__(self):
+        self.saved = []
+
+    def set(self, obj, name: str, value):
+        self.saved.append((obj, name, getattr(obj, name)))
+        setattr(obj, name, value)
+
+    def restore(self):
+        while self.saved:
+            obj, name, value = self.saved.pop()
+            setattr(obj, name, value)
+
+
+# --- Feeds driven by the recording ---
+
+class ReplayMarketStream(ClobMarketStream):
+    """Market channel fed by recorded messages; PONGs every ping_interval as on a live connection"""
+
+    async def run(self):
+        self.running = self.connected = True
+        self.last_msg_at = self.last_pong_at = time.time()
+        self._resync_all()
+        while self.running:
+            await asyncio.sleep(self.ping_interval)
+            self._on_message("PONG")
+
+    async def subscribe(self, books, on_update=None):
+        # The exchange answers a subscribe with a book snapshot: here, the replayed /book
+        books = list(books)
+        await super().subscribe(books, on_update)
+        if self.connected:
+            for book in books:
+                if book.asset_id not in self.resyncing: self._schedule_resync(book)
+
+    async def _send(self, msg: dict):
+        pass
+
+
+class ReplayPriceFeed(BinancePriceFeed):
+    """Trade / bookTicker stream fed by recorded messages"""
+
+    async def run(self):
+        self.running = self.connected = True
+        self.stopped = asyncio.Event()
+        await self.stopped.wait() # Fed by the replay driver
+
+
+class ReplayDepthBook(BinanceDepthBook):
+    """Diff-depth book fed by recorded events; (re)synced from the replayed /depth snapshot"""
+
+    async def run(self):
+        self.running = True
+        self.stopped = asyncio.Event()
+        await self.stopped.wait() # Fed by the replay driver
+
+    def feed(self, event: dict):
+        if not self.last_update_id:
+            try:
+                self._load_snapshot(self._fetch_snapshot())
+            except Exception:
+                return
+        if not self._apply_event(event):
+            self.last_update_id, self.synced = 0, False # Gap: reload on the next diff
+
+
+class ReplayCandleStore(CandleStore):
+    """Local candles as of the virtual time: nothing after the last closed candle is visible"""
+
+    def refresh(self) -> bool:
+        changed = super().refresh()
+        if changed: self._stored = self.count
+        closed = (int(time.time() * 1000) - self.base_ms) // self.interval_ms
+        count = max(0, min(getattr(self, "_stored", 0), closed))
+        if count != self.count:
+            self.count = count
+            return True
+        return changed
+
+
+async def replay_sync(store: CandleStore, start_ms: int, end_ms: Optional[int] = None, **kwargs) -> int:
+    """candle_store.sync stand-in: no downloads, only candles closed by the virtual time"""
+    store.refresh()
+    return 0
+
+
+# --- REST answered from the recording ---
+
+class ReplayResponse:
+    def __init__(self, data, status_code: int = 200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} (replay)")
+
+
+class ReplayHttp:
+    """Stand-in for the `requests` module of the bot's modules (GET only, as they use it)"""
+
+    def __init__(self, replay: "Replay"):
+        self.replay = replay
+
+    def get(self, url: str, params: Optional[dict] = None, timeout=None, **kwargs) -> ReplayResponse:
+        parsed = urlparse(url)
+        q = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        q.update({k: str(v) for k, v in (params or {}).items()})
+        r, path = self.replay, parsed.path
+        if path.endswith("/events"): return r.gamma_events(q.get("slug", ""))
+        if path.endswith("/klines"): return r.klines(q.get("symbol", "").upper(), int(q.get("startTime", 0)))
+        if path.endswith("/ticker/price"): return r.ticker(q.get("symbol", "").upper())
+        if path.endswith("/depth"): return r.depth(q.get("symbol", "").upper(), int(q.get("limit", 100)))
+        if path.endswith("/book"): return r.book(q.get("token_id", ""))
+        raise requests.ConnectionError(f"replay: nothing recorded for {url}")
+
+
+# --- Harness ---
+
+class Replay:
+    """One replay of [start, end] of a recording through a fresh bot"""
+
+    def __init__(self, root: str = recorder.RECORD_DIR, start: Optional[float] = None, end: Optional[float] = None,
+                 seed: int = 0, config: Optional[str] = None, overrides: Optional[dict] = None,
+                 workdir: Optional[str] = None, verbose: bool = False):
+        self.root = os.path.abspath(root)
+        self.start, self.end = start, end
+        self.seed = seed
+        self.config = os.path.abspath(config) if config else os.path.join(BOT_DIR, "config.json")
+        self.overrides = overrides or {}
+        self.workdir = workdir
+        self.verbose = verbose
+        self.clock = None
+        self.cycles: Dict[str, dict] = {}      # slug -> bot_cycle metadata (Gamma answers)
+        self.books: Dict[str, L2Book] = {}     # token -> shadow book (every asset, subscribed or not)
+        self.book_meta: Dict[str, dict] = {}
+        self.depth_books: Dict[str, BinanceDepthBook] = {} # symbol -> shadow Binance book
+        self.last_price: Dict[str, float] = {}
+        self.opens: Dict[str, Dict[int, float]] = {} # symbol -> minute ms -> first trade price
+        self.messages = 0
+        self.records = []
+
+    # --- Run ---
+
+    def run(self) -> dict:
+        bounds = recorder.span(self.root, REPLAYED)
+        if not bounds:
+            raise ValueError(f"No recording under {self.root}")
+        self.start = self.start if self.start is not None else bounds[0] / 1e9
+        self.end = self.end if self.end is not None else bounds[1] / 1e9
+        for rec in recorder.read_channel(self.root, "bot_cycle"):
+            info = json.loads(bytes(rec.payload))
+            self.cycles.setdefault(info["slug"], {}).update(info)
+
+        work = self.workdir or tempfile.mkdtemp(prefix="replay-")
+        self._prepare(work)
+        cwd, env = os.getcwd(), {k: os.environ.get(k) for k in SECRET_ENV}
+        root_level = logging.getLogger().level
+        patches = _Patches()
+        self.clock = VirtualClock(self.start)
+        os.chdir(work)
+        try:
+            import btc_15m_bot_v3 as bot_module
+            bot_module.setup_logging() # bot.log in the scratch dir
+            for k in SECRET_ENV: os.environ.pop(k, None) # Replay never signs: no keys from the caller's env
+            self._patch(patches, bot_module)
+            if not self.verbose: logging.getLogger().setLevel(logging.WARNING)
+            loop = VirtualLoop(self.clock)
+            loop.set_default_executor(InlineExecutor())
+            t0 = _wall()
+            try:
+                report = loop.run_until_complete(self._main(bot_module))
+            finally:
+                loop.close()
+            wall = _wall() - t0
+        finally:
+            patches.restore()
+            logging.getLogger().setLevel(root_level)
+            os.chdir(cwd)
+            for k, v in env.items():
+                if v is not None: os.environ[k] = v
+            if not self.workdir: shutil.rmtree(work, ignore_errors=True)
+        report.update(wall_sec=round(wall, 3), speed=round((self.end - self.start) / wall, 1) if wall > 0 else None)
+        return report
+
+    def _prepare(self, work: str):
+        """Scratch polymarket-bot/ with the config (+ overrides) and links to candles / models"""
+        folder = os.path.join(work, "polymarket-bot")
+        os.makedirs(folder, exist_ok=True)
+        conf = {}
+        if os.path.exists(self.config):
+            with open(self.config, "r") as f:
+                conf = json.load(f)
+        conf.update(self.overrides)
+        conf.update(CONFIG_OVERRIDES)
+        with open(os.path.join(folder, "config.json"), "w") as f:
+            json.dump(conf, f, indent=2)
+        for name in LINKED:
+            src, dst = os.path.join(BOT_DIR, name), os.path.join(folder, name)
+            if os.path.exists(src) and not os.path.lexists(dst):
+                os.symlink(src, dst)
+
+    def _patch(self, patches: _Patches, bot_module):
+        clock = self.clock
+        for name in ("time", "monotonic", "perf_counter"):
+            patches.set(time, name, clock.time)
+        patches.set(time, "time_ns", clock.time_ns)
+        VirtualDatetime.clock = clock
+        for module in list(sys.modules.values()):
+            path = getattr(module, "__file__", None) or ""
+            if module is not sys.modules[__name__] and os.path.dirname(os.path.abspath(path)) == BOT_DIR \
+                    and getattr(module, "datetime", None) is datetime:
+                patches.set(module, "datetime", VirtualDatetime)
+        http = ReplayHttp(self)
+        for module in (bot_module, clob_ws, binance_feed):
+            patches.set(module, "requests", http)
+        patches.set(bot_module, "ClobMarketStream", ReplayMarketStream)
+        patches.set(bot_module, "BinancePriceFeed", ReplayPriceFeed)
+        patches.set(bot_module, "BinanceDepthBook", ReplayDepthBook)
+        patches.set(bot_module, "CandleStore", ReplayCandleStore)
+        patches.set(bot_module, "sync_candles", replay_sync)
+
+    async def _main(self, bot_module) -> dict:
+        bot = bot_module.PolymarketBotV3()
+        if not bot.sim_exchange:
+            raise RuntimeError("Replay needs paper trading")
+        bot.sim_exchange.rng = random.Random(self.seed)
+        bot.market_ws.taps.append(self._shadow_event)
+        task = asyncio.create_task(bot.run())
+        try:
+            await self._drive(bot, task)
+            if task.done(): task.result() # Surface a crash of the bot
+        finally:
+            bot.running = False
+            rest = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for t in rest: t.cancel()
+            await asyncio.gather(*rest, return_exceptions=True)
+            bot.writer.close() # Everything queued is in the journal before the report reads it
+        return self._report(bot)
+
+    async def _drive(self, bot, task: asyncio.Task):
+        """Deliver every record at its receive time; records before start only build the shadow books"""
+        start_ns, end_ns = int(self.start * 1e9), int(self.end * 1e9)
+        ws, feeds, depths = bot.market_ws, bot.price_feeds, bot.depth_books
+        for rec in recorder.read(self.root, self._prelude_ns(start_ns), end_ns, REPLAYED):
+            live = rec.ts_ns >= start_ns
+            if live:
+                delay = rec.ts_ns / 1e9 - self.clock.now
+                if delay > 0: await asyncio.sleep(delay)
+                if task.done(): return
+                self.messages += 1
+            text = bytes(rec.payload).decode()
+            channel, key = rec.channel, rec.key
+            if channel == "clob_market":
+                if live:
+                    ws._on_message(text) # Shadow books follow through the tap
+                else:
+                    data = json.loads(text)
+                    for event in (data if isinstance(data, list) else [data]):
+                        self._shadow_event(event)
+            elif channel == "clob_book":
+                self._shadow_snapshot(json.loads(text))
+            elif channel == "binance_stream":
+                feed = feeds.get(key) if live else None
+                if feed:
+                    feed._on_message(text)
+                    price, _, trade_ms = feed.snapshot
+                    if price is not None: self._trade(key, price, trade_ms)
+                else:
+                    msg = json.loads(text)
+                    if msg.get("stream", "").endswith("@trade"):
+                        self._trade(key, float(msg["data"]["p"]), int(msg["data"]["T"]))
+            elif channel == "binance_depth":
+                event = json.loads(text)
+                shadow = self._shadow_depth(key)
+                if shadow.last_update_id and not shadow._apply_event(event):
+                    shadow.last_update_id, shadow.synced = 0, False # Wait for the next recorded snapshot
+                if live and key in depths: depths[key].feed(event)
+            elif channel == "binance_depth_snapshot":
+                self._shadow_depth(key)._load_snapshot(json.loads(text))
+        delay = self.end - self.clock.now
+        if delay > 0 and not task.done():
+            await asyncio.sleep(delay)
+
+    def _prelude_ns(self, start_ns: int) -> int:
+        """Where reading starts: an hour before start, or the last depth snapshot before it"""
+        last = {}
+        for rec in recorder.read_channel(self.root, "binance_depth_snapshot", None, start_ns):
+            last[rec.key] = rec.ts_ns
+        return min([start_ns - recorder.SEGMENT_SEC * 1_000_000_000, *last.values()])
+
+    def _report(self, bot) -> dict:
+        self.records = bot.journal.records()
+        digest = hashlib.sha256(json.dumps(self.records, sort_keys=True, default=str).encode()).hexdigest()
+        closed = [r for r in self.records if r.get("type") in ("SETTLED", "STOP_LOSS")]
+        return {
+            "start": datetime.fromtimestamp(self.start, timezone.utc).isoformat(),
+            "end": datetime.fromtimestamp(self.end, timezone.utc).isoformat(),
+            "virtual_sec": round(self.end - self.start, 3),
+            "messages": self.messages,
+            "entries": sum(r.get("type") == "V3_SMART" for r in self.records),
+            "closed": len(closed),
+            "wins": sum(r.get("result") == "WIN" for r in closed),
+            "pnl_sum": round(sum(r.get("pnl") or 0.0 for r in closed), 6),
+            "open_positions": len(bot.positions),
+            "fills": bot.sim_exchange.summary(),
+            "digest": digest,
+        }
+
+    # --- Shadow state (what the exchanges would answer over REST) ---
+
+    def _shadow_event(self, event: dict):
+        """Tap on the bot's market stream: every asset's book, for the replayed /book"""
+        kind = event.get("event_type")
+        if kind == "book":
+            self._shadow_snapshot(event)
+        elif kind == "price_change":
+            for ch in event.get("price_changes", []):
+                book = self.books.get(ch.get("asset_id"))
+                if book is not None and "price" in ch and "size" in ch:
+                    book.apply_delta(ch.get("side") == "BUY", float(ch["price"]), float(ch["size"]))
+
+    def _shadow_snapshot(self, raw: dict):
+        asset = raw.get("asset_id")
+        if not asset: return
+        book = self.books.get(asset) or self.books.setdefault(asset, L2Book(asset))
+        book.apply_snapshot(raw.get("bids", []), raw.get("asks", []))
+        self.book_meta[asset] = {k: raw[k] for k in BOOK_DEFAULTS if k in raw}
+
+    def _shadow_depth(self, symbol: str) -> BinanceDepthBook:
+        book = self.depth_books.get(symbol)
+        if book is None:
+            book = self.depth_books[symbol] = BinanceDepthBook(symbol, bands=())
+        return book
+
+    def _trade(self, symbol: str, price: float, trade_ms: int):
+        self.last_price[symbol] = price
+        self.opens.setdefault(symbol, {}).setdefault(trade_ms - trade_ms % 60_000, price)
+
+    # --- REST answers ---
+
+    def gamma_events(self, slug: str) -> ReplayResponse:
+        c = self.cycles.get(slug)
+        if not c or "token_up" not in c:
+            return ReplayResponse([])
+        market = {"conditionId": c["condition_id"], "question": slug, "acceptingOrders": True,
+                  "clobTokenIds": json.dumps([c["token_up"], c["token_down"]]), "outcomes": json.dumps(["Up", "Down"])}
+        return ReplayResponse([{"slug": slug, "title": slug, "closed": False, "markets": [market]}])
+
+    def book(self, token: str) -> ReplayResponse:
+        book = self.books.get(token)
+        if book is None:
+            return ReplayResponse({"error": "No orderbook exists for the requested token id"}, 404)
+        raw = {**BOOK_DEFAULTS, **self.book_meta.get(token, {}), "asset_id": token,
+               "timestamp": str(int(self.clock.now * 1000)), "hash": "",
+               "bids": [{"price": str(p), "size": str(s)} for p, s in book.bids.levels()],
+               "asks": [{"price": str(p), "size": str(s)} for p, s in book.asks.levels()]}
+        raw["hash"] = generate_orderbook_summary_hash(parse_raw_orderbook_summary(raw))
+        return ReplayResponse(raw)
+
+    def depth(self, symbol: str, limit: int) -> ReplayResponse:
+        book = self.depth_books.get(symbol)
+        if book is None or not book.last_update_id:
+            return ReplayResponse({"code": -1, "msg": "no depth snapshot recorded yet"}, 503)
+        return ReplayResponse({"lastUpdateId": book.last_update_id,
+                               "bids": [[str(p), str(q)] for p, q in book.bids.levels(limit)],
+                               "asks": [[str(p), str(q)] for p, q in book.asks.levels(limit)]})
+
+    def klines(self, symbol: str, start_ms: int) -> ReplayResponse:
+        minute = start_ms - start_ms % 60_000
+        price = self.opens.get(symbol, {}).get(minute)
+        if price is None or minute > self.clock.now * 1000:
+            return ReplayResponse([])
+        return ReplayResponse([[minute, str(price), str(price), str(price), str(price), "0"]])
+
+    def ticker(self, symbol: str) -> ReplayResponse:
+        if symbol not in self.last_price:
+            return ReplayResponse({"code": -1121, "msg": "Invalid symbol."}, 400)
+        return ReplayResponse({"symbol": symbol, "price": str(self.last_price[symbol])})
+
+
+def _value(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+if __name__ == "__main__":
+    # Set iteration order (assets touched by a message, ...) must not vary between runs
+    if os.environ.get("PYTHONHASHSEED") != "0":
+        os.environ["PYTHONHASHSEED"] = "0"
+        os.execv(sys.executable, [sys.executable, *sys.argv])
+
+    ap = argparse.ArgumentParser(description="Replay a recording through the unmodified bot on a virtual clock")
+    ap.add_argument("record_dir", nargs="?", default=recorder.RECORD_DIR)
+    ap.add_argument("--start", help="ISO time or epoch seconds (default: start of the recording)")
+    ap.add_argument("--end", help="ISO time or epoch seconds (default: end of the recording)")
+    ap.add_argument("--seed", type=int, default=0, help="Simulated latency / queue randomness")
+    ap.add_argument("--config", help="Bot config to start from (default: polymarket-bot/config.json)")
+    ap.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="Config override (JSON value)")
+    ap.add_argument("--workdir", help="Keep the scratch directory (journal, bot.log) here")
+    ap.add_argument("--verbose", action="store_true", help="Keep the bot's INFO logs")
+    args = ap.parse_args()
+
+    overrides = dict((k, _value(v)) for k, v in (s.split("=", 1) for s in args.set))
+    replay = Replay(args.record_dir, parse_time(_value(args.start)) if args.start else None,
+                    parse_time(_value(args.end)) if args.end else None, seed=args.seed, config=args.config,
+                    overrides=overrides, workdir=os.path.abspath(args.workdir) if args.workdir else None,
+                    verbose=args.verbose)
+    print(json.dumps(replay.run(), indent=2, ensure_ascii=False))
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Model Retraining Service
+- Runs augment + training in a separate (spawned) process, pinned to a capped
+  set of CPUs at low priority, so the bot's event loop never competes with it.
+- Every run produces a versioned artifact directory (models/vYYYYmmdd-HHMMSS/)
+  that is built under a temporary name and published with one rename: readers
+  never see a half-written model.
+- models/CURRENT names the active and the previous version (replaced
+  atomically). The bot loads new versions in a worker thread, swaps them in with
+  a single reference assignment and keeps the previous predictor for rollback.
+
+Usage:
+    python3 polymarket-bot/retrain_service.py list
+    python3 polymarket-bot/retrain_service.py train
+    python3 polymarket-bot/retrain_service.py rollback
+    python3 polymarket-bot/retrain_service.py promote <version>
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = "polymarket-bot/models"
+CURRENT_NAME = "CURRENT"
+MODEL_NAME = "ml_model.pkl"
+EXPORT_NAME = "ml_model.npz"
+KEEP_VERSIONS = 5
+
+
+class ModelStore:
+    """Versioned model artifacts and the CURRENT / previous pointer"""
+
+    def __init__(self, root: str = MODELS_DIR):
+        self.root = root
+        self.pointer = os.path.join(root, CURRENT_NAME)
+
+    def versions(self) -> List[str]:
+        """Published versions, oldest first"""
+        if not os.path.isdir(self.root): return []
+        return sorted(v for v in os.listdir(self.root)
+                      if v.startswith("v") and os.path.exists(self.export_path(v)))
+
+    def export_path(self, version: str) -> str:
+        return os.path.join(self.root, version, EXPORT_NAME)
+
+    def manifest(self, version: str) -> dict:
+        with open(os.path.join(self.root, version, "ml_model.json"), "r") as f:
+            return json.load(f)
+
+    def read_pointer(self) -> dict:
+        """{"current": version | None, "previous": version | None}"""
+        try:
+            with open(self.pointer, "r") as f:
+                state = json.load(f)
+            return {"current": state.get("current"), "previous": state.get("previous")}
+        except (OSError, ValueError):
+            return {"current": None, "previous": None}
+
+    def pointer_mtime(self) -> float:
+        try:
+            return os.path.getmtime(self.pointer)
+        except OSError:
+            return 0.0
+
+    def set_current(self, version: str, previous: Optional[str] = None):
+        """Atomically point CURRENT at `version`"""
+        if version not in self.versions():
+            raise ValueError(f"Unknown model version {version}")
+        state = {"current": version, "previous": previous,
+                 "updated_at": datetime.now(timezone.utc).isoformat()}
+        tmp = self.pointer + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.pointer)
+
+    def promote(self, version: str):
+        cur = self.read_pointer()["current"]
+        self.set_current(version, previous=cur if cur != version else self.read_pointer()["previous"])
+
+    def rollback(self) -> str:
+        """CURRENT <- previous (and the other way round). Returns the new current version."""
+        ptr = self.read_pointer()
+        if not ptr["previous"]:
+            raise ValueError("No previous model version to roll back to")
+        self.set_current(ptr["previous"], previous=ptr["current"])
+        return ptr["previous"]
+
+    def prune(self, keep: int = KEEP_VERSIONS):
+        """Delete old versions (never the current or previous one) and stale temp dirs"""
+        ptr = self.read_pointer()
+        protected = {ptr["current"], ptr["previous"]}
+        for v in self.versions()[:-keep]:
+            if v not in protected:
+                shutil.rmtree(os.path.join(self.root, v), ignore_errors=True)
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".tmp-") and time.time() - os.path.getmtime(path) > 86400:
+                shutil.rmtree(path, ignore_errors=True)
+
+
+# --- Worker process side ---
+
+def _limit_worker(cpus: Sequence[int], nice: int):
+    """Pool initializer: pin the worker and keep native thread pools within the pinned CPUs"""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, set(cpus))
+    threads = str(max(1, len(cpus) if cpus else 1))
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "LOKY_MAX_CPU_COUNT"):
+        os.environ[var] = threads
+    if nice: os.nice(nice)
+
+
+def build_version(root: str = MODELS_DIR, augment: bool = True) -> Optional[dict]:
+    """Augment + train into a temp dir, then publish it with a rename. Runs in the worker."""
+    import augment_data
+    import train_ml
+
+    version = datetime.now(timezone.utc).strftime("v%Y%m%d-%H%M%S")
+    os.makedirs(root, exist_ok=True)
+    tmp = os.path.join(root, f".tmp-{version}-{os.getpid()}")
+    os.makedirs(tmp)
+    try:
+        if augment: augment_data.augment()
+        manifest = train_ml.train_model(os.path.join(tmp, MODEL_NAME), os.path.join(tmp, EXPORT_NAME))
+        if manifest is None:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return None
+        final = os.path.join(root, version)
+        os.rename(tmp, final)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return {"version": version, **manifest}
+
+
+def pick_cpus(count: int) -> List[int]:
+    """The last `count` CPUs we may run on (leave the first ones to the bot)"""
+    if not hasattr(os, "sched_getaffinity"): return []
+    available = sorted(os.sched_getaffinity(0))
+    if len(available) <= count: return available
+    return available[-count:]
+
+
+class RetrainService:
+    """Off-loop training in a single-worker process pool"""
+
+    def __init__(self, store: Optional[ModelStore] = None, cpus: int = 1, nice: int = 10):
+        self.store = store or ModelStore()
+        self.cpus = pick_cpus(cpus)
+        self.nice = nice
+        self.pool = None
+        self.running = False # One training run at a time
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            # Spawned, not forked: the child must not inherit the bot's loop, sockets and threads
+            self.pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_limit_worker, initargs=(self.cpus, self.nice))
+        return self.pool
+
+    async def retrain(self, augment: bool = True) -> Optional[dict]:
+        """Train a new version without touching the event loop. Returns its manifest."""
+        if self.running: return None
+        self.running = True
+        start = time.time()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._pool(), build_version, self.store.root, augment)
+            if result:
+                logger.info(f"🧠 新模型 {result['version']} 训练完成 ({time.time() - start:.0f}s, CPU {self.cpus or 'all'})")
+            return result
+        except Exception as e:
+            # A crashed worker breaks the pool: start a fresh one next time
+            if self.pool: self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+            raise e
+        finally:
+            self.running = False
+
+    def shutdown(self):
+        if self.pool: self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    store = ModelStore()
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if cmd == "list":
+        ptr = store.read_pointer()
+        for v in store.versions():
+            m = store.manifest(v)
+            mark = "*" if v == ptr["current"] else ("-" if v == ptr["previous"] else " ")
+            print(f"{mark} {v}  trees {m['n_trees']:>4}  score {m.get('valid_score', float('nan')):.2%}  samples {m.get('samples', '?')}")
+    elif cmd == "train":
+        result = build_version(store.root)
+        if result:
+            store.promote(result["version"])
+            store.prune()
+            print(f"✅ {result['version']} 已发布并设为当前版本")
+    elif cmd == "rollback":
+        print(f"↩️ 当前版本: {store.rollback()}")
+    elif cmd == "promote" and len(sys.argv) > 2:
+        store.promote(sys.argv[2])
+        print(f"✅ 当前版本: {sys.argv[2]}")
+    else:
+        print(__doc__)
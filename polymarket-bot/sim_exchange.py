@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Simulated CLOB Exchange
+- In-process matcher for paper trading and replay: orders are matched against
+  the reconstructed L2 book (l2_book.py) instead of filling at the ask for any size.
+- Latency: an order (or cancel) reaches the exchange latency_ms (+ random
+  jitter) after it is sent and is matched against the book as it is then.
+- Taker side: the crossing part sweeps levels best-first up to the limit.
+  Liquidity we took stays taken until the book reports a new size at that level,
+  so back-to-back orders cannot fill against the same shares twice.
+- Maker side: the rest of a GTC order rests behind the size already at its
+  price. Trade prints at our price eat the queue ahead first, then fill us;
+  size that leaves the level without a trade (cancels) is assumed to come from
+  ahead of us in proportion to our position. A trade through our price, or the
+  opposite side crossing it, fills us.
+- Fees: Polymarket taker fee, fee_rate_bps * min(p, 1 - p) per share; makers pay none.
+- Same submit / wait / cancel interface and Order objects as order_manager.py,
+  so the bot's entry and stop-loss code is identical in paper and live mode.
+- Clock driven: replay calls advance(ts) before applying an event to the book
+  and on_event(event, ts) after it. Tokens with no open orders cost one dict
+  lookup per event.
+"""
+
+import time
+import heapq
+import random
+import asyncio
+import logging
+import itertools
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from l2_book import L2Book
+from order_manager import Order, EPS, TERMINAL, TRANSITIONS, LIVE, PARTIAL, FILLED, CANCELLED, REJECTED
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SimOrder(Order):
+    arrive_at: float = 0.0        # When the exchange sees it (sent + latency)
+    queue_ahead: float = 0.0      # Resting size in front of us at our price
+    level_size: float = 0.0       # Book size at our price when last seen
+    traded_unseen: float = 0.0    # Prints at our price not yet removed from the book
+
+
+class SimExchange:
+    """Matches our orders against live (or replayed) L2 books"""
+
+    def __init__(self, book_of: Callable[[str], Optional[L2Book]], latency_ms: float = 150.0,
+                 jitter_ms: float = 50.0, fee_bps: float = 0.0, seed: Optional[int] = None):
+        self.book_of = book_of
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.default_fee_bps = fee_bps
+        self.fee_bps: Dict[str, float] = {}     # Per token, when known
+        self.rng = random.Random(seed)
+        self.queue: List[tuple] = []            # Heap of (due, seq, action, order)
+        self.seq = itertools.count()
+        self.resting: Dict[str, List[SimOrder]] = {}
+        self.taken: Dict[tuple, tuple] = {}     # (token, side, price) -> (book size, size we took)
+        self.ids = itertools.count(1)
+        self.stats = {"submitted": 0, "rejected": 0, "cancelled": 0, "filled": 0, "fees": 0.0, "events": 0}
+
+    # --- Clock-driven core (replay) ---
+
+    def place(self, token_id: str, side: str, price: float, size: float, order_type: str = "GTC",
+              market: Optional[str] = None, now: Optional[float] = None) -> SimOrder:
+        """Send an order; it is matched once the latency has passed (advance / on_event)"""
+        now = time.time() if now is None else now
+        order = SimOrder(token_id, side, price, size, order_type, market, id=f"sim-{next(self.ids)}")
+        order.arrive_at = now + self._delay()
+        self.stats["submitted"] += 1
+        heapq.heappush(self.queue, (order.arrive_at, next(self.seq), "place", order))
+        if order.arrive_at <= now: self.advance(now)
+        return order
+
+    def request_cancel(self, order: SimOrder, now: Optional[float] = None) -> float:
+        """Send a cancel; fills can still happen until it arrives. Returns the arrival time."""
+        now = time.time() if now is None else now
+        due = now + self._delay()
+        heapq.heappush(self.queue, (due, next(self.seq), "cancel", order))
+        if due <= now: self.advance(now)
+        return due
+
+    def advance(self, now: float):
+        """Deliver every order / cancel whose latency has passed"""
+        while self.queue and self.queue[0][0] <= now:
+            _, _, action, order = heapq.heappop(self.queue)
+            if action == "place":
+                if order.is_open: self._arrive(order) # (a jittered cancel can overtake it)
+            elif order.is_open:
+                order.cancel_seen = True
+                self._unrest(order)
+                self._advance(order)
+
+    def on_event(self, event: dict, now: Optional[float] = None):
+        """Market-channel event, after it was applied to the books (ClobMarketStream tap)"""
+        self.stats["events"] += 1
+        if self.queue: self.advance(time.time() if now is None else now)
+        if not self.resting: return
+        kind = event.get("event_type")
+        if kind == "last_trade_price":
+            if event.get("asset_id") in self.resting:
+                self._on_trade(event["asset_id"], float(event["price"]), float(event["size"]), event.get("side"))
+        elif kind == "price_change":
+            for token in {c.get("asset_id") for c in event.get("price_changes", [])}:
+                if token in self.resting: self._on_book(token)
+        elif event.get("asset_id") in self.resting:
+            self._on_book(event["asset_id"])
+
+    def forget(self, token_ids: Iterable[str]):
+        """Finished markets: cancel what still rests and drop per-level state"""
+        token_ids = set(token_ids)
+        for token in token_ids:
+            for order in list(self.resting.get(token, [])):
+                order.cancel_seen = True
+                self._unrest(order)
+                self._advance(order)
+        self.taken = {k: v for k, v in self.taken.items() if k[0] not in token_ids}
+        for token in token_ids: self.fee_bps.pop(token, None)
+
+    # --- Async interface (same as OrderManager) ---
+
+    async def submit(self, token_id: str, side: str, price: float, size: float, order_type: str = "GTC",
+                     market: Optional[str] = None) -> SimOrder:
+        return (await self.submit_many([(token_id, side, price, size, order_type, market)]))[0]
+
+    async def submit_many(self, specs: Sequence[tuple]) -> List[SimOrder]:
+        orders = [self.place(*spec) for spec in specs]
+        await asyncio.sleep(max(0.0, max((o.arrive_at for o in orders), default=0.0) - time.time()))
+        self.advance(time.time())
+        return orders
+
+    async def cancel(self, order: SimOrder) -> bool:
+        return (await self.cancel_many([order]))[0]
+
+    async def cancel_many(self, orders: Iterable[SimOrder]) -> List[bool]:
+        orders = list(orders)
+        due = max((self.request_cancel(o) for o in orders if o.is_open), default=0.0)
+        await asyncio.sleep(max(0.0, due - time.time()))
+        self.advance(time.time())
+        return [o.state == CANCELLED for o in orders]
+
+    async def wait(self, order: SimOrder, timeout: Optional[float] = None) -> SimOrder:
+        try:
+            await asyncio.wait_for(order.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return order
+
+    async def load_fee_rates(self, client, token_ids: Iterable[str]):
+        """Taker fee rates from the CLOB (the default stays for tokens that fail)"""
+        for token in token_ids:
+            try:
+                self.fee_bps[token] = float(await asyncio.to_thread(client.get_fee_rate_bps, token))
+            except Exception as e:
+                logger.debug(f"Fee rate lookup failed for {token}: {e}")
+
+    def open_orders(self) -> List[SimOrder]:
+        return [o for orders in self.resting.values() for o in orders]
+
+    def summary(self) -> str:
+        s = self.stats
+        return (f"模拟撮合 提交 {s['submitted']} | 成交 {s['filled']} | 撤单 {s['cancelled']} | 拒绝 {s['rejected']} | "
+                f"挂单中 {len(self.open_orders())} | 手续费 ${s['fees']:.4f}")
+
+    # --- Matching ---
+
+    def _delay(self) -> float:
+        return self.latency + (self.rng.uniform(0.0, self.jitter) if self.jitter > 0 else 0.0)
+
+    def _arrive(self, order: SimOrder):
+        book = self.book_of(order.token_id)
+        if book is None or not 0 < order.price < 1 or order.size <= EPS:
+            self._reject(order, "no order book" if book is None else "invalid price / size")
+            return
+        if order.order_type == "FOK" and self._available(order, book) + EPS < order.size:
+            self._reject(order, "order couldn't be fully filled. FOK orders are fully filled or killed.")
+            return
+        order.acknowledged = True
+        self._sweep(order, book)
+        if order.remaining > EPS:
+            if order.order_type in ("FOK", "FAK"):
+                order.cancel_seen = True
+            else:
+                order.level_size = order.queue_ahead = self._level(order, book)
+                self.resting.setdefault(order.token_id, []).append(order)
+        self._advance(order)
+
+    def _crossing(self, order: SimOrder, book: L2Book):
+        """(index, price) of opposite levels our limit crosses, best first"""
+        side = book.asks if order.side == "BUY" else book.bids
+        for i in range(len(side.keys)):
+            price = side.price_at(i)
+            if (price > order.price + 1e-9) if order.side == "BUY" else (price < order.price - 1e-9): break
+            yield side, i, price
+
+    def _free(self, token: str, side_name: str, price: float, book_size: float) -> float:
+        taken = self.taken.get((token, side_name, price))
+        return book_size - taken[1] if taken and taken[0] == book_size else book_size
+
+    def _available(self, order: SimOrder, book: L2Book) -> float:
+        opposite = "SELL" if order.side == "BUY" else "BUY"
+        return sum(self._free(order.token_id, opposite, p, side.sizes[i]) for side, i, p in self._crossing(order, book))
+
+    def _sweep(self, order: SimOrder, book: L2Book, taker: bool = True, at_limit: bool = False):
+        """Fill against crossing book levels (at their prices, or at our limit for a resting order)"""
+        opposite = "SELL" if order.side == "BUY" else "BUY"
+        for side, i, price in list(self._crossing(order, book)):
+            if order.remaining <= EPS: break
+            book_size = side.sizes[i]
+            free = self._free(order.token_id, opposite, price, book_size)
+            take = min(order.remaining, free)
+            if take <= EPS: continue
+            self.taken[(order.token_id, opposite, price)] = (book_size, book_size - free + take)
+            self._fill(order, order.price if at_limit else price, take, taker)
+
+    def _fill(self, order: SimOrder, price: float, size: float, taker: bool):
+        order.trade_filled += size
+        order.trade_cost += size * price
+        if taker:
+            rate = self.fee_bps.get(order.token_id, self.default_fee_bps)
+            fee = rate / 10000.0 * min(price, 1.0 - price) * size
+            order.fee += fee
+            self.stats["fees"] += fee
+
+    def _level(self, order: SimOrder, book: L2Book) -> float:
+        """Book size on our side at our price"""
+        side = book.bids if order.side == "BUY" else book.asks
+        i, exists = side.find(order.price)
+        return side.sizes[i] if exists else 0.0
+
+    def _on_book(self, token: str):
+        book = self.book_of(token)
+        if book is None: return
+        for order in list(self.resting[token]):
+            # Opposite side at / through our price: the queue ahead is gone and we are hit
+            self._sweep(order, book, taker=False, at_limit=True)
+            if order.remaining > EPS:
+                size = self._level(order, book)
+                if size < order.level_size:
+                    gone = order.level_size - size
+                    traded = min(gone, order.traded_unseen)
+                    order.traded_unseen -= traded
+                    if gone > traded and order.level_size > 0:
+                        order.queue_ahead -= (gone - traded) * order.queue_ahead / order.level_size
+                order.level_size = size
+                order.queue_ahead = max(0.0, min(order.queue_ahead, size))
+            self._after_fill(order)
+
+    def _on_trade(self, token: str, price: float, size: float, taker_side: Optional[str]):
+        for order in list(self.resting[token]):
+            # A taker SELL prints against bids (our BUYs), a taker BUY against asks
+            if taker_side and taker_side == order.side: continue
+            if (price > order.price + 1e-9) if order.side == "BUY" else (price < order.price - 1e-9): continue
+            if abs(price - order.price) <= 1e-9:
+                order.traded_unseen += size
+                ahead = min(order.queue_ahead, size)
+                order.queue_ahead -= ahead
+                fill = min(size - ahead, order.remaining)
+            else:
+                fill = min(size, order.remaining) # Traded through our price
+            if fill > EPS: self._fill(order, order.price, fill, taker=False)
+            self._after_fill(order)
+
+    def _after_fill(self, order: SimOrder):
+        if order.remaining <= EPS: self._unrest(order)
+        self._advance(order)
+
+    def _unrest(self, order: SimOrder):
+        orders = self.resting.get(order.token_id)
+        if orders and order in orders:
+            orders.remove(order)
+            if not orders: del self.resting[order.token_id]
+
+    # --- State machine (as in order_manager.py) ---
+
+    def _reject(self, order: SimOrder, error: str):
+        order.error = error
+        self.stats["rejected"] += 1
+        self._set_state(order, REJECTED)
+
+    def _advance(self, order: SimOrder):
+        if order.filled >= order.size - EPS: target = FILLED
+        elif order.cancel_seen: target = CANCELLED
+        elif order.filled > EPS: target = PARTIAL
+        elif order.acknowledged: target = LIVE
+        else: return
+        if target != order.state and order.state not in TERMINAL and target in TRANSITIONS[order.state]:
+            self._set_state(order, target)
+
+    def _set_state(self, order: SimOrder, state: str):
+        order.state = state
+        order.updated_at = time.time()
+        if state == FILLED: self.stats["filled"] += 1
+        if state == CANCELLED: self.stats["cancelled"] += 1
+        if state in TERMINAL: order.done.set()
@@ -8,23 +8,15 @@ Strategy Evolution Engine (Genetic Optimizer)
 
 import json
 import random
-import os
 from copy import deepcopy
 
-LOG_FILE = "polymarket-bot/paper_trades.jsonl"
+from trade_journal import TradeJournal, CLOSED_TYPES
+
 CURRENT_CONFIG = "polymarket-bot/config.json"
 
-def load_trades():
-    if not os.path.exists(LOG_FILE): return []
-    trades = []
-    with open(LOG_FILE, "r") as f:
-        for line in f:
-            try:
-                t = json.loads(line)
-                # We need trades that have entry/exit price or PnL to simulate
-                if "pnl" in t: trades.append(t)
-            except: pass
-    return trades
+def load_trades(last=None):
+    # We need trades that have entry/exit price or PnL to simulate
+    return TradeJournal().query(types=CLOSED_TYPES, last=last)
 
 def simulate(trades, stop_loss_pct):
     """
@@ -66,7 +58,7 @@ def simulate(trades, stop_loss_pct):
 
 def evolve():
     print("🧬 启动策略进化引擎...")
-    trades = load_trades()[-100:] # Last 100 trades
+    trades = load_trades(last=100) # Last 100 trades
     
     if not trades:
         print("数据不足，无法进化。")
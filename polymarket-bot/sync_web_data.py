@@ -11,45 +11,36 @@ import os
 import subprocess
 from datetime import datetime, timezone
 
-LOG_FILE = "polymarket-bot/paper_trades.jsonl"
+from trade_journal import TradeJournal, CLOSED_TYPES, day_range
+from perf_stats import PerfStats
+
 OUTPUT_FILE = "public/data.json"
 
 def generate_web_data():
-    trades = []
-    today_str = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    
-    if os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "r") as f:
-            for line in f:
-                try:
-                    t = json.loads(line)
-                    # Add simple timestamp for chart
-                    if "time" in t:
-                        t["shortTime"] = t["time"].split("T")[1][:5]
-                    trades.append(t)
-                except: pass
-
-    # Calculate Stats
-    closed_trades = [t for t in trades if "pnl" in t]
-    wins = len([t for t in closed_trades if float(t["pnl"]) > 0])
-    losses = len([t for t in closed_trades if float(t["pnl"]) < 0])
-    total_pnl = sum([float(t["pnl"]) for t in closed_trades])
-    win_rate = (wins / (wins + losses)) if (wins + losses) > 0 else 0
+    journal = TradeJournal()
     
-    gross_profit = sum([float(t["pnl"]) for t in closed_trades if float(t["pnl"]) > 0])
-    gross_loss = abs(sum([float(t["pnl"]) for t in closed_trades if float(t["pnl"]) < 0]))
-    profit_factor = (gross_profit / gross_loss) if gross_loss > 0 else 999.0
+    # All-time stats (incremental aggregates, only new trades are read)
+    perf = PerfStats(journal)
+    perf.update()
+    stats = perf.all_time()
+    total_pnl = stats["net_pnl"]
+    win_rate = stats["win_rate"]
+    profit_factor = min(stats["profit_factor"], 999.0) if stats["losses"] else 999.0
 
     # Generate Chart Data (Equity Curve)
     chart_data = []
     running_pnl = 0.0
-    for t in trades:
-        if "pnl" in t and t["time"].startswith(today_str):
-            running_pnl += float(t["pnl"])
-            chart_data.append({
-                "time": t["shortTime"],
-                "pnl": round(running_pnl, 2)
-            })
+    for t in journal.query(*day_range(), types=CLOSED_TYPES):
+        running_pnl += float(t["pnl"])
+        chart_data.append({
+            "time": t["time"].split("T")[1][:5],
+            "pnl": round(running_pnl, 2)
+        })
+
+    recent_trades = journal.query(last=10)
+    for t in recent_trades:
+        # Add simple timestamp for chart
+        t["shortTime"] = t["time"].split("T")[1][:5]
 
     data = {
         "updatedAt": datetime.now(timezone.utc).strftime("%H:%M:%S UTC"),
@@ -57,10 +48,10 @@ def generate_web_data():
             "netPnL": f"{total_pnl:+.2f} R",
             "winRate": f"{win_rate:.1%}",
             "profitFactor": f"{profit_factor:.2f}",
-            "totalTrades": len(trades)
+            "totalTrades": len(journal)
         },
         "chartData": chart_data,
-        "recentTrades": trades[-10:][::-1] # Last 10 reversed
+        "recentTrades": recent_trades[::-1] # Last 10 reversed
     }
     
     # Ensure dirs exist
@@ -0,0 +1,10 @@
+"""The bot's modules are flat scripts that import each other by name: put polymarket-bot/ on the path.
+
+Run from the repository root:
+    python -m pytest polymarket-bot/tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,115 @@
+import logging
+from logging.handlers import RotatingFileHandler
+
+import pytest
+
+from journal_writer import JournalWriter
+from trade_journal import TradeJournal, RECORD
+
+
+def record(i: int) -> dict:
+    return {"time": 1_700_000_000 + i, "type": "STOP_LOSS", "market": f"m{i}", "pnl": float(i)}
+
+
+@pytest.mark.parametrize("policy", ["record", "batch", "interval"])
+def test_everything_lands_in_order(tmp_path, policy):
+    writer = JournalWriter(str(tmp_path), fsync=policy, fsync_interval_sec=0.01)
+    for i in range(300): writer.append(record(i))
+    writer.close()
+    assert [r["pnl"] for r in TradeJournal(str(tmp_path)).read_from(0)[0]] == [float(i) for i in range(300)]
+    assert writer.metrics()["records"] == 300
+
+
+class TornFile:
+    """Stands in for the data file: 2.5 records reach the disk, then ENOSPC"""
+
+    def __init__(self, f):
+        self.f = f
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+    def write(self, data):
+        self.f.write(data[:RECORD.size * 5 // 2])
+        self.f.flush()
+        raise OSError(28, "No space left on device")
+
+    def flush(self):
+        pass
+
+
+def test_retry_writes_exactly_the_unwritten_records(tmp_path, monkeypatch):
+    writer = JournalWriter(str(tmp_path))
+    torn = []
+
+    def torn_open(path, mode="r", *args, **kwargs):
+        f = open(path, mode, *args, **kwargs)
+        if path == writer.journal.data_file and mode == "ab" and not torn:
+            torn.append(path)
+            return TornFile(f)
+        return f
+
+    def other_process_appends(_):
+        # Between the failure and the retry another process (fetch_history) takes the lock and appends
+        other = TradeJournal(str(tmp_path))
+        other.extend({**record(i), "type": "SETTLED"} for i in range(100, 103))
+        other.close()
+
+    monkeypatch.setattr("trade_journal.open", torn_open, raising=False)
+    monkeypatch.setattr("journal_writer.time.sleep", other_process_appends)
+    with writer.cond: # Queue the batch as one unit
+        for i in range(5): writer.pending.append((0, record(i), 0.0))
+        writer.cond.notify()
+    assert writer.flush(timeout=5)
+    writer.close()
+    got = [(r["type"], r["pnl"]) for r in TradeJournal(str(tmp_path)).read_from(0)[0]]
+    ours = [pnl for kind, pnl in got if kind == "STOP_LOSS"]
+    assert ours == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert len(got) == 8
+    assert writer.stats["errors"] == 1 and writer.stats["records"] == 5
+
+
+def test_in_line_writes_wait_for_the_final_sync(tmp_path, monkeypatch):
+    writer = JournalWriter(str(tmp_path))
+    real_sync = writer.journal.sync
+    seen = []
+
+    def final_sync():
+        seen.append(writer.drained) # A late write now must not go in-line: this thread still uses the journal
+        if len(seen) == 1: writer.append(record(2))
+        real_sync()
+
+    monkeypatch.setattr(writer.journal, "sync", final_sync)
+    with writer.cond: # Last batch and stop in one step, as close() after a final append
+        writer.pending.append((0, record(1), 0.0))
+        writer.stopped = True
+        writer.cond.notify()
+    writer.thread.join(5)
+    writer.journal.close()
+    assert seen == [False, False] and writer.drained
+    writer.append(record(3)) # Thread done: written in-line
+    assert [r["pnl"] for r in TradeJournal(str(tmp_path)).read_from(0)[0]] == [1.0, 2.0, 3.0]
+
+
+def test_full_queue_drops_log_lines_never_records(tmp_path):
+    writer = JournalWriter(str(tmp_path), max_pending=3)
+    log = logging.getLogger("test_journal_writer")
+    handler = RotatingFileHandler(str(tmp_path / "bot.log"))
+    log.addHandler(handler)
+    log.propagate = False
+    try:
+        with writer.cond: # Hold the writer thread off while the queue fills up
+            writer.capture_logging(log)
+            for i in range(5):
+                writer.pending.append((0, record(i), 0.0)) if i < 3 else writer.append(record(i))
+            log.warning("dropped")
+        writer.close()
+    finally:
+        log.removeHandler(handler)
+        handler.close()
+    m = writer.metrics()
+    assert m["over_limit"] == 2 and m["dropped_lines"] == 1
+    assert len(TradeJournal(str(tmp_path))) == 5
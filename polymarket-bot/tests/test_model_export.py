@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+import pytest
+
+sklearn_ensemble = pytest.importorskip("sklearn.ensemble")
+
+from model_export import ForestPredictor, export_forest, manifest_path
+
+FEATURE_NAMES = ("a", "b", "c", "d")
+
+
+@pytest.fixture(scope="module")
+def forest():
+    rng = np.random.default_rng(7)
+    X = rng.normal(size=(600, len(FEATURE_NAMES)))
+    X[:, 3] = np.round(X[:, 3]) # Ties on thresholds: exercises the <= comparison
+    y = ((X[:, 0] + X[:, 1] * X[:, 2] + 0.3 * rng.normal(size=600)) > 0).astype(int)
+    clf = sklearn_ensemble.RandomForestClassifier(n_estimators=25, max_depth=8, min_samples_leaf=2, random_state=0)
+    clf.fit(X, y)
+    return clf, rng.normal(size=(200, len(FEATURE_NAMES)))
+
+
+def test_matches_sklearn(forest, tmp_path):
+    clf, X = forest
+    path = str(tmp_path / "model.npz")
+    export_forest(clf, FEATURE_NAMES, path)
+    predictor = ForestPredictor.load(path, FEATURE_NAMES, max_batch=64)
+    expected = clf.predict_proba(X)[:, 1]
+    got = []
+    for start in range(0, len(X), 64):
+        batch = X[start:start + 64]
+        for i, row in enumerate(batch):
+            predictor.set_row(i, dict(zip(FEATURE_NAMES, row)))
+        got.extend(predictor.predict_proba(len(batch)).tolist())
+    np.testing.assert_allclose(got, expected, rtol=0, atol=1e-12)
+    predictor.set_row(0, dict(zip(FEATURE_NAMES, X[0])))
+    assert predictor.predict(1)[0] == clf.predict(X[:1])[0]
+
+
+def test_schema_mismatch_fails_loudly(forest, tmp_path):
+    clf, _ = forest
+    path = str(tmp_path / "model.npz")
+    export_forest(clf, FEATURE_NAMES, path)
+    with pytest.raises(ValueError, match="schema"):
+        ForestPredictor.load(path, ("a", "b", "d", "c"))
+    with pytest.raises(ValueError):
+        export_forest(clf, FEATURE_NAMES[:3], path)
+
+
+def test_checksum_is_checked(forest, tmp_path):
+    clf, _ = forest
+    path = str(tmp_path / "model.npz")
+    export_forest(clf, FEATURE_NAMES, path)
+    with open(manifest_path(path)) as f:
+        manifest = json.load(f)
+    manifest["sha256"] = "0" * 64
+    with open(manifest_path(path), "w") as f:
+        json.dump(manifest, f)
+    with pytest.raises(ValueError, match="checksum"):
+        ForestPredictor.load(path, FEATURE_NAMES)
@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+from position_book import PositionBook, FRAME
+
+
+def open_position(book: PositionBook, i: int, market: str = None):
+    return book.open(market_slug=market or f"m{i % 3}", condition_id="0xc", token_id=f"t{i}", symbol="BTCUSDT",
+                     direction="UP", entry_price=0.5, size=0.05, shares=5.0, strike=100.0, end_ts=1000 + i)
+
+
+def state(book: PositionBook) -> dict:
+    return {p.id: p.to_dict() for p in book}
+
+
+@pytest.fixture
+def book(tmp_path):
+    b = PositionBook(str(tmp_path), snapshot_every=5)
+    yield b
+    b.close_book()
+
+
+def test_recovers_every_op(book):
+    positions = [open_position(book, i) for i in range(7)] # Crosses a snapshot
+    book.sell(positions[1], 2.0, 0.6)
+    book.close(positions[0])
+    book.flush()
+    recovered = PositionBook(book.path)
+    try:
+        assert state(recovered) == state(book)
+        assert recovered.next_id == 8
+        p = next(p for p in recovered if p.id == 2)
+        assert (p.shares, p.sold_shares, p.sold_value) == (3.0, 2.0, 0.6)
+        assert [p.id for p in recovered.in_market("m0")] == [4, 7]
+        assert not recovered.for_token("t0")
+    finally:
+        recovered.close_book()
+
+
+def test_torn_tail_frame_is_cut(book):
+    for i in range(3): open_position(book, i)
+    book.flush()
+    size = os.path.getsize(book.wal_file)
+    with open(book.wal_file, "ab") as f:
+        f.write(FRAME.pack(100, 1) + b'{"op":"open"') # Crash in the middle of a frame
+    recovered = PositionBook(book.path)
+    try:
+        assert len(recovered) == 3
+        assert os.path.getsize(recovered.wal_file) == size
+        open_position(recovered, 3)
+        recovered.flush()
+    finally:
+        recovered.close_book()
+    again = PositionBook(book.path)
+    try:
+        assert sorted(p.id for p in again) == [1, 2, 3, 4]
+    finally:
+        again.close_book()
+
+
+def test_corrupt_frame_stops_replay(book):
+    for i in range(2): open_position(book, i)
+    book.flush()
+    with open(book.wal_file, "r+b") as f:
+        f.seek(-2, os.SEEK_END)
+        f.write(b"xx") # Flipped bytes in the last frame: crc mismatch
+    recovered = PositionBook(book.path)
+    try:
+        assert [p.id for p in recovered] == [1]
+    finally:
+        recovered.close_book()
+
+
+def test_snapshot_truncates_log_and_survives_restart(book):
+    for i in range(12): open_position(book, i)
+    book.expire(1005) # Each market is judged by its first position (end_ts 1000..1002): all go
+    book.flush()
+    assert os.path.exists(book.snapshot_file)
+    recovered = PositionBook(book.path)
+    try:
+        assert state(recovered) == state(book) == {}
+        assert recovered.seq == book.seq
+    finally:
+        recovered.close_book()
+
+
+def test_failed_write_is_retried_whole(book, monkeypatch):
+    open_position(book, 0)
+    book.flush()
+    calls = []
+    real = book._append
+
+    def flaky(frames):
+        calls.append(len(frames))
+        if len(calls) == 1:
+            book.wal.write(b"".join(frames)[:5]) # Part of the group reached the file
+            book.wal.flush()
+            raise OSError(28, "No space left on device")
+        real(frames)
+
+    monkeypatch.setattr(book, "_append", flaky)
+    monkeypatch.setattr("position_book.time.sleep", lambda s: None)
+    open_position(book, 1)
+    assert book.flush(timeout=5)
+    recovered = PositionBook(book.path)
+    try:
+        assert sorted(p.id for p in recovered) == [1, 2]
+    finally:
+        recovered.close_book()
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from l2_book import L2Book
+from order_manager import CANCELLED, FILLED, PARTIAL, REJECTED
+from sim_exchange import SimExchange
+
+TOKEN = "111"
+T0 = 1_700_000_000.0
+
+
+def level(price: float, size: float) -> dict:
+    return {"price": str(price), "size": str(size)}
+
+
+@pytest.fixture
+def book():
+    b = L2Book(TOKEN)
+    b.apply_snapshot([level(0.50, 3), level(0.45, 10)], [level(0.54, 2), level(0.55, 1), level(0.60, 10)])
+    return b
+
+
+@pytest.fixture
+def exchange(book):
+    return SimExchange({TOKEN: book}.get, latency_ms=0, jitter_ms=0, seed=1)
+
+
+def test_fak_fills_what_crosses_and_kills_the_rest(exchange):
+    order = exchange.place(TOKEN, "BUY", 0.55, 5.0, "FAK", now=T0)
+    assert order.state == CANCELLED
+    assert order.filled == pytest.approx(3.0)
+    assert order.avg_price == pytest.approx((2 * 0.54 + 1 * 0.55) / 3)
+    assert not exchange.open_orders()
+
+
+def test_partial_sell_into_bids(exchange):
+    order = exchange.place(TOKEN, "SELL", 0.45, 20.0, "FAK", now=T0)
+    assert order.state == CANCELLED
+    assert order.filled == pytest.approx(13.0)
+    assert order.avg_price == pytest.approx((3 * 0.50 + 10 * 0.45) / 13)
+
+
+def test_taken_liquidity_is_not_filled_twice(exchange, book):
+    first = exchange.place(TOKEN, "BUY", 0.54, 5.0, "FAK", now=T0)
+    assert first.filled == pytest.approx(2.0)
+    again = exchange.place(TOKEN, "BUY", 0.54, 5.0, "FAK", now=T0)
+    assert again.filled == 0 and again.state == CANCELLED
+    book.asks.set(0.54, 4.0) # The book reports a new size at the level: fresh liquidity
+    refreshed = exchange.place(TOKEN, "BUY", 0.54, 5.0, "FAK", now=T0)
+    assert refreshed.filled == pytest.approx(4.0)
+
+
+def test_fok_is_all_or_nothing(exchange):
+    killed = exchange.place(TOKEN, "BUY", 0.55, 5.0, "FOK", now=T0)
+    assert killed.state == REJECTED and killed.filled == 0
+    filled = exchange.place(TOKEN, "BUY", 0.55, 3.0, "FOK", now=T0)
+    assert filled.state == FILLED and filled.filled == pytest.approx(3.0)
+
+
+def test_taker_fee_lowers_sell_proceeds(book):
+    exchange = SimExchange({TOKEN: book}.get, latency_ms=0, jitter_ms=0, fee_bps=100)
+    order = exchange.place(TOKEN, "SELL", 0.50, 3.0, "FAK", now=T0)
+    fee = 0.01 * 0.50 * 3.0
+    assert order.fee == pytest.approx(fee)
+    assert order.net_price == pytest.approx(0.50 - fee / 3.0)
+
+
+def test_order_waits_for_latency(book):
+    exchange = SimExchange({TOKEN: book}.get, latency_ms=100, jitter_ms=0)
+    order = exchange.place(TOKEN, "BUY", 0.54, 1.0, "FAK", now=T0)
+    assert order.filled == 0 and order.is_open
+    exchange.advance(T0 + 0.05)
+    assert order.filled == 0
+    exchange.advance(T0 + 0.1)
+    assert order.state == FILLED
+
+
+def test_resting_remainder_of_gtc(exchange):
+    order = exchange.place(TOKEN, "BUY", 0.54, 5.0, "GTC", now=T0)
+    assert order.filled == pytest.approx(2.0)
+    assert order.state == PARTIAL and exchange.open_orders() == [order]
+
+
+def test_async_submit(exchange):
+    async def run():
+        order = await exchange.submit(TOKEN, "BUY", 0.60, 20.0, "FAK")
+        return await exchange.wait(order, 1.0)
+
+    order = asyncio.run(run())
+    assert order.state == CANCELLED and order.filled == pytest.approx(13.0)
+
+
+def test_invalid_price_is_rejected(exchange):
+    order = exchange.place(TOKEN, "SELL", 0.0, 5.0, "FAK", now=T0)
+    assert order.state == REJECTED and order.filled == 0
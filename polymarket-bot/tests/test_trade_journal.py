@@ -0,0 +1,57 @@
+import os
+
+import pytest
+
+from trade_journal import TradeJournal, HEADER, RECORD, INDEX
+
+
+def closed(i: int, market: str = None) -> dict:
+    return {"time": 1_700_000_000 + i, "type": "SETTLED", "market": market or f"m{i}",
+            "direction": "UP", "result": "WIN", "pnl": float(i)}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    j = TradeJournal(str(tmp_path))
+    j.extend(closed(i) for i in range(5))
+    yield j
+    j.close()
+
+
+def test_round_trip(journal, tmp_path):
+    reopened = TradeJournal(str(tmp_path))
+    assert len(reopened) == 5
+    assert [(r["market"], r["pnl"]) for r in reopened.records()] == [(f"m{i}", float(i)) for i in range(5)]
+    assert [r["market"] for r in reopened.query(last=2)] == ["m3", "m4"]
+    records, cursor = reopened.read_from(3)
+    assert [r["market"] for r in records] == ["m3", "m4"] and cursor == 5
+
+
+def test_torn_data_tail_is_cut_before_append(journal):
+    with open(journal.data_file, "ab") as f:
+        f.write(b"\xff" * (RECORD.size // 2)) # Crash / ENOSPC in the middle of a record
+    journal.append(closed(9, "after-crash"))
+    assert os.path.getsize(journal.data_file) == HEADER.size + 6 * RECORD.size
+    reopened = TradeJournal(journal.path)
+    assert [r["market"] for r in reopened.records()] == ["m0", "m1", "m2", "m3", "m4", "after-crash"]
+    assert reopened.read_from(5)[0][0]["pnl"] == 9.0
+
+
+def test_torn_tails_are_cut_on_open(journal):
+    with open(journal.data_file, "ab") as f:
+        f.write(b"\x00" * 7)
+    with open(journal.index_file, "ab") as f:
+        f.write(b"\x00" * (INDEX.size - 1))
+    with open(journal.strings_file, "ab") as f:
+        f.write(b"half-written") # No newline: the string never got an id
+    reopened = TradeJournal(journal.path)
+    assert os.path.getsize(reopened.data_file) == HEADER.size + 5 * RECORD.size
+    assert os.path.getsize(reopened.index_file) == 5 * INDEX.size
+    reopened.append(closed(9, "new-market"))
+    assert [r["market"] for r in TradeJournal(journal.path).query(last=1)] == ["new-market"]
+
+
+def test_out_of_order_append_rebuilds_index(journal):
+    journal.append({**closed(-10, "backfill")})
+    assert journal.records()[0]["market"] == "backfill"
+    assert len(journal.query(start=1_700_000_000, end=1_700_000_003)) == 3
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Trade Journal (binary, append-only)
+- Replaces paper_trades.jsonl: fixed-size binary records, appended and never rewritten.
+- A separate index (ts, record no, type, market) is kept sorted by time, so
+  "today" or "last 20 closed" is a binary search over a memory-mapped file
+  instead of json.loads on every line ever written.
+- Strings (type, market slug, condition id, direction, result) live in a small
+  append-only string table and are stored as ids.
+- Several processes may write (bot, fetch_history, augment_data): appends are
+  serialized with an flock, readers pick up new records on the next query.
+
+Files (JOURNAL_DIR):
+    trades.dat   header + records (RECORD format)
+    index.dat    entries sorted by ts (INDEX format), rebuilt if missing / behind
+    strings.txt  one string per line, id = line number + 1 (0 = missing)
+
+Migration from the old log:
+    python3 polymarket-bot/trade_journal.py migrate [paper_trades.jsonl ...]
+    python3 polymarket-bot/trade_journal.py tail 20
+"""
+
+import os
+import sys
+import json
+import math
+import mmap
+import fcntl
+import struct
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+JOURNAL_DIR = "polymarket-bot/journal"
+LEGACY_FILES = ("paper_trades.jsonl", "polymarket-bot/paper_trades.jsonl")
+
+CLOSED_TYPES = ("SETTLED", "STOP_LOSS")  # Records carrying a realized pnl
+
+MAGIC = b"PMTJ"
+VERSION = 1
+HEADER = struct.Struct("<4sII4x")  # magic, version, record size
+# ts | type market condition_id direction result (string ids) | pad |
+# price entry_price exit_price pnl strike fee prev_trend (NaN = missing)
+RECORD = struct.Struct("<dIIIII4x7d")
+INDEX = struct.Struct("<dIII")      # ts, record no, type id, market id
+
+STRING_FIELDS = ("type", "market", "condition_id", "direction", "result")
+FLOAT_FIELDS = ("price", "entry_price", "exit_price", "pnl", "strike", "fee", "prev_trend")
+ALIASES = {"strike_price": "strike"}  # Old JSONL keys folded into the schema
+
+
+def parse_time(value) -> float:
+    """Epoch seconds from an epoch number or ISO string (naive = local time, as the bot used to write)"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def day_range(day: Optional[datetime] = None) -> Tuple[float, float]:
+    """[start, end) epoch seconds of a UTC calendar day (default: today)"""
+    day = day or datetime.now(timezone.utc)
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    return start.timestamp(), (start + timedelta(days=1)).timestamp()
+
+
+class TradeJournal:
+    """Append-only trade store with a time-sorted index"""
+
+    def __init__(self, path: str = JOURNAL_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.data_file = os.path.join(path, "trades.dat")
+        self.index_file = os.path.join(path, "index.dat")
+        self.strings_file = os.path.join(path, "strings.txt")
+        self.lock_file = os.path.join(path, ".lock")
+
+        self.strings: List[str] = [""]
+        self.string_ids: Dict[str, int] = {"": 0}
+        self._strings_pos = 0
+        self._maps = {}  # file -> (mmap, size, inode)
+
+        with self._locked():
+            if not os.path.exists(self.data_file) or os.path.getsize(self.data_file) == 0:
+                with open(self.data_file, "wb") as f:
+                    f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            with open(self.data_file, "rb") as f:
+                magic, version, size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or size != RECORD.size:
+                raise ValueError(f"{self.data_file}: not a v{VERSION} trade journal")
+            self._trim_tails()
+            self._load_strings()
+            self._sync_index()
+
+    # --- Writing ---
+
+    def append(self, record: dict) -> int:
+        """Append one record (same keys as the old JSONL lines). Returns its record number."""
+        return self.extend([record])[0]
+
+    def extend(self, records: Iterable[dict], written: Optional[List[int]] = None) -> List[int]:
+        """Append many records with a single lock / index update.
+        `written` (optional) receives the record numbers that reached the data file, also when
+        the write fails part-way: it is filled under the lock, so other writers never count."""
+        records = list(records)
+        if not records: return []
+        with self._locked():
+            self._trim_tails()
+            self._load_strings()
+            first = self._count()
+            packed, entries = [], []
+            for i, rec in enumerate(records):
+                row = self._pack(rec)
+                packed.append(row)
+                ts, type_id, market_id = RECORD.unpack(row)[:3]
+                entries.append((ts, first + i, type_id, market_id))
+
+            try:
+                with open(self.data_file, "ab") as f:
+                    f.write(b"".join(packed))
+                    f.flush()
+            finally:
+                self._trim_tails()
+                if written is not None:
+                    written.extend(range(first, first + min(max(self._count() - first, 0), len(records))))
+
+            index_last = self._index_last_ts()
+            in_order = all(entries[i][0] <= entries[i + 1][0] for i in range(len(entries) - 1))
+            if self._index_count() == first and in_order and (index_last is None or entries[0][0] >= index_last):
+                with open(self.index_file, "ab") as f:
+                    f.write(b"".join(INDEX.pack(*e) for e in entries))
+            else:
+                self._rebuild_index() # Back-filled history: re-sort once
+        return [first + i for i in range(len(records))]
+
+    def sync(self):
+        """fsync the journal files (appends are only flushed to the OS)"""
+        for path in (self.data_file, self.index_file, self.strings_file):
+            if not os.path.exists(path): continue
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _pack(self, rec: dict) -> bytes:
+        rec = {ALIASES.get(k, k): v for k, v in rec.items()}
+        ts = parse_time(rec["time"]) if rec.get("time") is not None else datetime.now(timezone.utc).timestamp()
+        ids = [self._string_id(rec.get(k)) for k in STRING_FIELDS]
+        floats = []
+        for k in FLOAT_FIELDS:
+            v = rec.get(k)
+            floats.append(float(v) if v is not None else math.nan)
+        return RECORD.pack(ts, *ids, *floats)
+
+    def _string_id(self, value) -> int:
+        if value is None: return 0
+        s = str(value).replace("\n", " ")
+        sid = self.string_ids.get(s)
+        if sid is None:
+            with open(self.strings_file, "a", encoding="utf-8") as f:
+                f.write(s + "\n")
+            self._load_strings()
+            sid = self.string_ids[s]
+        return sid
+
+    # --- Reading ---
+
+    def __len__(self) -> int:
+        return self._count()
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              types: Optional[Iterable[str]] = None, market: Optional[str] = None,
+              last: Optional[int] = None) -> List[dict]:
+        """
+        Records with start <= ts < end (epoch seconds), optionally filtered by
+        type(s) / market, in time order. `last` keeps only the newest N matches
+        (scanned backwards, so "last 20 closed" touches ~20 index entries).
+        """
+        with self._locked():
+            self._sync_index()
+        idx = self._map(self.index_file)
+        n = len(idx) // INDEX.size if idx else 0
+        lo = self._bisect(idx, n, start) if start is not None else 0
+        hi = self._bisect(idx, n, end) if end is not None else n
+
+        self._load_strings()
+        type_ids = None
+        if types is not None:
+            if isinstance(types, str): types = (types,)
+            type_ids = {self.string_ids[t] for t in types if t in self.string_ids}
+            if not type_ids: return []
+        market_id = None
+        if market is not None:
+            market_id = self.string_ids.get(market)
+            if market_id is None: return []
+
+        order = range(hi - 1, lo - 1, -1) if last is not None else range(lo, hi)
+        recnos = []
+        for i in order:
+            _, recno, type_id, mkt = INDEX.unpack_from(idx, i * INDEX.size)
+            if type_ids is not None and type_id not in type_ids: continue
+            if market_id is not None and mkt != market_id: continue
+            recnos.append(recno)
+            if last is not None and len(recnos) >= last: break
+        if last is not None: recnos.reverse()
+
+        data = self._map(self.data_file)
+        return [self._unpack(data, r) for r in recnos]
+
+    def read_from(self, recno: int, limit: Optional[int] = None) -> Tuple[List[dict], int]:
+        """Records appended at/after record number `recno` (append order, at most `limit`) and the next cursor"""
+        n = self._count()
+        if recno >= n: return [], n
+        if limit is not None: n = min(n, recno + limit)
+        data = self._map(self.data_file)
+        self._load_strings()
+        return [self._unpack(data, r) for r in range(recno, n)], n
+
+    def records(self) -> List[dict]:
+        """Every record in time order"""
+        return self.query()
+
+    def markets(self) -> set:
+        """Market slugs present in the journal"""
+        with self._locked():
+            self._sync_index()
+        idx = self._map(self.index_file)
+        ids = {INDEX.unpack_from(idx, i * INDEX.size)[3] for i in range(len(idx) // INDEX.size)} if idx else set()
+        self._load_strings()
+        return {self.strings[i] for i in ids if i}
+
+    def _unpack(self, data, recno: int) -> dict:
+        ts, *rest = RECORD.unpack_from(data, HEADER.size + recno * RECORD.size)
+        ids, floats = rest[:len(STRING_FIELDS)], rest[len(STRING_FIELDS):]
+        if max(ids) >= len(self.strings): self._load_strings()
+        out = {"time": datetime.fromtimestamp(ts, timezone.utc).isoformat()}
+        for k, sid in zip(STRING_FIELDS, ids):
+            if sid: out[k] = self.strings[sid]
+        for k, v in zip(FLOAT_FIELDS, floats):
+            if not math.isnan(v): out[k] = v
+        return out
+
+    @staticmethod
+    def _bisect(idx, n: int, ts: float) -> int:
+        """First index entry with entry.ts >= ts"""
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if INDEX.unpack_from(idx, mid * INDEX.size)[0] < ts: lo = mid + 1
+            else: hi = mid
+        return lo
+
+    # --- Files ---
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_file, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _map(self, path: str):
+        """Read-only mmap of a file, remapped when it has grown (None if empty)"""
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        cached = self._maps.get(path)
+        if cached and cached[1] == size and cached[2] == os.stat(path).st_ino:
+            return cached[0]
+        if cached: cached[0].close()
+        if size == 0:
+            self._maps.pop(path, None)
+            return None
+        with open(path, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[path] = (m, size, os.stat(path).st_ino)
+        return m
+
+    def _count(self) -> int:
+        return (os.path.getsize(self.data_file) - HEADER.size) // RECORD.size
+
+    def _index_count(self) -> int:
+        return os.path.getsize(self.index_file) // INDEX.size if os.path.exists(self.index_file) else 0
+
+    def _index_last_ts(self) -> Optional[float]:
+        n = self._index_count()
+        if n == 0: return None
+        with open(self.index_file, "rb") as f:
+            f.seek((n - 1) * INDEX.size)
+            return INDEX.unpack(f.read(INDEX.size))[0]
+
+    def _trim_tails(self):
+        """Cut partial records / index entries / strings left by a torn write (caller holds the lock).
+        Appending after one would shift every later record off its slot."""
+        for path, base, size in ((self.data_file, HEADER.size, RECORD.size), (self.index_file, 0, INDEX.size)):
+            if not os.path.exists(path): continue
+            extra = (os.path.getsize(path) - base) % size
+            if extra:
+                with open(path, "r+b") as f:
+                    f.truncate(os.path.getsize(path) - extra)
+        if os.path.exists(self.strings_file) and os.path.getsize(self.strings_file):
+            with open(self.strings_file, "r+b") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.seek(0)
+                    f.truncate(f.read().rfind(b"\n") + 1)
+
+    def _sync_index(self):
+        """Rebuild the index if it is missing or behind the data file (caller holds the lock)"""
+        if self._index_count() != self._count():
+            self._rebuild_index()
+
+    def _rebuild_index(self):
+        data = self._map(self.data_file)
+        entries = []
+        for r in range(self._count()):
+            ts, type_id, market_id = RECORD.unpack_from(data, HEADER.size + r * RECORD.size)[:3]
+            entries.append((ts, r, type_id, market_id))
+        entries.sort()
+        tmp = self.index_file + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(INDEX.pack(*e) for e in entries))
+        os.replace(tmp, self.index_file)
+
+    def _load_strings(self):
+        """Read strings appended since the last load (possibly by another process)"""
+        if not os.path.exists(self.strings_file): return
+        with open(self.strings_file, "r", encoding="utf-8") as f:
+            f.seek(self._strings_pos)
+            while True:
+                line = f.readline()
+                if not line.endswith("\n"): break # Partial line from a concurrent writer
+                s = line[:-1]
+                self.string_ids.setdefault(s, len(self.strings))
+                self.strings.append(s)
+                self._strings_pos = f.tell()
+
+    def close(self):
+        for m in self._maps.values(): m[0].close()
+        self._maps = {}
+
+
+def migrate(sources: List[str], journal: TradeJournal, force: bool = False) -> int:
+    """Import JSONL trade logs into the journal. Returns the number of records written."""
+    if len(journal) and not force:
+        print(f"Journal already has {len(journal)} records (use --force to append anyway)")
+        return 0
+    records, bad, dropped = [], 0, set()
+    known = set(STRING_FIELDS) | set(FLOAT_FIELDS) | set(ALIASES) | {"time"}
+    for path in sources:
+        if not os.path.exists(path): continue
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if not line: continue
+                try:
+                    rec = json.loads(line)
+                    parse_time(rec["time"])
+                    records.append(rec)
+                    dropped.update(k for k in rec if k not in known)
+                except Exception:
+                    bad += 1
+        print(f"Read {path}")
+    journal.extend(records)
+    print(f"✅ Migrated {len(records)} records ({bad} unreadable lines skipped)")
+    if dropped: print(f"   Fields outside the journal schema were dropped: {', '.join(sorted(dropped))}")
+    return len(records)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    cmd = args[0] if args else "tail"
+    journal = TradeJournal()
+    if cmd == "migrate":
+        files = [a for a in args[1:] if not a.startswith("--")] or list(LEGACY_FILES)
+        migrate(files, journal, force="--force" in args)
+    elif cmd == "tail":
+        n = int(args[1]) if len(args) > 1 else 20
+        for rec in journal.query(last=n):
+            print(json.dumps(rec))
+    else:
+        print(f"Unknown command: {cmd} (migrate | tail [n])")
@@ -1,142 +1,273 @@
 #!/usr/bin/env python3
 """
 Polymarket Machine Learning Training Script
-- Reads paper_trades.jsonl (historical data)
+- Reads SETTLED records from the trade journal (historical data) plus the
+  mirrored LOSS partition written by augment_data.py, in time order
 - Trains a Random Forest Classifier to predict WIN/LOSS
-- Saves the model to be used by V4 bot
+- Hyperparameters are chosen by walk-forward cross-validation (train on the
+  past, validate on the next block, with a purge gap so no training trade
+  settles inside the validation period); the grid x folds runs in parallel
+- Feature matrix + fold indices are cached per journal state, so repeated
+  searches skip loading and feature engineering
+- prev_trend missing on older BTC 15m trades is back-filled from the local
+  candle store (no network)
+- Indicator features (RSI, Bollinger width, ATR, VWAP distance, returns) are
+  computed by the same streaming engine the bot runs (indicators.py), as of
+  each market's open
+- Saves the model and its flattened export (model_export.py) used by the bot
 """
 
+import os
 import json
-import pandas as pd
+import hashlib
+import time
 import numpy as np
-from sklearn.model_selection import train_test_split
+import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, classification_report
+from sklearn.metrics import classification_report
+from joblib import Parallel, delayed
 import joblib
-import os
 
-DATA_FILE = "polymarket-bot/paper_trades.jsonl"
+from trade_journal import TradeJournal, parse_time
+from candle_store import CandleStore
+from augment_data import AUGMENTED_DIR
+from model_export import FEATURES, EXPORT_FILE, TREND_EXTREME, export_forest
+from indicators import INDICATOR_FEATURES, NEUTRAL, indicator_series
+
 MODEL_FILE = "polymarket-bot/ml_model_v1.pkl"
+CACHE_DIR = "polymarket-bot/cache"
+
+N_SPLITS = 5          # Walk-forward folds
+MIN_FOLD = 20         # Minimum samples per time block
+PURGE_SEC = 900       # Drop training trades within one market cycle of the validation start
+PARAM_GRID = [
+    {"n_estimators": n_est, "max_depth": max_depth}
+    for n_est in [50, 100, 200]
+    for max_depth in [None, 5, 10, 20]
+]
 
 def load_data():
-    if not os.path.exists(DATA_FILE):
-        print(f"No data file found at {DATA_FILE}")
-        return None
-        
-    data = []
-    with open(DATA_FILE, "r") as f:
-        for line in f:
-            try:
-                record = json.loads(line)
-                # We only want SETTLED records which have a result
-                if record.get("type") == "SETTLED":
-                    data.append(record)
-            except:
-                pass
-    
+    # We only want SETTLED records which have a result
+    data = TradeJournal().query(types="SETTLED")
+
     if not data:
         print("No settled trades found to train on.")
         return None
-        
+
     df = pd.DataFrame(data)
+    # Older augment runs appended their mirrors to the journal itself (again on every run):
+    # a LOSS that "exited" at 1.0 with the dummy pnl is one of those, the partition replaces them
+    if {'result', 'exit_price', 'pnl'} <= set(df.columns):
+        legacy = (df['result'] == 'LOSS') & (df['exit_price'] == 1.0) & (df['pnl'] == -1.0)
+        if legacy.any():
+            print(f"Ignoring {int(legacy.sum())} mirrored records left in the journal by older augment runs")
+            df = df[~legacy]
+    mirrored = TradeJournal(AUGMENTED_DIR).query(types="SETTLED")
+    if mirrored:
+        df = pd.concat([df, pd.DataFrame(mirrored)], ignore_index=True)
     return df
 
 def feature_engineering(df):
     """
-    Convert raw trade data into ML features
-    Target: 1 if WIN, 0 if LOSS
+    Convert raw trade data into ML features (vectorized, same rules as model_export.trade_features)
+    Target: 1 if WIN, 0 if LOSS. Rows are returned in time order.
     """
-    # Create target variable
-    df['target'] = df['result'].apply(lambda x: 1 if x == 'WIN' else 0)
-    
-import pandas_ta as ta
+    df = df[df['entry_price'].notna()].copy() if 'entry_price' in df.columns else df.iloc[0:0].copy()
+    df['datetime'] = pd.to_datetime(df['time'], utc=True, format='ISO8601')
+    df = df.sort_values('datetime', kind='stable')
 
-def feature_engineering(df):
-    """
-    Convert raw trade data into ML features (Updated for V5: Technical Indicators)
-    """
     # Create target variable
-    df['target'] = df['result'].apply(lambda x: 1 if x == 'WIN' else 0)
-    
+    df['target'] = (df['result'] == 'WIN').astype(np.int8)
+
     # 1. Basic Features
-    df['direction_code'] = df['direction'].apply(lambda x: 1 if x == 'UP' else 0)
-    df['datetime'] = pd.to_datetime(df['time'])
+    df['direction_code'] = (df['direction'] == 'UP').astype(np.float32)
     df['hour'] = df['datetime'].dt.hour
     df['dayofweek'] = df['datetime'].dt.dayofweek
-    
-    # 2. Advanced Technical Indicators
-    # We need a continuous price series to calculate RSI/Bollinger accurately.
-    # Since 'df' is a list of trades (discrete), we can't calculate RSI directly on it.
-    # Workaround: We use 'prev_trend' as a proxy for momentum, and add Volatility.
-    
-    if 'prev_trend' not in df.columns: df['prev_trend'] = 0.0
+
+    # 2. Momentum: 'prev_trend' (previous 15m candle move) is the proxy
+    if 'prev_trend' not in df.columns: df['prev_trend'] = np.nan
+    backfill_prev_trend(df)
     df['prev_trend'] = df['prev_trend'].fillna(0.0)
-    
+
     # Feature: Momentum Strength (Abs Trend)
     df['momentum_strength'] = df['prev_trend'].abs()
-    
+
     # Feature: Contrarian Indicator (Is it huge drop/pump?)
-    # If trend is > 1% or < -1%, it might mean "Overbought/Oversold"
-    df['is_overbought'] = df['prev_trend'].apply(lambda x: 1 if x > 0.005 else 0)
-    df['is_oversold'] = df['prev_trend'].apply(lambda x: 1 if x < -0.005 else 0)
-    
-    # Select features for training
-    features = [
-        'entry_price', 'direction_code', 'hour', 'dayofweek', 
-        'prev_trend', 'momentum_strength', 'is_overbought', 'is_oversold'
-    ]
-    
+    df['is_overbought'] = (df['prev_trend'] > TREND_EXTREME).astype(np.float32)
+    df['is_oversold'] = (df['prev_trend'] < -TREND_EXTREME).astype(np.float32)
+
+    # 3. Technical indicators at the market open (neutral where no candles)
+    add_indicator_features(df)
+
+    # Select features for training (schema shared with the bot via model_export.FEATURES)
+    features = list(FEATURES)
+
     X = df[features]
     y = df['target']
-    
-    return X, y, features
+    times = (df['datetime'] - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy()
+
+    return X, y, features, times
+
+def backfill_prev_trend(df, candles=None):
+    """Fill missing prev_trend of btc-updown-15m-<ts> trades from local 1m candles (vectorized)"""
+    missing = df['prev_trend'].isna()
+    if not missing.any() or 'market' not in df.columns: return
+    candles = candles or CandleStore("BTCUSDT", "1m")
+    if not len(candles): return
+    start = pd.to_numeric(df['market'].str.extract(r'^btc-updown-15m-(\d+)$')[0], errors='coerce')
+    row = (start * 1000 - candles.start_ms) // 60000
+    ok = missing & row.notna() & (row >= 15) & (row < len(candles))
+    if not ok.any(): return
+    i = row[ok].to_numpy(dtype=np.int64)
+    opens, closes = np.asarray(candles.cols['open']), np.asarray(candles.cols['close'])
+    # Previous cycle: open of its first minute -> close of its last minute (NaN stays NaN)
+    df.loc[ok, 'prev_trend'] = (closes[i - 1] - opens[i - 15]) / opens[i - 15]
+
+def add_indicator_features(df, candles=None):
+    """Indicator columns for btc-updown-15m-<ts> trades, as of the last candle closed before the open"""
+    for name in INDICATOR_FEATURES: df[name] = np.nan
+    candles = candles or CandleStore("BTCUSDT", "1m")
+    if len(candles) and 'market' in df.columns:
+        start = pd.to_numeric(df['market'].str.extract(r'^btc-updown-15m-(\d+)$')[0], errors='coerce')
+        row = (start * 1000 - candles.start_ms) // 60000 - 1
+        ok = row.notna() & (row >= 0) & (row < len(candles))
+        if ok.any():
+            # One pass of the live engine over the whole history (O(1) per candle)
+            _, values = indicator_series(candles)
+            df.loc[ok, list(INDICATOR_FEATURES)] = values[row[ok].to_numpy(dtype=np.int64)]
+    for name in INDICATOR_FEATURES:
+        df[name] = df[name].fillna(NEUTRAL[name])
+
+def walk_forward_splits(times, n_splits=N_SPLITS, purge_sec=PURGE_SEC, min_fold=MIN_FOLD):
+    """
+    Expanding-window folds over time-sorted samples: fold k trains on blocks
+    0..k and validates on block k+1. Training samples closer than `purge_sec`
+    to the validation start are dropped (their outcome overlaps it).
+    """
+    n = len(times)
+    n_splits = min(n_splits, n // min_fold - 1)
+    if n_splits < 1:
+        return []
+    bounds = np.linspace(0, n, n_splits + 2).astype(int)
+    folds = []
+    for k in range(n_splits):
+        v_start, v_end = bounds[k + 1], bounds[k + 2]
+        cutoff = times[v_start] - purge_sec
+        train_end = int(np.searchsorted(times[:v_start], cutoff, side='left'))
+        if train_end < min_fold: continue
+        folds.append((np.arange(train_end), np.arange(v_start, v_end)))
+    return folds
+
+def _cache_key(journal, n_splits, purge_sec):
+    """
+    Journal is append-only: record count (+ file identity) pins its content.
+    Candles only matter up to the last journal record (prev_trend back-fill).
+    """
+    st = os.stat(journal.data_file) if os.path.exists(journal.data_file) else None
+    last = journal.query(last=1)
+    last_ms = int(parse_time(last[0]['time']) * 1000) if last else 0
+    candles = CandleStore("BTCUSDT", "1m")
+    coverage = [candles.start_ms, min(candles.end_ms, last_ms)] if len(candles) else None
+    augmented = len(TradeJournal(AUGMENTED_DIR))
+    raw = json.dumps([len(journal), st.st_ino if st else 0, augmented, coverage, list(FEATURES), n_splits, purge_sec, MIN_FOLD, TREND_EXTREME])
+    return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+def load_folds(n_splits=N_SPLITS, purge_sec=PURGE_SEC, use_cache=True):
+    """(X, y, folds) from the cache, or built from the journal and cached"""
+    journal = TradeJournal()
+    path = os.path.join(CACHE_DIR, f"folds-{_cache_key(journal, n_splits, purge_sec)}.npz")
+    if use_cache and os.path.exists(path):
+        with np.load(path) as data:
+            n_folds = int(data['n_folds'])
+            folds = [(data[f'train_{k}'], data[f'valid_{k}']) for k in range(n_folds)]
+            print(f"Loaded cached feature matrix ({len(data['y'])} rows, {n_folds} folds)")
+            return data['X'], data['y'], folds
 
-def train_model():
-    print("Loading data...")
     df = load_data()
-    if df is None: return
-    
+    if df is None: return None
     print(f"Found {len(df)} records.")
-    
     print("Engineering features...")
-    X, y, feature_names = feature_engineering(df)
-    
-    # Split
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    print("Training Random Forest (with Grid Search)...")
-    
-    # Simple Grid Search
-    best_score = 0
-    best_clf = None
-    
-    for n_est in [50, 100, 200]:
-        for max_depth in [None, 5, 10, 20]:
-            clf = RandomForestClassifier(n_estimators=n_est, max_depth=max_depth, random_state=42)
-            clf.fit(X_train, y_train)
-            score = clf.score(X_test, y_test)
-            if score > best_score:
-                best_score = score
-                best_clf = clf
-                
-    print(f"Best Params found. Valid Score: {best_score:.2%}")
-    
-    # Evaluate
-    y_pred = best_clf.predict(X_test)
-    print("\nClassification Report:")
-    print(classification_report(y_test, y_pred))
-    
+    X, y, _, times = feature_engineering(df)
+    X = np.ascontiguousarray(X.to_numpy(dtype=np.float32))
+    y = y.to_numpy()
+    folds = walk_forward_splits(times, n_splits, purge_sec)
+
+    if use_cache:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        arrays = {'X': X, 'y': y, 'n_folds': np.int64(len(folds))}
+        for k, (tr, va) in enumerate(folds):
+            arrays[f'train_{k}'], arrays[f'valid_{k}'] = tr, va
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+        for name in os.listdir(CACHE_DIR): # Older journal states are never read again
+            if name.startswith("folds-") and name != os.path.basename(path):
+                os.remove(os.path.join(CACHE_DIR, name))
+    return X, y, folds
+
+def _fit_score(params, X, y, train_idx, valid_idx):
+    clf = RandomForestClassifier(random_state=42, n_jobs=1, **params)
+    clf.fit(X[train_idx], y[train_idx])
+    return clf.score(X[valid_idx], y[valid_idx])
+
+def search(X, y, folds, grid=PARAM_GRID, n_jobs=-1):
+    """Mean walk-forward score per parameter set; every (params, fold) fit runs in parallel"""
+    tasks = [(i, k) for i in range(len(grid)) for k in range(len(folds))]
+    scores = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_score)(grid[i], X, y, *folds[k]) for i, k in tasks
+    )
+    per_param = np.zeros((len(grid), len(folds)))
+    for (i, k), score in zip(tasks, scores):
+        per_param[i, k] = score
+    return per_param.mean(axis=1), per_param
+
+def train_model(model_file=MODEL_FILE, export_file=EXPORT_FILE):
+    """Train, save the pkl + flattened export. Returns the export manifest (None without data)."""
+    print("Loading data...")
+    loaded = load_folds()
+    if loaded is None: return None
+    X, y, folds = loaded
+    feature_names = list(FEATURES)
+    if not folds or len(np.unique(y)) < 2:
+        print(f"Not enough time-ordered data for walk-forward validation ({len(y)} rows).")
+        return None
+
+    print(f"Searching {len(PARAM_GRID)} Random Forest configs x {len(folds)} walk-forward folds (parallel)...")
+    start = time.time()
+    mean_scores, per_fold = search(X, y, folds)
+    best = int(np.argmax(mean_scores))
+    best_params, best_score = PARAM_GRID[best], float(mean_scores[best])
+    print(f"Best Params: {best_params}. Walk-forward Score: {best_score:.2%} "
+          f"(folds: {', '.join(f'{s:.0%}' for s in per_fold[best])}) [{time.time() - start:.1f}s]")
+
+    # Evaluate on the most recent fold (trained only on its past)
+    train_idx, valid_idx = folds[-1]
+    clf = RandomForestClassifier(random_state=42, n_jobs=-1, **best_params).fit(X[train_idx], y[train_idx])
+    print("\nClassification Report (latest fold):")
+    print(classification_report(y[valid_idx], clf.predict(X[valid_idx]), zero_division=0))
+
+    # Final model on all data (feature names kept so the export can check the schema)
+    X_df = pd.DataFrame(X, columns=feature_names)
+    best_clf = RandomForestClassifier(random_state=42, n_jobs=-1, **best_params).fit(X_df, y)
+    best_clf.set_params(n_jobs=1) # Single-row inference must not spin up a thread pool
+
     # Feature Importance
     importances = best_clf.feature_importances_
     indices = np.argsort(importances)[::-1]
     print("\n📊 Feature Importance:")
-    for f in range(X_train.shape[1]):
+    for f in range(X.shape[1]):
         print(f"{f+1}. {feature_names[indices[f]]}: {importances[indices[f]]:.4f}")
-    
+
     # Save
-    print(f"Saving model to {MODEL_FILE}...")
-    joblib.dump(best_clf, MODEL_FILE)
+    print(f"Saving model to {model_file}...")
+    joblib.dump(best_clf, model_file)
+    manifest = export_forest(best_clf, feature_names, export_file,
+                             extra={"source": os.path.basename(model_file), "valid_score": best_score,
+                                    "samples": int(len(y)), "params": best_params, "cv": "walk-forward",
+                                    "folds": len(folds), "purge_sec": PURGE_SEC})
+    print(f"Exported {manifest['n_trees']} trees / {manifest['n_nodes']} nodes to {export_file}")
     print("✅ Done.")
+    return manifest
 
 if __name__ == "__main__":
     train_model()
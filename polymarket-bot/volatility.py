@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Online Realized Volatility
+- Built from the live Binance trade stream: every tick only updates the current
+  1m candle (O(1)); each closed candle updates the estimators in O(1).
+- Estimators (per-minute variance of log returns):
+  EWMA of squared 1m returns, bipower variation (jump-robust) and Parkinson
+  (1m high/low range), the last two over a rolling window kept in preallocated
+  ring buffers with running sums.
+- Intraday seasonality: a slow average of squared returns per 15m slot of the
+  UTC day. Returns are de-seasonalized before entering the estimators and the
+  current slot's multiplier is applied on the way out.
+- The current sigma per estimator is cached on every candle close, so readers
+  (ProbabilityStrategy.calculate_prob_up) pay a dict lookup. No REST, no pandas.
+- State is checkpointed once per slot so a restart keeps the seasonality
+  profile (and the rolling windows if the gap was short); otherwise the windows
+  are warmed from the local candle store. The file is written off the event loop.
+"""
+
+import os
+import json
+import math
+import time
+import asyncio
+import logging
+from array import array
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "polymarket-bot/vol_state_{symbol}.json"
+ESTIMATORS = ("ewma", "bipower", "parkinson")
+SLOTS = 96                     # 15m slots per UTC day
+PARKINSON_K = 1.0 / (4.0 * math.log(2.0))
+BIPOWER_K = math.pi / 2.0
+SEASON_ALPHA = 0.01            # Per observation (~15 per slot per day, half-life ~4.6 days)
+SEASON_MIN_OBS = 30            # Observations per slot before its multiplier is trusted
+SEASON_CLAMP = (0.5, 2.5)      # Multiplier bounds
+MAX_RESUME_GAP_SEC = 300       # Rolling windows survive restarts shorter than this
+
+
+class RingBuffer:
+    """Fixed-size float ring with a running sum"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.values = array('d', [0.0]) * size
+        self.pos = 0
+        self.count = 0
+        self.total = 0.0
+
+    def push(self, x: float):
+        if self.count == self.size:
+            self.total -= self.values[self.pos]
+        else:
+            self.count += 1
+        self.values[self.pos] = x
+        self.total += x
+        self.pos = (self.pos + 1) % self.size
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def recompute(self):
+        """Reset float drift of the running sum"""
+        self.total = math.fsum(self.values[i] for i in range(self.size)) if self.count == self.size \
+            else math.fsum(self.values[(self.pos - 1 - i) % self.size] for i in range(self.count))
+
+    def ordered(self) -> list:
+        """Oldest first"""
+        return [self.values[(self.pos - self.count + i) % self.size] for i in range(self.count)]
+
+
+class VolatilityEngine:
+    """Realized volatility of one symbol, fed by BinancePriceFeed trade ticks"""
+
+    def __init__(self, symbol: str = "BTCUSDT", window_min: int = 60, ewma_lambda: float = 0.94,
+                 min_samples: int = 15, seasonality: bool = True, state_file: Optional[str] = None):
+        self.symbol = symbol.upper()
+        self.window_min = window_min
+        self.ewma_lambda = ewma_lambda
+        self.min_samples = min_samples
+        self.seasonality = seasonality
+        self.state_file = state_file or STATE_FILE.format(symbol=self.symbol)
+
+        # Current 1m candle: minute index, open, high, low, close
+        self.minute = None
+        self.open = self.high = self.low = self.close = 0.0
+        self.prev_close = None
+        self.prev_abs_ret = None
+
+        # Estimators (per-minute variance of de-seasonalized log returns)
+        self.ewma_var = 0.0
+        self.samples = 0
+        self.bipower = RingBuffer(window_min)
+        self.parkinson = RingBuffer(window_min)
+
+        # Seasonality: EWMA of squared returns per slot, their running sum, observation counts
+        self.slot_var = array('d', [0.0]) * SLOTS
+        self.slot_obs = array('l', [0]) * SLOTS
+        self.slot_sum = 0.0
+
+        # Cached outputs: estimator -> sigma of log returns per sqrt(minute)
+        self.sigma: Dict[str, Optional[float]] = {name: None for name in ESTIMATORS}
+        self.season = 1.0
+        self.updated_at = 0.0
+        self._candles = 0
+        self._saved_slot = None
+        self._saving: Optional[asyncio.Future] = None
+
+        self.load()
+
+    # --- Inputs ---
+
+    def attach(self, feed):
+        """Subscribe to a BinancePriceFeed's trade ticks"""
+        feed.listeners.append(lambda: self.on_trade(feed.snapshot[0], feed.snapshot[2] / 1000.0))
+
+    def warm_from(self, candles, minutes: Optional[int] = None) -> int:
+        """
+        Replay the last stored 1m candles (candle_store.CandleStore) into a cold
+        engine, before live ticks arrive. Returns the number of candles replayed.
+        """
+        if self.samples >= self.min_samples or self.minute is not None or not len(candles):
+            return 0
+        minutes = minutes or 2 * self.window_min
+        data = candles.range(candles.end_ms - minutes * 60_000, candles.end_ms)
+        replayed = 0
+        for t, o, h, l, c in zip(data["time"], data["open"], data["high"], data["low"], data["close"]):
+            if o != o: continue # Missing candle (NaN): becomes a flat minute
+            ts = t / 1000.0
+            for price, offset in ((o, 0), (h, 1), (l, 2), (c, 59)):
+                self.on_trade(float(price), ts + offset)
+            replayed += 1
+        return replayed
+
+    def on_trade(self, price: float, ts: float):
+        """One trade tick (exchange time, seconds). O(1)."""
+        if price is None or price <= 0: return
+        minute = int(ts // 60)
+        if minute == self.minute:
+            if price > self.high: self.high = price
+            elif price < self.low: self.low = price
+            self.close = price
+            return
+        if self.minute is not None and minute > self.minute:
+            self._close_candle()
+            # Minutes without trades are flat candles (bounded by the window)
+            for m in range(self.minute + 1, min(minute, self.minute + 1 + self.window_min)):
+                self.minute = m
+                self.open = self.high = self.low = self.close
+                self._close_candle()
+        elif self.minute is not None:
+            return # Out-of-order tick from an older minute
+        self.minute = minute
+        self.open = self.high = self.low = self.close = price
+
+    def _close_candle(self):
+        slot = (self.minute % 1440) // 15
+        factor = self.slot_factor(slot)
+
+        if self.prev_close:
+            r = math.log(self.close / self.prev_close)
+            self._update_season(slot, r * r)
+            r /= factor
+            self.ewma_var = r * r if self.samples == 0 else \
+                self.ewma_lambda * self.ewma_var + (1.0 - self.ewma_lambda) * r * r
+            self.samples += 1
+            abs_r = abs(r)
+            if self.prev_abs_ret is not None:
+                self.bipower.push(BIPOWER_K * abs_r * self.prev_abs_ret)
+            self.prev_abs_ret = abs_r
+        if self.low > 0:
+            hl = math.log(self.high / self.low) / factor
+            self.parkinson.push(PARKINSON_K * hl * hl)
+        self.prev_close = self.close
+
+        self._candles += 1
+        if self._candles % 10000 == 0:
+            self.bipower.recompute()
+            self.parkinson.recompute()
+        self._refresh((self.minute + 1) * 60)
+        if slot != self._saved_slot:
+            self._saved_slot = slot
+            self.checkpoint()
+
+    def _update_season(self, slot: int, r2: float):
+        # Plain mean for the first 1/alpha observations, then EWMA
+        old = self.slot_var[slot]
+        self.slot_obs[slot] += 1
+        new = old + max(SEASON_ALPHA, 1.0 / self.slot_obs[slot]) * (r2 - old)
+        self.slot_var[slot] = new
+        self.slot_sum += new - old
+
+    # --- Outputs ---
+
+    def slot_factor(self, slot: int) -> float:
+        """Volatility multiplier of a 15m slot relative to the daily average (1.0 until learned)"""
+        if not self.seasonality or self.slot_obs[slot] < SEASON_MIN_OBS or self.slot_sum <= 0:
+            return 1.0
+        ratio = math.sqrt(self.slot_var[slot] * SLOTS / self.slot_sum)
+        return min(max(ratio, SEASON_CLAMP[0]), SEASON_CLAMP[1])
+
+    def _refresh(self, ts: float):
+        self.season = self.slot_factor(int(ts // 900) % SLOTS)
+        ready = self.samples >= self.min_samples
+        self.sigma["ewma"] = math.sqrt(self.ewma_var) * self.season if ready else None
+        self.sigma["bipower"] = math.sqrt(max(self.bipower.mean(), 0.0)) * self.season \
+            if self.bipower.count >= self.min_samples else None
+        self.sigma["parkinson"] = math.sqrt(max(self.parkinson.mean(), 0.0)) * self.season \
+            if self.parkinson.count >= self.min_samples else None
+        self.updated_at = time.time()
+
+    def sigma_usd(self, price: float, estimator: str = "ewma") -> Optional[float]:
+        """Current 1-minute standard deviation in price units, None while warming up"""
+        sigma = self.sigma.get(estimator)
+        return sigma * price if sigma else None
+
+    def summary(self) -> str:
+        parts = [f"{k} {v * 1e4:.2f}bp" if v else f"{k} -" for k, v in self.sigma.items()]
+        return f"{self.symbol} σ/min: {' | '.join(parts)} | 季节因子 {self.season:.2f}x"
+
+    # --- Checkpoint ---
+
+    def checkpoint(self):
+        """Save from a feed callback: the state is captured now, the file is written in a thread"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError: # No event loop (warm-up, scripts): write in-line
+            self.save()
+            return
+        if self._saving and not self._saving.done(): return # Disk still busy with the last one: next slot saves
+        self._saving = asyncio.ensure_future(asyncio.to_thread(self._write, self.state()))
+
+    def save(self):
+        self._write(self.state())
+
+    def state(self) -> dict:
+        return {
+            "symbol": self.symbol,
+            "window_min": self.window_min,
+            "minute": self.minute,
+            "close": self.close,
+            "prev_close": self.prev_close,
+            "prev_abs_ret": self.prev_abs_ret,
+            "ewma_var": self.ewma_var,
+            "samples": self.samples,
+            "bipower": self.bipower.ordered(),
+            "parkinson": self.parkinson.ordered(),
+            "slot_var": list(self.slot_var),
+            "slot_obs": list(self.slot_obs),
+        }
+
+    def _write(self, state: dict):
+        try:
+            tmp = self.state_file + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp, self.state_file)
+        except Exception as e:
+            logger.debug(f"Vol state save failed: {e}")
+
+    def load(self):
+        """Seasonality always; rolling windows only after a short gap"""
+        if not os.path.exists(self.state_file): return
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+            if len(state["slot_var"]) == SLOTS:
+                self.slot_var = array('d', state["slot_var"])
+                self.slot_obs = array('l', state["slot_obs"])
+                self.slot_sum = math.fsum(self.slot_var)
+            minute = state.get("minute")
+            if minute is None or state.get("window_min") != self.window_min \
+                    or time.time() - (minute + 1) * 60 > MAX_RESUME_GAP_SEC:
+                return
+            self.minute = minute
+            self.open = self.high = self.low = self.close = state["close"]
+            self.prev_close = state["prev_close"]
+            self.prev_abs_ret = state["prev_abs_ret"]
+            self.ewma_var = state["ewma_var"]
+            self.samples = state["samples"]
+            for x in state["bipower"]: self.bipower.push(x)
+            for x in state["parkinson"]: self.parkinson.push(x)
+            self._refresh(time.time())
+            logger.info(f"📈 波动率状态已恢复: {self.summary()}")
+        except Exception as e:
+            logger.warning(f"Vol state load failed ({e}), starting cold")